@@ -1,47 +1,116 @@
+import os
 import re
-import time
-import requests
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import pandas as pd
+from dotenv import load_dotenv
 from bs4 import BeautifulSoup
-from langchain_core.documents import Document
-from langchain_experimental.text_splitter import SemanticChunker
-from langchain_mistralai import MistralAIEmbeddings
-from tqdm import tqdm
 from langchain.schema import Document
+from harvester import OpenAgendaHarvester
+from embedding_cache import creer_embeddings
+from chunking import decouper_documents_par_lots
 
 # Charger la clé API à partir du fichier .env
 load_dotenv()
 api_key = os.getenv('MISTRAL_AI_KEY')
-embeddings = MistralAIEmbeddings(model="mistral-embed", api_key=api_key)
+
+# Un texte sans balise ni entité est rendu tel quel par BeautifulSoup
+HTML_POSSIBLE = re.compile(r"[<&]")
+CARACTERES_RETIRES = re.compile(r'[^\w\s.,!?;:\'\"À-ÿ]')
+# Au-delà, l'extraction du texte des descriptions HTML est répartie entre processus
+SEUIL_POOL_HTML = 2000
+
+
+@lru_cache(maxsize=None)
+def obtenir_embeddings():
+    """Client d'embeddings créé à la première découpe, pas à l'import."""
+    return creer_embeddings(api_key)
+
+
+def __getattr__(nom):
+    if nom == "embeddings":
+        return obtenir_embeddings()
+    raise AttributeError(f"module {__name__!r} has no attribute {nom!r}")
+
+
+def extraire_texte(texte: str) -> str:
+    return BeautifulSoup(texte, "html.parser").get_text()
+
+
+def normaliser(texte: str) -> str:
+    return ' '.join(CARACTERES_RETIRES.sub(' ', texte.lower()).split())
+
 
 def nettoyer_texte(texte):
     if not texte or not isinstance(texte, str):
         return ""
-    texte = BeautifulSoup(texte, "html.parser").get_text()
-    texte = texte.lower()
-    texte = re.sub(r'[^\w\s.,!?;:\'\"À-ÿ]', ' ', texte)
-    return ' '.join(texte.split())
-
-def obtenir_evenements_structures():
-    start_year = 2025
-    location = "Occitanie"
-    results = []
-    event_types = ["cinema", "festival", "concert", "danse", "spectacle", "théâtre", "jazz", "exposition",
-                   "animation", "rock", "humour", "jeu", "ateliers", "peinture", "cirque", "chanson", "lecture",
-                   "livre", "photographie", "film", "conte", "dessin", "chant", "art", "musique", "poésie"]
-
-    for event_type in event_types:
-        url = f"https://public.opendatasoft.com/api/explore/v2.1/catalog/datasets/evenements-publics-openagenda/records?limit=1&refine=keywords_fr%3A%22{event_type}%22&refine=firstdate_begin%3A%22{start_year}%22&refine=location_region%3A%22{location}%22"
-        response = requests.get(url)
-        total_count = response.json().get("total_count", 0)
-
-        for offset_index in range(int(total_count / 100) + 1):
-            offset_url = f"https://public.opendatasoft.com/api/explore/v2.1/catalog/datasets/evenements-publics-openagenda/records?limit=100&offset={offset_index * 100}&refine=keywords_fr%3A%22{event_type}%22&refine=firstdate_begin%3A%22{start_year}%22&refine=location_region%3A%22{location}%22"
-            offset_response = requests.get(offset_url)
-            results += offset_response.json().get("results", [])
-            time.sleep(0.5)
-
-    df = pd.DataFrame.from_dict(results)
+    if HTML_POSSIBLE.search(texte):
+        texte = extraire_texte(texte)
+    return normaliser(texte)
+
+
+def nettoyer_colonne(valeurs, workers: int = 1) -> pd.Series:
+    """
+    `nettoyer_texte` appliqué à toute une colonne : seuls les textes contenant
+    `<` ou `&` passent par BeautifulSoup (dans `workers` processus s'ils sont
+    nombreux), les autres sont normalisés directement.
+    """
+    serie = pd.Series(valeurs, dtype=object)
+    textes = [v if isinstance(v, str) else "" for v in serie.tolist()]
+    html = [i for i, texte in enumerate(textes) if HTML_POSSIBLE.search(texte)]
+    if workers > 1 and len(html) >= SEUIL_POOL_HTML:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            extraits = list(pool.map(extraire_texte, [textes[i] for i in html], chunksize=256))
+    else:
+        extraits = [extraire_texte(textes[i]) for i in html]
+    for i, texte in zip(html, extraits):
+        textes[i] = texte
+    return pd.Series([normaliser(texte) for texte in textes], index=serie.index, dtype=object)
+
+EVENT_TYPES = ["cinema", "festival", "concert", "danse", "spectacle", "théâtre", "jazz", "exposition",
+               "animation", "rock", "humour", "jeu", "ateliers", "peinture", "cirque", "chanson", "lecture",
+               "livre", "photographie", "film", "conte", "dessin", "chant", "art", "musique", "poésie"]
+
+def creer_harvester(checkpoint_path=None, workers=8, rate=5.0, mesurer_memoire=False):
+    """
+    Collecteur des événements d'Occitanie : un seul export JSONL, ou des pages si
+    `checkpoint_path` (JSONL) est donné pour pouvoir reprendre une collecte interrompue.
+    """
+    return OpenAgendaHarvester(
+        location="Occitanie",
+        start_year=2025,
+        workers=workers,
+        rate=rate,
+        checkpoint_path=checkpoint_path,
+        export=checkpoint_path is None,
+        mesurer_memoire=mesurer_memoire,
+    )
+
+
+def obtenir_evenements_structures(checkpoint_path=None, workers=8, rate=5.0, workers_html=1):
+    """
+    Récupère les événements d'Occitanie pour l'ensemble des types d'événements,
+    en un seul export JSONL, ou par pages si `checkpoint_path` (JSONL) est
+    donné pour pouvoir reprendre une collecte interrompue.
+    `workers_html` processus extraient le texte des descriptions HTML.
+    """
+    harvester = creer_harvester(checkpoint_path, workers, rate, mesurer_memoire=True)
+    results = harvester.harvest(EVENT_TYPES)
+    stats = harvester.statistiques()
+    print(
+        f" {stats['evenements']} événements ({stats['doublons']} doublons écartés) en {stats['requetes']} requêtes, "
+        f"{stats['octets'] / 2 ** 20:.1f} Mo téléchargés, pic mémoire {stats['pic_memoire'] / 2 ** 20:.1f} Mo"
+    )
+    return structurer_evenements(results, workers_html)
+
+
+def structurer_evenements(results, workers_html=1):
+    """
+    Colonnes attendues, filtrage, coordonnées, dates et textes nettoyés.
+    `results` : colonnes ({champ: [valeurs]}) ou liste d'enregistrements, par
+    exemple une seule page pour un traitement en flux (pipeline.py).
+    """
+    df = pd.DataFrame(results)
 
     # Colonnes attendues, ajout avec valeurs par défaut si manquantes
     expected_cols = {
@@ -54,6 +123,7 @@ def obtenir_evenements_structures():
         "location_postalcode": "",
         "daterange_fr": "",
         "keywords_fr": "",
+        "location_coordinates": None,
         "firstdate_begin": pd.NaT,
         "lastdate_end": pd.NaT
     }
@@ -65,6 +135,10 @@ def obtenir_evenements_structures():
     df.drop_duplicates(subset="uid", inplace=True)
     df.dropna(subset=["uid", "title_fr", "description_fr"], inplace=True)
 
+    # Coordonnées GPS ({"lon": ..., "lat": ...}) pour la recherche par rayon
+    df["latitude"] = df["location_coordinates"].map(lambda c: c.get("lat") if isinstance(c, dict) else None)
+    df["longitude"] = df["location_coordinates"].map(lambda c: c.get("lon") if isinstance(c, dict) else None)
+
     # Conversion dates
     df["firstdate_begin"] = pd.to_datetime(df["firstdate_begin"], errors="coerce")
     df["lastdate_end"] = pd.to_datetime(df["lastdate_end"], errors="coerce")
@@ -73,64 +147,88 @@ def obtenir_evenements_structures():
     date_limit = pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=365)
     df = df[df["firstdate_begin"] > date_limit]
 
+    # Mots-clés OpenAgenda (`keywords_fr`) sous la clé `keywords` des documents
+    df["keywords"] = df["keywords_fr"].map(liste_mots_cles)
+
     # Nettoyage texte
-    df["description_fr"] = df["description_fr"].apply(nettoyer_texte)
-    df["title_fr"] = df["title_fr"].apply(nettoyer_texte)
+    df["description_fr"] = nettoyer_colonne(df["description_fr"], workers_html)
+    df["title_fr"] = nettoyer_colonne(df["title_fr"], workers_html)
 
     # Transformation dates en string pour l'index
     df["firstdate_begin"] = df["firstdate_begin"].astype(str)
     df["lastdate_end"] = df["lastdate_end"].astype(str)
 
-    # Construction du contenu complet
-    df["content"] = (
-        df["description_fr"] + " lieu: " + df["location_name"] +
-        " adresse: " + df["location_address"] + " " + df["location_city"] + " " +
-        df["location_postalcode"] + " dates: " + df["daterange_fr"] +
-        " date de début: " + df["firstdate_begin"] + " date de fin: " + df["lastdate_end"] +
-        " mots clés: " + df["keywords_fr"].astype(str)
-    )
-
     return df
 
 
 
+# Métadonnées de chaque document : (clé, colonne du DataFrame, valeur si la colonne manque)
+CHAMPS_METADONNEES = [
+    ("id", "uid", ""),
+    ("title", "title_fr", ""),
+    ("description", "description_fr", ""),
+    ("firstdate_begin", "firstdate_begin", ""),
+    ("lastdate_end", "lastdate_end", ""),
+    ("date_fin", "date_fin", ""),
+    ("location_name", "location_name", ""),
+    ("location_address", "location_address", ""),
+    ("location_district", "location_district", ""),
+    ("location_postalcode", "location_postalcode", ""),
+    ("location_city", "location_city", ""),
+    ("location_description", "location_description_fr", ""),
+    ("latitude", "latitude", None),
+    ("longitude", "longitude", None),
+]
+
+
+def colonne(df, nom, defaut=""):
+    return df[nom] if nom in df.columns else pd.Series([defaut] * len(df), index=df.index, dtype=object)
+
+
+def texte_colonne(df, nom):
+    """Colonne convertie en texte comme dans une f-string (`None`, `nan`, `NaT` compris)."""
+    return colonne(df, nom).map(str)
+
+
+def liste_mots_cles(valeur) -> list:
+    """Liste de mots-clés (`keywords_fr` : liste, texte « a, b » ou valeur manquante)."""
+    if isinstance(valeur, str):
+        return [mot.strip() for mot in valeur.split(",") if mot.strip()]
+    if isinstance(valeur, (list, tuple)) or hasattr(valeur, "tolist"):
+        return [str(mot) for mot in list(valeur) if mot]
+    return []
+
+
+def texte_mots_cles(valeur):
+    return ', '.join(valeur) if isinstance(valeur, list) else str(valeur)
+
+
 def generer_documents(df):
-    documents = []
-    for _, row in df.iterrows():
-        content = (
-            f"Titre: {row.get('title_fr', '')}\n"
-            f"Description: {row.get('description_fr', '')}\n"
-            f"Lieu: {row.get('location_name', '')} - {row.get('location_address', '')}, "
-            f"{row.get('location_postalcode', '')} {row.get('location_city', '')}\n"
-            f"Dates: {row.get('firstdate_begin', '')} - {row.get('lastdate_end', '')}\n"
-            f"Mots-clés: {', '.join(row.get('keywords', [])) if isinstance(row.get('keywords'), list) else row.get('keywords', '')}"
-        )
-        
-        metadata = {
-            "source": "opendatasoft",
-            "id": row.get("uid", ""),
-            "title": row.get("title_fr", ""),
-            "description": row.get("description_fr", ""),
-            "firstdate_begin": row.get("firstdate_begin", ""),
-            "lastdate_end": row.get("lastdate_end", ""),
-            "date_fin": row.get("date_fin", ""),
-            "location_name": row.get("location_name", ""),
-            "location_address": row.get("location_address", ""),
-            "location_district": row.get("location_district", ""),
-            "location_postalcode": row.get("location_postalcode", ""),
-            "location_city": row.get("location_city", ""),
-            "location_description": row.get("location_description_fr", ""),
-            "keywords": row.get("keywords", []),
-        }
-        
-        documents.append(Document(page_content=content, metadata=metadata))
-    return documents
-
-    
-
-def decouper_documents(documents):
-    text_splitter = SemanticChunker(embeddings)
-    splitted_docs = []
-    for doc in tqdm(documents, desc="Découpe des documents", unit="document"):
-        splitted_docs.extend(text_splitter.create_documents([doc.page_content]))
-    return splitted_docs
+    """Un Document par événement ; le texte est assemblé colonne par colonne."""
+    if len(df) == 0:
+        return []
+    contenus = (
+        "Titre: " + texte_colonne(df, "title_fr") +
+        "\nDescription: " + texte_colonne(df, "description_fr") +
+        "\nLieu: " + texte_colonne(df, "location_name") + " - " + texte_colonne(df, "location_address") + ", " +
+        texte_colonne(df, "location_postalcode") + " " + texte_colonne(df, "location_city") +
+        "\nDates: " + texte_colonne(df, "firstdate_begin") + " - " + texte_colonne(df, "lastdate_end") +
+        "\nMots-clés: " + colonne(df, "keywords").map(texte_mots_cles)
+    )
+
+    cles = ["source"] + [cle for cle, _, _ in CHAMPS_METADONNEES] + ["keywords"]
+    valeurs = [["opendatasoft"] * len(df)]
+    valeurs += [colonne(df, nom, defaut).tolist() for _, nom, defaut in CHAMPS_METADONNEES]
+    valeurs.append(df["keywords"].tolist() if "keywords" in df.columns else [[] for _ in range(len(df))])
+    return [
+        Document(page_content=contenu, metadata=dict(zip(cles, ligne)))
+        for contenu, ligne in zip(contenus.tolist(), zip(*valeurs))
+    ]
+
+
+def decouper_documents(documents, workers=4):
+    """
+    Découpe sémantique par lots (voir chunking.py) : chaque morceau garde
+    les métadonnées de son événement et son `chunk_index`.
+    """
+    return decouper_documents_par_lots(documents, obtenir_embeddings(), workers=workers)
@@ -0,0 +1,226 @@
+"""
+Cache sémantique des réponses.
+
+Une question dont l'embedding est assez proche (cosinus >= `seuil`) d'une
+question déjà traitée, pour la même ville, le même jour, les mêmes filtres de
+recherche (villes et codes postaux cités, période) et la même version de
+l'index FAISS, reçoit directement la réponse enregistrée : ni reformulation,
+ni recherche, ni appel à Mistral.
+
+Deux stockages : `MemoireBackend` (un processus) et `SQLiteBackend`
+(fichier partagé entre les processus Streamlit).
+"""
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+SEUIL_SIMILARITE = 0.95
+TTL_REPONSE = 6 * 3600
+MAX_REPONSES = 5000
+
+
+def version_index(chemin_index: str) -> str:
+    """Change à chaque reconstruction de l'index (date de modification et taille de index.faiss)."""
+    fichier = Path(chemin_index) / "index.faiss"
+    if not fichier.exists():
+        return "absent"
+    stat = fichier.stat()
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def _normaliser(vecteur) -> np.ndarray:
+    v = np.asarray(vecteur, dtype=np.float32)
+    norme = np.linalg.norm(v)
+    return v / norme if norme else v
+
+
+def _jour(instant) -> str:
+    return instant.astimezone().date().isoformat() if instant is not None else ""
+
+
+def signature_filtres(filtres: dict) -> str:
+    """
+    Villes, codes postaux, période (au jour près) et rayon de recherche : deux
+    questions qui ne ciblent pas les mêmes événements ne partagent pas de réponse.
+    """
+    villes = ",".join(sorted({v.strip().lower() for v in filtres.get("villes") or ()}))
+    codes = ",".join(sorted(filtres.get("codes_postaux") or ()))
+    centre = filtres.get("centre")
+    zone = f"{centre[0]:.2f},{centre[1]:.2f},{filtres.get('rayon_km')}" if centre else ""
+    return f"{villes}|{codes}|{_jour(filtres.get('apres'))}|{_jour(filtres.get('avant'))}|{zone}"
+
+
+class MemoireBackend:
+    """Entrées en mémoire, dans l'ordre d'utilisation (LRU)."""
+
+    def __init__(self):
+        self._entrees = OrderedDict()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def candidats(self, partition: str) -> list:
+        with self._lock:
+            return [(i, e["vecteur"], e["reponse"], e["duree"], e["cree"])
+                    for i, e in self._entrees.items() if e["partition"] == partition]
+
+    def ajouter(self, partition: str, vecteur: np.ndarray, reponse: str, duree: float):
+        with self._lock:
+            self._entrees[next(self._ids)] = {
+                "partition": partition, "vecteur": vecteur, "reponse": reponse,
+                "duree": duree, "cree": time.time(),
+            }
+
+    def toucher(self, entree_id):
+        with self._lock:
+            if entree_id in self._entrees:
+                self._entrees.move_to_end(entree_id)
+
+    def purger(self, ttl: float, max_entrees: int, prefixe_valide: str = ""):
+        limite = time.time() - ttl
+        with self._lock:
+            for i in [i for i, e in self._entrees.items()
+                      if e["cree"] < limite or not e["partition"].startswith(prefixe_valide)]:
+                del self._entrees[i]
+            while len(self._entrees) > max_entrees:
+                self._entrees.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entrees)
+
+
+class SQLiteBackend:
+    """Entrées dans un fichier SQLite (mode WAL), partagé entre processus."""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS reponses ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, partition TEXT NOT NULL, vecteur BLOB NOT NULL,"
+            " reponse TEXT NOT NULL, duree REAL NOT NULL, cree REAL NOT NULL, dernier_acces REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_partition ON reponses(partition)")
+        self._conn.commit()
+
+    def candidats(self, partition: str) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, vecteur, reponse, duree, cree FROM reponses WHERE partition = ?", (partition,)
+            ).fetchall()
+        return [(i, np.frombuffer(v, dtype=np.float32), r, d, c) for i, v, r, d, c in rows]
+
+    def ajouter(self, partition: str, vecteur: np.ndarray, reponse: str, duree: float):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO reponses (partition, vecteur, reponse, duree, cree, dernier_acces)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (partition, vecteur.astype(np.float32).tobytes(), reponse, duree, now, now)
+            )
+            self._conn.commit()
+
+    def toucher(self, entree_id):
+        with self._lock:
+            self._conn.execute("UPDATE reponses SET dernier_acces = ? WHERE id = ?", (time.time(), entree_id))
+            self._conn.commit()
+
+    def purger(self, ttl: float, max_entrees: int, prefixe_valide: str = ""):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM reponses WHERE cree < ? OR substr(partition, 1, ?) != ?",
+                (time.time() - ttl, len(prefixe_valide), prefixe_valide)
+            )
+            total = self._conn.execute("SELECT COUNT(*) FROM reponses").fetchone()[0]
+            if total > max_entrees:
+                self._conn.execute(
+                    "DELETE FROM reponses WHERE id IN ("
+                    " SELECT id FROM reponses ORDER BY dernier_acces ASC LIMIT ?)",
+                    (total - max_entrees,)
+                )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM reponses").fetchone()[0]
+
+
+class CacheReponses:
+    """
+    Cache sémantique. La partition (version d'index, ville, jour, filtres) isole les
+    réponses qui ne sont pas interchangeables ; à l'intérieur d'une partition,
+    la recherche est un produit scalaire NumPy sur les vecteurs normalisés.
+    """
+
+    def __init__(self, backend=None, version: str = "", seuil: float = SEUIL_SIMILARITE,
+                 ttl: float = TTL_REPONSE, max_entrees: int = MAX_REPONSES):
+        self.backend = backend if backend is not None else MemoireBackend()
+        self.seuil = seuil
+        self.ttl = ttl
+        self.max_entrees = max_entrees
+        self.hits = 0
+        self.misses = 0
+        self.secondes_economisees = 0.0
+        self._lock = threading.Lock()
+        self.invalider(version)
+
+    def invalider(self, version: str):
+        """Nouvelle version de l'index : les réponses des versions précédentes sont supprimées."""
+        self.version = version
+        self.backend.purger(self.ttl, self.max_entrees, prefixe_valide=f"{version}|")
+
+    def partition(self, ville: str = "", jour: str = "", filtres: dict = None) -> str:
+        """`filtres` : ceux de la recherche (voir `IndexMetadonnees.filtres_question`)."""
+        partition = f"{self.version}|{(ville or '').strip().lower()}|{jour}"
+        return f"{partition}|{signature_filtres(filtres)}" if filtres else partition
+
+    def chercher(self, vecteur, partition: str):
+        """Réponse enregistrée pour une question similaire, ou None."""
+        debut = time.perf_counter()
+        candidats = [c for c in self.backend.candidats(partition) if time.time() - c[4] <= self.ttl]
+        meilleur = None
+        if candidats:
+            matrice = np.stack([c[1] for c in candidats])
+            similarites = matrice @ _normaliser(vecteur)
+            i = int(np.argmax(similarites))
+            if similarites[i] >= self.seuil:
+                meilleur = candidats[i]
+
+        with self._lock:
+            if meilleur is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.secondes_economisees += max(0.0, meilleur[3] - (time.perf_counter() - debut))
+        self.backend.toucher(meilleur[0])
+        return meilleur[2]
+
+    def enregistrer(self, vecteur, partition: str, reponse: str, duree: float):
+        """`duree` : temps qu'a pris la réponse, compté comme économisé à chaque hit."""
+        self.backend.ajouter(partition, _normaliser(vecteur), reponse, duree)
+        if len(self.backend) > self.max_entrees:
+            self.backend.purger(self.ttl, self.max_entrees, prefixe_valide=f"{self.version}|")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "secondes_economisees": self.secondes_economisees,
+        }
+
+
+def creer_cache_reponses(version: str) -> CacheReponses:
+    """SQLite partagé si `ANSWER_CACHE_PATH` est défini, sinon cache en mémoire du processus."""
+    path = os.getenv("ANSWER_CACHE_PATH")
+    backend = SQLiteBackend(path) if path else MemoireBackend()
+    return CacheReponses(backend, version=version)
@@ -1,18 +1,40 @@
+import uuid
 import streamlit as st
 from datetime import datetime, date
-from chatbot_core import get_bot_response
-from geo import get_user_location
+from chatbot_core import prechauffer, stream_bot_response
+from geo import DEFAUT, ip_depuis_entetes, localiser_en_arriere_plan
+
+
+@st.cache_resource(show_spinner=False)
+def demarrer_moteur():
+    """Une fois par processus : index et clients se chargent en arrière-plan pendant l'affichage."""
+    return prechauffer(en_arriere_plan=True)
+
+
+demarrer_moteur()
+
+# Localisation résolue en arrière-plan (une fois par session) : la page s'affiche sans l'attendre
+if "location_future" not in st.session_state:
+    entetes = getattr(getattr(st, "context", None), "headers", None)
+    st.session_state.location_future = localiser_en_arriere_plan(ip_depuis_entetes(entetes))
+
+
+def localisation():
+    """Localisation de la session dès qu'elle est prête ; None tant qu'elle ne l'est pas."""
+    if st.session_state.get("location") is None and st.session_state.location_future.done():
+        st.session_state.location = st.session_state.location_future.result() or dict(DEFAUT)
+    return st.session_state.get("location")
 
-# Détection de la localisation (stockée une fois)
-if "location" not in st.session_state:
-    location = get_user_location()
-    st.session_state.location = location
 
 # Interface
 st.set_page_config(page_title="Chatbot Culturel Occitanie", page_icon="🎭")
 st.title("🎭 Chatbot Culturel Occitanie")
 st.markdown("Posez vos questions sur les événements culturels en région Occitanie. 📍")
 
+# Identifiant de session : chaque onglet a sa propre mémoire conversationnelle
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+
 # Initialisation historique messages
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
@@ -20,16 +42,23 @@ if "chat_history" not in st.session_state:
 # Champ de saisie utilisateur
 user_input = st.chat_input("Posez votre question ici...")
 
-# Traitement de la question et réponse
-if user_input:
-    location = st.session_state.location
-    # Appel à la fonction du core, en passant la localisation si besoin
-    response = get_bot_response(user_input, location)
-    # Mémoriser les échanges
-    st.session_state.chat_history.append(("Vous", user_input))
-    st.session_state.chat_history.append(("Assistant", response))
-
 # Afficher l’historique du chat
 for role, msg in st.session_state.chat_history:
     with st.chat_message(role.lower()):
         st.markdown(msg)
+
+# Traitement de la question et réponse, affichée au fil de la génération
+if user_input:
+    location = localisation()
+    with st.chat_message("vous"):
+        st.markdown(user_input)
+    with st.chat_message("assistant"):
+        mesures = {}
+        response = st.write_stream(
+            stream_bot_response(user_input, location, st.session_state.session_id, mesures)
+        )
+        if "ttft" in mesures:
+            st.caption(f"Premier mot en {mesures['ttft']:.1f} s")
+    # Mémoriser les échanges
+    st.session_state.chat_history.append(("Vous", user_input))
+    st.session_state.chat_history.append(("Assistant", response))
@@ -0,0 +1,375 @@
+"""
+Banc de charge du chatbot, de bout en bout et sans réseau.
+
+Construit un index à partir d'un OpenAgenda local (événements enregistrés ou
+synthétiques, voir simulateurs.py) avec le pipeline en flux (pipeline.py).
+Il rejoue ensuite un corpus de conversations dans N sessions simultanées
+contre un `MoteurChatbot`. Le LLM, les embeddings et DuckDuckGo y sont simulés,
+avec une latence et un débit de jetons réglables.
+
+Le rapport JSON (`--json`) porte le commit courant et contient :
+- la construction : durée, débit, étapes (collecte, découpe, embedding,
+  indexation), requêtes et octets reçus
+- la charge : débit, p50/p95/p99 par étape (voir metriques.py), taux de succès
+  des caches (réponses, embeddings, recherche web), décisions et reformulations
+- le pic de mémoire résidente du processus (ru_maxrss)
+Deux rapports se comparent avec `--comparer avant.json apres.json`.
+
+Le corpus (`--corpus`) est un ou plusieurs JSONL d'objets {"session_id", "question", "ville"}.
+Un journal des conversations (journal.py) se rejoue donc tel quel.
+
+    python benchmark_charge.py --sessions 32 --evenements 2000 --json bench_charge.json
+    python benchmark_charge.py --enregistrement evenements.jsonl --corpus logs/conversations/*.jsonl
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import patch
+
+import chatbot_core
+import confiance
+import metriques
+import reformulation
+from chatbot_core import MoteurChatbot
+from chunking import decouper_lot
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from harvester import OpenAgendaHarvester
+from index_types import TYPES_INDEX
+from metriques import EmbeddingsMesurees, Metriques
+from pipeline import ConstructionEnFlux
+from simulateurs import (
+    DDGSSimule, EVENT_TYPES, EmbeddingsSimulees, LLMSimule, ServeurOpenAgenda, VILLES,
+    evenements_openagenda, lire_enregistrement,
+)
+
+try:
+    import resource
+except ImportError:
+    # Windows : pas de getrusage
+    resource = None
+
+# Conversations rejouées par défaut : (ville, questions dans l'ordre)
+CONVERSATIONS = [
+    ("Toulouse", ["Quels concerts ce week-end à Toulouse ?", "Et dimanche ?", "C'est gratuit ?"]),
+    ("Montpellier", ["Des spectacles de danse à Montpellier la semaine prochaine ?", "et pour les enfants ?"]),
+    ("Albi", ["Que faire à Albi ce soir ?", "Merci, et demain soir ?"]),
+    ("Nîmes", ["Y a-t-il des expositions de photographie à Nîmes ?"]),
+    ("Toulouse", ["Quels concerts ce week-end à Toulouse ?", "Il reste des places ?"]),
+    ("Sète", ["Un festival de jazz à Sète cet été ?", "Et à Montpellier ?", "Comment y aller ?"]),
+    ("Carcassonne", ["Des ateliers de peinture à Carcassonne en août ?"]),
+    ("Toulouse", ["Quels événements autour de moi dans 10 km ?", "Plutôt du théâtre", "Samedi prochain ?"]),
+]
+
+
+# -------- Corpus --------
+def charger_corpus(chemins: list) -> list:
+    """Conversations [(ville, [questions])] d'un ou plusieurs JSONL, regroupées par session dans l'ordre."""
+    sessions = {}
+    for chemin in chemins:
+        with open(chemin, encoding="utf-8") as f:
+            for ligne in f:
+                if not ligne.strip():
+                    continue
+                evenement = json.loads(ligne)
+                if evenement.get("type", "reponse") != "reponse" or not evenement.get("question"):
+                    continue
+                ville, questions = sessions.setdefault(
+                    evenement.get("session_id", "default"), (evenement.get("ville"), [])
+                )
+                questions.append(evenement["question"])
+    return list(sessions.values())
+
+
+def position(ville: str) -> dict:
+    """Localisation d'une session : ville, avec ses coordonnées quand elle est connue."""
+    if not ville:
+        return None
+    for nom, _, lat, lon in VILLES:
+        if nom == ville:
+            return {"city": nom, "region": "Occitanie", "latitude": lat, "longitude": lon}
+    return {"city": ville}
+
+
+# -------- Mesures --------
+def rss_pic_mo() -> float:
+    """Pic de mémoire résidente du processus, en Mo (None sans `resource`)."""
+    if resource is None:
+        return None
+    pic = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Octets sur macOS, kilo-octets ailleurs
+    return pic / 2 ** 20 if sys.platform == "darwin" else pic / 2 ** 10
+
+
+def version_code() -> str:
+    try:
+        sortie = subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+            cwd=Path(__file__).resolve().parent,
+        )
+    except OSError:
+        return None
+    return sortie.stdout.strip() or None
+
+
+def resume_etapes(mesures: Metriques) -> dict:
+    """Durées par étape, en ms (p50, p95, p99, max) et en secondes cumulées."""
+    etapes = {}
+    for serie, r in mesures.instantane()["distributions"].items():
+        if serie.startswith(metriques.DUREES + "{"):
+            etape = serie[len(metriques.DUREES) + len('{etape="'):-2]
+            etapes[etape] = {
+                "n": r["n"], "total_s": r["somme"],
+                **{q: r[q] * 1000 for q in ("p50", "p95", "p99")}, "max": r["max"] * 1000,
+            }
+    return etapes
+
+
+def taux(succes: int, echecs: int) -> dict:
+    total = succes + echecs
+    return {"hits": succes, "misses": echecs, "hit_rate": succes / total if total else 0.0}
+
+
+def chronometrer(iterable, mesures: Metriques, nom: str):
+    """Itère en chronométrant l'attente de chaque élément dans l'étape `nom`."""
+    iterateur = iter(iterable)
+    while True:
+        with mesures.etape(nom):
+            try:
+                element = next(iterateur)
+            except StopIteration:
+                return
+        yield element
+
+
+# -------- Construction de l'index --------
+class ConstructionMesuree(ConstructionEnFlux):
+    """Pipeline en flux dont chaque étape est chronométrée dans `mesures`."""
+
+    def __init__(self, embeddings, chemin_index: str, mesures: Metriques, **options):
+        super().__init__(EmbeddingsMesurees(embeddings, mesures), chemin_index, **options)
+        self.mesures = mesures
+
+    def documents(self, pages, now):
+        return super().documents(chronometrer(pages, self.mesures, "collecte"), now)
+
+    def decoupes(self, lots):
+        for lot in lots:
+            with self.mesures.etape("decoupe"):
+                chunks = decouper_lot(lot, self.embeddings)
+            yield lot, chunks
+
+    def indexer_lot(self, lot, chunks):
+        with self.mesures.etape("indexation"):
+            super().indexer_lot(lot, chunks)
+
+
+def construire(evenements: list, chemin_index: str, embeddings, type_index: str = "flat",
+               latence_openagenda: float = 0.0, export: bool = True) -> dict:
+    """Index construit depuis un OpenAgenda local ; retourne les mesures de la construction."""
+    mesures = Metriques(fenetre=100000)
+    with ServeurOpenAgenda(evenements, latence_openagenda) as serveur:
+        harvester = OpenAgendaHarvester(base_url=serveur.url, rate=1000.0, export=export)
+        construction = ConstructionMesuree(embeddings, chemin_index, mesures, type_index=type_index)
+        debut = time.perf_counter()
+        vectorstore, rapport = construction.construire(
+            harvester.iterer_evenements(EVENT_TYPES), datetime.now(timezone.utc)
+        )
+        duree = time.perf_counter() - debut
+    stats = harvester.statistiques()
+    return {
+        "duree_s": duree,
+        "evenements": rapport["ajoutes"],
+        "morceaux": vectorstore.index.ntotal,
+        "lots": rapport["lots"],
+        "evenements_s": rapport["ajoutes"] / duree if duree else 0.0,
+        "requetes": stats["requetes"],
+        "octets": stats["octets"],
+        "pics_files": construction.pics_files,
+        "etapes": resume_etapes(mesures),
+        "cache_embeddings": embeddings.cache.stats(),
+        "rss_pic_mo": rss_pic_mo(),
+    }
+
+
+# -------- Charge --------
+def rejouer_session(moteur: MoteurChatbot, session_id: str, ville: str, questions: list,
+                    mode: str = "sync", pause: float = 0.0) -> int:
+    """Pose les questions d'une conversation dans l'ordre ; retourne le nombre de réponses."""
+    user_location = position(ville)
+    for i, question in enumerate(questions):
+        if i and pause:
+            time.sleep(pause)
+        if mode == "stream":
+            for _ in moteur.stream_bot_response(question, user_location, session_id):
+                pass
+        else:
+            moteur.get_bot_response(question, user_location, session_id)
+    return len(questions)
+
+
+def charge(moteur: MoteurChatbot, conversations: list, sessions: int, mode: str = "sync",
+           pause: float = 0.0) -> dict:
+    """`sessions` sessions simultanées ; la session i rejoue la conversation i (modulo le corpus)."""
+    debut = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions, thread_name_prefix="session") as pool:
+        futures = [
+            pool.submit(rejouer_session, moteur, f"session-{i}", *conversations[i % len(conversations)], mode, pause)
+            for i in range(sessions)
+        ]
+        questions = sum(future.result() for future in futures)
+    duree = time.perf_counter() - debut
+
+    m = moteur.metriques
+    compter = lambda nom, valeurs, cle: {v: m.compteur(nom, **{cle: v}) for v in valeurs}
+    web = chatbot_core.search_web.cache_info()
+    return {
+        "sessions": sessions,
+        "questions": questions,
+        "erreurs": m.compteur(metriques.ERREURS),
+        "duree_s": duree,
+        "questions_s": questions / duree if duree else 0.0,
+        "etapes": resume_etapes(m),
+        "caches": {
+            "reponses": taux(m.compteur(metriques.CACHE, resultat="hit"), m.compteur(metriques.CACHE, resultat="miss")),
+            "embeddings": moteur.embeddings.cache.stats(),
+            "web": taux(web.hits, web.misses),
+        },
+        "decisions": compter(metriques.DECISIONS, (confiance.LOCALE, confiance.MIXTE, confiance.WEB), "decision"),
+        "reformulations": compter(
+            metriques.REFORMULATIONS, (reformulation.AUTONOME, reformulation.MODELE, reformulation.LLM), "mode"
+        ),
+        "prompt_jetons": m.distribution(metriques.PROMPT_JETONS),
+    }
+
+
+def mesurer(args) -> dict:
+    conversations = charger_corpus(args.corpus) if args.corpus else CONVERSATIONS
+    if args.enregistrement:
+        evenements = lire_enregistrement(args.enregistrement)
+    else:
+        evenements = evenements_openagenda(args.evenements)
+
+    with tempfile.TemporaryDirectory() as dossier:
+        cache_embeddings = str(Path(dossier) / "embeddings.sqlite")
+        chemin_index = str(Path(dossier) / "faiss_index")
+
+        print(f" Construction de l'index : {len(evenements)} événements...")
+        construction = construire(
+            evenements, chemin_index,
+            CachedEmbeddings(EmbeddingsSimulees(latence=args.latence_embeddings), EmbeddingCache(cache_embeddings)),
+            args.type, args.latence_openagenda, export=not args.pages,
+        )
+
+        nb_questions = sum(len(conversations[i % len(conversations)][1]) for i in range(args.sessions))
+        moteur = MoteurChatbot(
+            api_key="simule", chemin_index=chemin_index,
+            # Fenêtre assez large pour des quantiles sur toutes les réponses
+            metriques=Metriques(fenetre=max(metriques.FENETRE, 2 * nb_questions)),
+            embeddings=CachedEmbeddings(
+                EmbeddingsSimulees(latence=args.latence_embeddings), EmbeddingCache(cache_embeddings)
+            ),
+            llm=LLMSimule(
+                latence=args.latence_llm, jetons_par_seconde=args.jetons_par_seconde,
+                jetons_reponse=args.jetons_reponse,
+            ),
+        )
+        demarrage = moteur.prechauffer()
+
+        print(f" Charge : {args.sessions} sessions, {nb_questions} questions ({args.mode})...")
+        chatbot_core.search_web.cache_clear()
+        with patch.object(chatbot_core, "DDGS", DDGSSimule.regle(args.latence_web)):
+            resultat = charge(moteur, conversations, args.sessions, args.mode, args.pause)
+        moteur.web_executor.shutdown()
+
+    return {
+        "version": version_code(),
+        "horodatage": datetime.now().isoformat(timespec="seconds"),
+        "parametres": {cle: valeur for cle, valeur in vars(args).items() if cle not in ("json", "comparer")},
+        "construction": construction,
+        "demarrage": demarrage,
+        "charge": resultat,
+        "rss_pic_mo": rss_pic_mo(),
+    }
+
+
+# -------- Affichage --------
+def afficher(rapport: dict):
+    c = rapport["construction"]
+    print(f"\nConstruction : {c['evenements']} événements, {c['morceaux']} morceaux en {c['duree_s']:.2f} s "
+          f"({c['evenements_s']:.0f} év/s, {c['requetes']} requêtes)")
+    r = rapport["charge"]
+    print(f"Charge : {r['questions']} questions en {r['duree_s']:.2f} s ({r['questions_s']:.1f} q/s), "
+          f"{r['erreurs']} erreurs")
+    print(f"{'étape':<14}{'n':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for nom, etapes in (("construction", c["etapes"]), ("charge", r["etapes"])):
+        for etape, e in sorted(etapes.items(), key=lambda item: -item[1]["total_s"]):
+            print(f"{etape:<14}{e['n']:>7}{e['p50']:>9.1f}{e['p95']:>9.1f}{e['p99']:>9.1f}")
+        print()
+    for cache, t in r["caches"].items():
+        print(f"cache {cache:<11}{t['hit_rate']:>7.0%} ({t['hits']} / {t['hits'] + t['misses']})")
+    print(f"pic RSS : {rapport['rss_pic_mo'] or float('nan'):.0f} Mo")
+
+
+def comparer(avant: dict, apres: dict):
+    """Écarts entre deux rapports : débits, p95 par étape et mémoire."""
+    print(f"{'':<30}{avant.get('version') or 'avant':>14}{apres.get('version') or 'après':>14}{'écart':>9}")
+
+    def ligne(nom, a, b):
+        if a is None or b is None:
+            return
+        ecart = f"{(b - a) / a:+.0%}" if a else ""
+        print(f"{nom:<30}{a:>14.1f}{b:>14.1f}{ecart:>9}")
+
+    ligne("construction év/s", avant["construction"]["evenements_s"], apres["construction"]["evenements_s"])
+    ligne("charge questions/s", avant["charge"]["questions_s"], apres["charge"]["questions_s"])
+    for phase in ("construction", "charge"):
+        etapes_avant, etapes_apres = avant[phase]["etapes"], apres[phase]["etapes"]
+        for etape in sorted(set(etapes_avant) & set(etapes_apres)):
+            ligne(f"{phase} {etape} p95 ms", etapes_avant[etape]["p95"], etapes_apres[etape]["p95"])
+    ligne("pic RSS Mo", avant.get("rss_pic_mo"), apres.get("rss_pic_mo"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc de charge du chatbot, sans réseau")
+    parser.add_argument("--sessions", type=int, default=16, help="sessions simultanées")
+    parser.add_argument("--corpus", nargs="+", help="JSONL de questions (session_id, question, ville)")
+    parser.add_argument("--mode", default="sync", choices=("sync", "stream"),
+                        help="get_bot_response, ou stream_bot_response (premier jeton)")
+    parser.add_argument("--pause", type=float, default=0.0, help="secondes entre deux questions d'une session")
+    parser.add_argument("--evenements", type=int, default=1000, help="événements synthétiques")
+    parser.add_argument("--enregistrement", help="événements enregistrés (python simulateurs.py enregistrer)")
+    parser.add_argument("--pages", action="store_true", help="collecte par pages plutôt que par export JSONL")
+    parser.add_argument("--type", default="flat", choices=TYPES_INDEX, help="type d'index FAISS")
+    parser.add_argument("--latence-llm", type=float, default=0.3, help="secondes avant le premier jeton")
+    parser.add_argument("--jetons-par-seconde", type=float, default=40.0, help="débit du LLM (0 : sans limite)")
+    parser.add_argument("--jetons-reponse", type=int, default=80)
+    parser.add_argument("--latence-embeddings", type=float, default=0.02, help="secondes par appel d'embedding")
+    parser.add_argument("--latence-web", type=float, default=0.2, help="secondes par recherche DuckDuckGo")
+    parser.add_argument("--latence-openagenda", type=float, default=0.0, help="secondes par requête OpenAgenda")
+    parser.add_argument("--json", help="fichier où écrire le rapport")
+    parser.add_argument("--comparer", nargs=2, metavar=("AVANT", "APRES"), help="compare deux rapports JSON")
+    args = parser.parse_args()
+
+    if args.comparer:
+        rapports = []
+        for chemin in args.comparer:
+            with open(chemin, encoding="utf-8") as f:
+                rapports.append(json.load(f))
+        comparer(*rapports)
+        return
+
+    rapport = mesurer(args)
+    afficher(rapport)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rapport, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Banc d'essai hors ligne des types d'index FAISS (voir index_types.py).
+
+Vecteurs : embeddings déjà présents dans le cache SQLite (`--cache`), ou
+vecteurs synthétiques regroupés par thèmes et normalisés comme ceux de
+mistral-embed. Les requêtes sont des vecteurs du corpus légèrement bruités.
+Avec `--selectivite`, la recherche est restreinte à une fraction des vecteurs,
+comme le préfiltrage par dates et ville de retrieval.py.
+
+Pour chaque type d'index : temps de construction (entraînement + ajout),
+taille, rappel@k par rapport à la recherche exacte, latence p50/p99 par requête.
+
+    python benchmark_index.py --synthetique 50000 --dimension 1024
+    python benchmark_index.py --cache cache/embeddings.sqlite --json resultats.json
+"""
+import json
+import time
+import argparse
+import sqlite3
+
+import faiss
+import numpy as np
+
+from index_types import TYPES_INDEX, creer_index, parametres_selection, taille_octets
+
+
+def vecteurs_synthetiques(n: int, dimension: int, themes: int = 200, graine: int = 0) -> np.ndarray:
+    """Vecteurs normalisés répartis autour de `themes` directions, comme des événements proches."""
+    rng = np.random.default_rng(graine)
+    centres = rng.standard_normal((themes, dimension)).astype(np.float32)
+    x = centres[rng.integers(0, themes, n)] + 0.5 * rng.standard_normal((n, dimension)).astype(np.float32)
+    faiss.normalize_L2(x)
+    return x
+
+
+def vecteurs_du_cache(path: str, limite: int = None) -> np.ndarray:
+    """Vecteurs du cache d'embeddings (embedding_cache.py), sans appel à l'API."""
+    conn = sqlite3.connect(path)
+    requete = "SELECT vector FROM embeddings" + (f" LIMIT {int(limite)}" if limite else "")
+    lignes = conn.execute(requete).fetchall()
+    conn.close()
+    if not lignes:
+        raise ValueError(f"Aucun embedding dans {path}")
+    return np.stack([np.frombuffer(v, dtype=np.float32) for (v,) in lignes])
+
+
+def requetes_bruitees(x: np.ndarray, nb: int, bruit: float = 0.1, graine: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(graine)
+    q = x[rng.integers(0, len(x), nb)] + bruit * rng.standard_normal((nb, x.shape[1])).astype(np.float32)
+    faiss.normalize_L2(q)
+    return q
+
+
+def rechercher(index, requetes: np.ndarray, k: int, candidats=None):
+    """Recherche requête par requête (comme le chatbot) ; retourne (positions, latences en s)."""
+    params = None
+    if candidats is not None:
+        params = parametres_selection(index, faiss.IDSelectorBatch(candidats))
+    positions, latences = [], []
+    for q in requetes:
+        debut = time.perf_counter()
+        _, I = index.search(q[None, :], k, params=params)
+        latences.append(time.perf_counter() - debut)
+        positions.append(I[0])
+    return np.array(positions), np.array(latences)
+
+
+def rappel(obtenus: np.ndarray, attendus: np.ndarray) -> float:
+    """Rappel@k moyen : part des k plus proches voisins exacts retrouvés."""
+    k = attendus.shape[1]
+    return float(np.mean([
+        len(set(o[o >= 0]) & set(a[a >= 0])) / k for o, a in zip(obtenus, attendus)
+    ]))
+
+
+def comparer(x: np.ndarray, requetes: np.ndarray, types=TYPES_INDEX, k: int = 10,
+             metrique: str = "l2", selectivite: float = 1.0, graine: int = 0) -> list:
+    """Mesures de chaque type d'index ; la référence est l'index exact (flat) de même métrique."""
+    candidats = None
+    if selectivite < 1.0:
+        rng = np.random.default_rng(graine)
+        candidats = np.sort(rng.choice(len(x), max(k, int(len(x) * selectivite)), replace=False)).astype(np.int64)
+
+    reference = creer_index(x, "flat", metrique)
+    reference.add(x)
+    attendus, _ = rechercher(reference, requetes, k, candidats)
+
+    resultats = []
+    for type_index in types:
+        debut = time.perf_counter()
+        index = creer_index(x, type_index, metrique)
+        index.add(x)
+        construction = time.perf_counter() - debut
+        obtenus, latences = rechercher(index, requetes, k, candidats)
+        resultats.append({
+            "type": type_index,
+            "metrique": metrique,
+            "vecteurs": len(x),
+            "construction_s": construction,
+            "taille_mo": taille_octets(index) / 2 ** 20,
+            f"rappel@{k}": rappel(obtenus, attendus),
+            "p50_ms": float(np.percentile(latences, 50) * 1000),
+            "p99_ms": float(np.percentile(latences, 99) * 1000),
+        })
+    return resultats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rappel, latence, temps de construction et taille des index FAISS")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--cache", help="cache d'embeddings SQLite (embedding_cache.py)")
+    source.add_argument("--synthetique", type=int, default=20000, help="nombre de vecteurs synthétiques")
+    parser.add_argument("--dimension", type=int, default=1024, help="dimension des vecteurs synthétiques")
+    parser.add_argument("--limite", type=int, help="nombre maximal de vecteurs lus dans le cache")
+    parser.add_argument("--requetes", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--metrique", default="l2", choices=["l2", "ip"])
+    parser.add_argument("--types", nargs="+", default=list(TYPES_INDEX), choices=TYPES_INDEX)
+    parser.add_argument("--selectivite", type=float, default=1.0,
+                        help="fraction des vecteurs candidats (préfiltrage), 1.0 = tous")
+    parser.add_argument("--threads", type=int, default=1, help="threads FAISS (1 : une requête de chatbot)")
+    parser.add_argument("--json", help="fichier où écrire les résultats")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    if args.cache:
+        x = vecteurs_du_cache(args.cache, args.limite)
+        faiss.normalize_L2(x)
+    else:
+        x = vecteurs_synthetiques(args.synthetique, args.dimension)
+    requetes = requetes_bruitees(x, args.requetes)
+    print(f" {len(x)} vecteurs de dimension {x.shape[1]}, {len(requetes)} requêtes, k={args.k}")
+
+    resultats = comparer(x, requetes, args.types, args.k, args.metrique, args.selectivite)
+    cle_rappel = f"rappel@{args.k}"
+    print(f"{'type':<8}{'construction':>14}{'taille':>12}{cle_rappel:>12}{'p50':>10}{'p99':>10}")
+    for r in resultats:
+        print(
+            f"{r['type']:<8}{r['construction_s']:>12.2f} s{r['taille_mo']:>9.1f} Mo"
+            f"{r[cle_rappel]:>12.3f}{r['p50_ms']:>7.2f} ms{r['p99_ms']:>7.2f} ms"
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultats, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
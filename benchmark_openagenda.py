@@ -0,0 +1,165 @@
+"""
+Micro-benchmark du prétraitement OpenAgenda (voir Openagenda.py).
+
+Compare, en lignes par seconde, l'ancienne version ligne par ligne
+(`.apply(nettoyer_texte)` avec un BeautifulSoup par texte, `df.iterrows()`
+et f-strings) à la version actuelle (BeautifulSoup réservé aux textes
+contenant du HTML, assemblage des documents colonne par colonne).
+Les événements sont synthétiques : `--part-html` règle la proportion de
+descriptions en HTML.
+
+    python benchmark_openagenda.py --lignes 20000 --part-html 0.3
+"""
+import re
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+from bs4 import BeautifulSoup
+from langchain.schema import Document
+
+from Openagenda import generer_documents, nettoyer_colonne
+
+VILLES = [("Toulouse", "31000"), ("Montpellier", "34000"), ("Nîmes", "30000"), ("Albi", "81000"), ("Sète", "34200")]
+MOTS = ("concert jazz festival théâtre exposition atelier cirque danse lecture conte cinéma "
+        "spectacle famille gratuit plein air rencontre musique découverte patrimoine").split()
+
+
+def evenements_synthetiques(n: int, part_html: float = 0.3, graine: int = 0) -> pd.DataFrame:
+    """Événements au format de `obtenir_evenements_structures`, avant nettoyage."""
+    rng = np.random.default_rng(graine)
+    lignes = []
+    for i in range(n):
+        ville, code = VILLES[i % len(VILLES)]
+        phrases = [" ".join(rng.choice(MOTS, 12)).capitalize() + "." for _ in range(4)]
+        if rng.random() < part_html:
+            description = "".join(f"<p>{p} &amp; <strong>{ville}</strong></p>" for p in phrases)
+        else:
+            description = " ".join(phrases) + f" Rendez-vous à {ville} !"
+        debut = pd.Timestamp("2025-06-01", tz="UTC") + pd.Timedelta(hours=int(rng.integers(0, 5000)))
+        lignes.append({
+            "uid": f"uid-{i}",
+            "title_fr": f"{rng.choice(MOTS).capitalize()} à {ville} — édition {i % 7}",
+            "description_fr": description,
+            "location_name": f"Salle {i % 50}",
+            "location_address": f"{i % 90 + 1} rue des Arts",
+            "location_city": ville,
+            "location_postalcode": code,
+            "firstdate_begin": debut,
+            "lastdate_end": debut + pd.Timedelta(hours=3),
+            "date_fin": debut + pd.Timedelta(hours=3),
+            "latitude": 43.6 + rng.random(),
+            "longitude": 1.4 + rng.random(),
+            "keywords": list(rng.choice(MOTS, 3)) if i % 4 else None,
+        })
+    return pd.DataFrame(lignes)
+
+
+# — Version précédente, ligne par ligne —
+
+def nettoyer_texte_ligne(texte):
+    if not texte or not isinstance(texte, str):
+        return ""
+    texte = BeautifulSoup(texte, "html.parser").get_text()
+    texte = texte.lower()
+    texte = re.sub(r'[^\w\s.,!?;:\'\"À-ÿ]', ' ', texte)
+    return ' '.join(texte.split())
+
+
+def generer_documents_ligne(df):
+    documents = []
+    for _, row in df.iterrows():
+        content = (
+            f"Titre: {row.get('title_fr', '')}\n"
+            f"Description: {row.get('description_fr', '')}\n"
+            f"Lieu: {row.get('location_name', '')} - {row.get('location_address', '')}, "
+            f"{row.get('location_postalcode', '')} {row.get('location_city', '')}\n"
+            f"Dates: {row.get('firstdate_begin', '')} - {row.get('lastdate_end', '')}\n"
+            f"Mots-clés: {', '.join(row.get('keywords', [])) if isinstance(row.get('keywords'), list) else row.get('keywords', '')}"
+        )
+        metadata = {
+            "source": "opendatasoft",
+            "id": row.get("uid", ""),
+            "title": row.get("title_fr", ""),
+            "description": row.get("description_fr", ""),
+            "firstdate_begin": row.get("firstdate_begin", ""),
+            "lastdate_end": row.get("lastdate_end", ""),
+            "date_fin": row.get("date_fin", ""),
+            "location_name": row.get("location_name", ""),
+            "location_address": row.get("location_address", ""),
+            "location_district": row.get("location_district", ""),
+            "location_postalcode": row.get("location_postalcode", ""),
+            "location_city": row.get("location_city", ""),
+            "location_description": row.get("location_description_fr", ""),
+            "latitude": row.get("latitude"),
+            "longitude": row.get("longitude"),
+            "keywords": row.get("keywords", []),
+        }
+        documents.append(Document(page_content=content, metadata=metadata))
+    return documents
+
+
+def nettoyer_ligne(df):
+    df = df.copy()
+    df["description_fr"] = df["description_fr"].apply(nettoyer_texte_ligne)
+    df["title_fr"] = df["title_fr"].apply(nettoyer_texte_ligne)
+    return df
+
+
+def nettoyer_vectorise(df, workers: int = 1):
+    df = df.copy()
+    df["description_fr"] = nettoyer_colonne(df["description_fr"], workers)
+    df["title_fr"] = nettoyer_colonne(df["title_fr"], workers)
+    return df
+
+
+def lignes_par_seconde(fonction, df, repetitions: int = 3) -> float:
+    """Meilleur débit sur `repetitions` exécutions."""
+    meilleur = float("inf")
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction(df)
+        meilleur = min(meilleur, time.perf_counter() - debut)
+    return len(df) / meilleur
+
+
+def mesurer(df, repetitions: int = 3, workers: int = 1) -> dict:
+    propre = nettoyer_vectorise(df)
+    etapes = {
+        "nettoyage": (nettoyer_ligne, lambda d: nettoyer_vectorise(d, workers), df),
+        "documents": (generer_documents_ligne, generer_documents, propre),
+    }
+    resultats = {}
+    for etape, (avant, apres, donnees) in etapes.items():
+        resultats[etape] = {
+            "avant_lignes_s": lignes_par_seconde(avant, donnees, repetitions),
+            "apres_lignes_s": lignes_par_seconde(apres, donnees, repetitions),
+        }
+        resultats[etape]["acceleration"] = resultats[etape]["apres_lignes_s"] / resultats[etape]["avant_lignes_s"]
+    return resultats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Débit du nettoyage et de la génération des documents OpenAgenda")
+    parser.add_argument("--lignes", type=int, default=20000)
+    parser.add_argument("--part-html", type=float, default=0.3, help="proportion de descriptions en HTML")
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=1, help="processus pour les descriptions HTML")
+    parser.add_argument("--json", help="fichier où écrire les résultats")
+    args = parser.parse_args()
+
+    df = evenements_synthetiques(args.lignes, args.part_html)
+    print(f" {len(df)} événements, {args.part_html:.0%} de descriptions HTML")
+    resultats = mesurer(df, args.repetitions, args.workers)
+    print(f"{'étape':<12}{'avant':>16}{'après':>16}{'gain':>8}")
+    for etape, r in resultats.items():
+        print(f"{etape:<12}{r['avant_lignes_s']:>10.0f} l/s{r['apres_lignes_s']:>12.0f} l/s{r['acceleration']:>7.1f}x")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultats, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
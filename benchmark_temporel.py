@@ -0,0 +1,104 @@
+"""
+Micro-benchmark de l'analyse des expressions temporelles (voir temporel.py).
+
+Mesure le temps d'import et la latence par question (médiane et p95, en µs)
+de `temporel.periode`, comparés à `dateparser.search.search_dates` quand
+dateparser est installé. Les imports sont mesurés dans un processus neuf.
+
+    python benchmark_temporel.py --repetitions 2000 --json bench_temporel.json
+"""
+import sys
+import json
+import time
+import argparse
+import subprocess
+from datetime import date
+
+import numpy as np
+
+QUESTIONS = [
+    "Que faire à Toulouse ce week-end ?",
+    "Des concerts ce soir à Montpellier ?",
+    "Quels spectacles demain soir ?",
+    "Des expositions la semaine prochaine à Albi ?",
+    "Quels festivals en août ?",
+    "Quels concerts à Toulouse entre le 15 juillet et le 20 juillet ?",
+    "Du théâtre du 3 au 5 mai à Nîmes ?",
+    "Quelles sorties pour les enfants samedi prochain ?",
+    "Que voir cet été en Occitanie ?",
+    "Des conférences jusqu'au 2 novembre ?",
+    "Y a-t-il des marchés de Noël à Carcassonne ?",
+    "Quels événements gratuits près de moi ?",
+]
+
+
+def temps_import(module: str) -> float:
+    """Durée de `import module` dans un interpréteur neuf, en secondes (None si absent)."""
+    code = (f"import time; debut = time.perf_counter(); import {module}; "
+            f"print(time.perf_counter() - debut)")
+    resultat = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if resultat.returncode != 0:
+        return None
+    return float(resultat.stdout.strip())
+
+
+def latences(fonction, questions: list, repetitions: int) -> np.ndarray:
+    """Latence de chaque appel, en µs, sur `repetitions` passages du corpus."""
+    mesures = []
+    for _ in range(repetitions):
+        for question in questions:
+            debut = time.perf_counter()
+            fonction(question)
+            mesures.append(time.perf_counter() - debut)
+    return np.asarray(mesures) * 1e6
+
+
+def analyseurs() -> dict:
+    from temporel import periode
+
+    aujourdhui = date.today()
+    resultats = {"temporel": lambda question: periode(question, aujourdhui)}
+    try:
+        from dateparser.search import search_dates
+    except ImportError:
+        print(" dateparser n'est pas installé : comparaison ignorée")
+        return resultats
+    resultats["dateparser"] = lambda question: search_dates(question, languages=["fr"])
+    return resultats
+
+
+def mesurer(repetitions: int = 1000) -> dict:
+    resultats = {}
+    for nom, fonction in analyseurs().items():
+        # Premier appel hors mesure : fenêtres du jour pour temporel, chargement des langues pour dateparser
+        debut = time.perf_counter()
+        fonction(QUESTIONS[0])
+        premier = time.perf_counter() - debut
+        duree = latences(fonction, QUESTIONS, repetitions if nom == "temporel" else max(1, repetitions // 100))
+        resultats[nom] = {
+            "import_s": temps_import(nom),
+            "premier_appel_ms": premier * 1000,
+            "p50_us": float(np.percentile(duree, 50)),
+            "p95_us": float(np.percentile(duree, 95)),
+        }
+    return resultats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latence de l'analyse des expressions temporelles")
+    parser.add_argument("--repetitions", type=int, default=1000, help="passages du corpus (÷100 pour dateparser)")
+    parser.add_argument("--json", help="fichier où écrire les résultats")
+    args = parser.parse_args()
+
+    resultats = mesurer(args.repetitions)
+    print(f"{'analyseur':<12}{'import':>10}{'1er appel':>12}{'p50':>12}{'p95':>12}")
+    for nom, r in resultats.items():
+        import_s = f"{r['import_s'] * 1000:.0f} ms" if r["import_s"] is not None else "-"
+        print(f"{nom:<12}{import_s:>10}{r['premier_appel_ms']:>9.2f} ms{r['p50_us']:>9.1f} µs{r['p95_us']:>9.1f} µs")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultats, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
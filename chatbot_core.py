@@ -1,29 +1,71 @@
+import time
+_DEBUT_IMPORT = time.perf_counter()
+
 import os
 import csv
+import json
+import queue
+import atexit
+import asyncio
 import logging
-from datetime import datetime, date
+import logging.handlers
+import threading
+import contextvars
+import functools
+from datetime import datetime, date, timezone
 import locale
 from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from duckduckgo_search import DDGS
 from langchain.chains import ConversationalRetrievalChain
+from langchain.chains.conversational_retrieval.base import _get_chat_history
 from langchain.prompts import PromptTemplate
-from langchain_mistralai.chat_models import ChatMistralAI
-from langchain_mistralai import MistralAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.memory import ConversationBufferWindowMemory
 from pathlib import Path
+from embedding_cache import creer_embeddings
+from embedding_client import estimer_jetons
+from retrieval import IndexMetadonnees, RetrieverFiltre, filtres_requete
+from index_types import vecteurs_stockes
+from sessions import SessionStore
+from temporel import enrichir_question
+import confiance
+import contexte
+import reformulation
+from answer_cache import creer_cache_reponses, version_index
+import metriques
+from metriques import EmbeddingsMesurees, Metriques, Profileur
+from journal import JournalConversations
+
+INDEX_DIR = "faiss_index"
 
 # -------- LOGGING --------
-TODAY = datetime.now().date()
-os.makedirs("logs", exist_ok=True)
-logging.basicConfig(
-    filename=f"logs/chatbot_{TODAY}.log",
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s"
-)
-today_str = date.today().strftime("%A %d %B %Y")
+_logs_configures = False
+
+
+def configurer_logs():
+    """
+    Journal du jour dans logs/ ; appelé par le moteur par défaut, pas à l'import.
+    Les messages passent par une file : le fichier est écrit par un thread de
+    fond, jamais par le thread qui répond.
+    """
+    global _logs_configures
+    if _logs_configures:
+        return
+    os.makedirs("logs", exist_ok=True)
+    fichier = logging.FileHandler(f"logs/chatbot_{datetime.now().date()}.log", encoding="utf-8")
+    fichier.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+    file_logs = queue.Queue(-1)
+    ecouteur = logging.handlers.QueueListener(file_logs, fichier)
+    ecouteur.start()
+    atexit.register(ecouteur.stop)
+    logging.basicConfig(level=logging.INFO, handlers=[logging.handlers.QueueHandler(file_logs)])
+    _logs_configures = True
+
 
 # -------- Fallback Web --------
+WEB_AUCUN_RESULTAT = "Aucun résultat trouvé."
+WEB_ECHEC = "⚠️ La recherche en ligne a échoué. Réessayez plus tard."
+
+
 @lru_cache(maxsize=50)
 def search_web(query: str) -> str:
     try:
@@ -32,40 +74,30 @@ def search_web(query: str) -> str:
             output = ""
             for r in results:
                 output += f"- {r['title']} ({r['href']})\n{r['body']}\n\n"
-            return output if output else "Aucun résultat trouvé."
+            return output if output else WEB_AUCUN_RESULTAT
     except Exception as e:
         logging.error(f"Erreur DuckDuckGo : {e}")
-        return "⚠️ La recherche en ligne a échoué. Réessayez plus tard."
+        return WEB_ECHEC
 
-# -------- API Mistral & Embeddings --------
-api_key = os.getenv("MISTRAL_API_KEY")
-if not api_key:
-    logging.error("Clé API Mistral manquante.")
-    raise ValueError("La clé API Mistral est absente.")
-
-embeddings = MistralAIEmbeddings(model="mistral-embed", api_key=api_key)
 
 def charger_index_faiss(chemin_index: str, embeddings):
+    # Imports différés : inutiles tant qu'aucun index n'est chargé
+    from index_store import charger_index, exiger_format_compact
+
     index_path = Path(chemin_index)
     if not index_path.exists() or not (index_path / "index.faiss").exists():
         logging.error(f"Index FAISS introuvable dans : {chemin_index}")
         return None
+    # Jamais de pickle au démarrage : un ancien index est refusé explicitement
+    exiger_format_compact(chemin_index)
 
     try:
-        return FAISS.load_local(
-            chemin_index,
-            embeddings,
-            allow_dangerous_deserialization=True
-        )
+        # Format compact : vecteurs projetés en mémoire, documents lus à la demande
+        return charger_index(chemin_index, embeddings)
     except Exception as e:
         logging.error(f"Erreur de chargement FAISS : {e}")
         return None
 
-vectorstore = charger_index_faiss("faiss_index", embeddings)
-if vectorstore is None:
-    raise RuntimeError("Index FAISS introuvable ou erreur de chargement")
-
-llm = ChatMistralAI(model="mistral-small", api_key=api_key)
 
 prompt_template = PromptTemplate.from_template("""
 Tu es un assistant culturel spécialisé dans les événements en région Occitanie. Tu parles toujours en français.
@@ -86,51 +118,572 @@ Question de l'utilisateur :
 Si tu ne trouves pas d'information dans la mémoire ou les documents, dis-le poliment sans inventer.
 """)
 
-memory = ConversationBufferWindowMemory(
-    k=3,
-    return_messages=True,
-    memory_key="chat_history"
-)
-
-retriever = vectorstore.as_retriever()
+MESSAGE_ERREUR = "❌ Une erreur est survenue lors du traitement de votre demande."
 
-qa_chain = ConversationalRetrievalChain.from_llm(
-    llm=llm,
-    retriever=retriever,
-    memory=memory,
-    combine_docs_chain_kwargs={
-        "prompt": prompt_template,
-        "document_variable_name": "context"
-    }
+# Ordre de construction au préchauffage : chaque composant ne dépend que des précédents
+COMPOSANTS = (
+    "embeddings", "vectorstore", "index_meta", "lexical", "retriever", "llm", "qa_chain", "cache_reponses",
 )
 
-def get_bot_response(question: str, user_location: dict = None) -> str:
+
+class MoteurChatbot:
     """
-    Retourne la réponse du chatbot pour une question donnée,
-    en utilisant la localisation passée (optionnelle).
+    Composants du chatbot (client d'embeddings, index FAISS, LLM, chaîne, cache
+    des réponses), construits à la première utilisation puis partagés par
+    toutes les sessions. Rien n'est chargé ni appelé à la création du moteur.
+
+    Des composants déjà construits peuvent être fournis au constructeur
+    (`MoteurChatbot(embeddings=..., llm=...)`), par exemple dans les tests.
+    Les durées de chaque étape des réponses sont agrégées dans `metriques`
+    (voir metriques.py) et, avec un `journal`, chaque réponse y est consignée
+    en arrière-plan (voir journal.py).
     """
-    global today_str
 
-    parsed_question = f"Réponds toujours en français. {question} (Nous sommes le {today_str})"
-    if user_location and user_location.get("city"):
-        parsed_question += f" (Je suis à {user_location['city']})"
+    def __init__(self, api_key: str = None, chemin_index: str = INDEX_DIR, metriques: Metriques = None,
+                 journal: JournalConversations = None, **composants):
+        inconnus = set(composants) - set(COMPOSANTS)
+        if inconnus:
+            raise TypeError(f"Composants inconnus : {', '.join(sorted(inconnus))}")
+        self.metriques = metriques if metriques is not None else Metriques()
+        self.profileur = Profileur()
+        self.journal = journal
+        if "embeddings" in composants:
+            composants["embeddings"] = EmbeddingsMesurees(composants["embeddings"], self.metriques)
+        self.api_key = api_key if api_key is not None else os.getenv("MISTRAL_API_KEY")
+        self.chemin_index = chemin_index
+        # Mémoire par session ; le LLM, l'index et la chaîne (sans état) sont partagés
+        self.sessions = SessionStore(k=3)
+        # Recherches web lancées en parallèle de la recherche locale
+        self.web_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="web")
+        self.profil = {}
+        self._composants = dict(composants)
+        self._lock = threading.RLock()
+        self._pret = False
 
-    try:
-        response = qa_chain.invoke({"question": parsed_question})
-        result = response.get("answer", "").strip()
+    # -------- Composants --------
+    def _composant(self, nom: str, fabrique):
+        """Construit `nom` une seule fois (même depuis plusieurs threads) et mesure sa durée."""
+        if nom in self._composants:
+            return self._composants[nom]
+        with self._lock:
+            if nom not in self._composants:
+                debut = time.perf_counter()
+                self._composants[nom] = fabrique()
+                self.profil[nom] = time.perf_counter() - debut
+            return self._composants[nom]
+
+    def _cle_api(self) -> str:
+        if not self.api_key:
+            logging.error("Clé API Mistral manquante.")
+            raise ValueError("La clé API Mistral est absente.")
+        return self.api_key
+
+    def _charger_index(self):
+        vectorstore = charger_index_faiss(self.chemin_index, self.embeddings)
+        if vectorstore is None:
+            raise RuntimeError("Index FAISS introuvable ou erreur de chargement")
+        return vectorstore
+
+    def _charger_lexical(self):
+        from index_lexical import charger_index_lexical
+        return charger_index_lexical(self.chemin_index, self.vectorstore.index.ntotal)
+
+    def _creer_llm(self):
+        from langchain_mistralai.chat_models import ChatMistralAI
+        return ChatMistralAI(model="mistral-small", api_key=self._cle_api())
+
+    def _creer_chaine(self):
+        return ConversationalRetrievalChain.from_llm(
+            llm=self.llm,
+            retriever=self.retriever,
+            combine_docs_chain_kwargs={
+                "prompt": prompt_template,
+                "document_variable_name": "context"
+            }
+        )
+
+    @property
+    def embeddings(self):
+        # Chaque appel (question, recherche) est chronométré dans l'étape « embedding »
+        return self._composant(
+            "embeddings", lambda: EmbeddingsMesurees(creer_embeddings(self._cle_api()), self.metriques)
+        )
+
+    @property
+    def vectorstore(self):
+        return self._composant("vectorstore", self._charger_index)
+
+    @property
+    def index_meta(self) -> IndexMetadonnees:
+        # Index colonnaires (dates, ville, code postal) pour préfiltrer la recherche
+        return self._composant("index_meta", lambda: IndexMetadonnees.depuis_vectorstore(self.vectorstore))
+
+    @property
+    def lexical(self):
+        # Index BM25 construit par index_faiss.py ; None si absent : recherche vectorielle seule
+        return self._composant("lexical", self._charger_lexical)
+
+    @property
+    def retriever(self) -> RetrieverFiltre:
+        return self._composant(
+            "retriever",
+            lambda: RetrieverFiltre(vectorstore=self.vectorstore, index_meta=self.index_meta, lexical=self.lexical)
+        )
+
+    @property
+    def llm(self):
+        return self._composant("llm", self._creer_llm)
+
+    @property
+    def qa_chain(self) -> ConversationalRetrievalChain:
+        return self._composant("qa_chain", self._creer_chaine)
+
+    @property
+    def cache_reponses(self):
+        # Cache sémantique des réponses, invalidé à chaque reconstruction de l'index
+        return self._composant("cache_reponses", lambda: creer_cache_reponses(version_index(self.chemin_index)))
+
+    # -------- Démarrage --------
+    def prechauffer(self, en_arriere_plan: bool = False):
+        """
+        Construit tous les composants, une seule fois par moteur, pour que la
+        première question ne paie pas le chargement de l'index.
+        Retourne le profil de démarrage, ou le thread de préchauffage si
+        `en_arriere_plan` (les questions posées entre-temps attendent le composant
+        en cours de construction).
+        """
+        if en_arriere_plan:
+            thread = threading.Thread(target=self._prechauffer_sans_erreur, name="chatbot-prechauffage", daemon=True)
+            thread.start()
+            return thread
+
+        with self._lock:
+            if not self._pret:
+                for nom in COMPOSANTS:
+                    getattr(self, nom)
+                self._pret = True
+                logging.info(f"Démarrage : {json.dumps(self.profil_demarrage())}")
+        return self.profil_demarrage()
+
+    def _prechauffer_sans_erreur(self):
+        try:
+            self.prechauffer()
+        except Exception:
+            logging.exception("Erreur lors du préchauffage :")
+
+    def profil_demarrage(self) -> dict:
+        """Durées en secondes : import du module, puis construction de chaque composant."""
+        return {"import": DUREE_IMPORT, **{nom: self.profil[nom] for nom in COMPOSANTS if nom in self.profil}}
+
+    # -------- Réponse --------
+    def preparer_question(self, question: str, user_location: dict = None):
+        """Question enrichie (période citée, date du jour, ville) et filtres de métadonnées pour la recherche."""
+        today_str = date.today().strftime("%A %d %B %Y")
+        parsed_question = f"Réponds toujours en français. {enrichir_question(question)} (Nous sommes le {today_str})"
+        if user_location and user_location.get("city"):
+            parsed_question += f" (Je suis à {user_location['city']})"
+
+        # Seuls les événements non terminés (et dans la ville citée ou le rayon demandé) sont candidats
+        filtres = self.index_meta.filtres_question(question, datetime.now(timezone.utc), user_location)
+        return parsed_question, filtres
+
+    def question_autonome(self, session, question: str, user_location: dict, chat_history_str: str,
+                          parsed_question: str, filtres: dict) -> tuple:
+        """
+        Question autonome décidée localement (voir reformulation.py), ou déjà
+        reformulée pour ce même historique dans la session.
+        Retourne (mode, requête de recherche, question du prompt, filtres) ; la
+        requête et la question du prompt sont None quand le LLM doit reformuler.
+        """
+        if not chat_history_str:
+            mode, autonome = reformulation.AUTONOME, question
+        else:
+            mode, autonome = session.reformulation((chat_history_str, question)) or reformulation.analyser(
+                question, session.sujet
+            )
+        self.metriques.incrementer(metriques.REFORMULATIONS, mode=mode)
+        metriques.noter("reformulation", mode)
+        if mode == reformulation.AUTONOME:
+            return mode, question, parsed_question, filtres
+        if mode == reformulation.MODELE:
+            # Lieu et dates de la question complétée : filtres recalculés
+            parsed_autonome, filtres = self.preparer_question(autonome, user_location)
+            return mode, autonome, parsed_autonome, filtres
+        return mode, autonome, autonome, filtres
+
+    def retenir_question(self, session, question: str, chat_history_str: str, mode: str, requete: str):
+        """La question autonome devient le sujet de la relance suivante."""
+        session.sujet = requete
+        if chat_history_str:
+            session.retenir_reformulation((chat_history_str, question), (mode, requete))
+
+    def reformuler_question(self, parsed_question: str, chat_history_str: str) -> str:
+        """Question autonome (reformulée par le LLM s'il y a un historique)."""
+        if not chat_history_str:
+            return parsed_question
+        with self.metriques.etape("reformulation"):
+            generated = self.qa_chain.question_generator.invoke(
+                {"question": parsed_question, "chat_history": chat_history_str}
+            )
+        return generated["text"].strip()
+
+    def preparer_contexte(self, question: str, requete: str, filtres: dict):
+        """
+        Recherche locale (sur `requete`) et décision de recours au web selon le score
+        de confiance (voir confiance.py), avant toute génération. Sans confiance
+        suffisante, la recherche web (sur `question`) démarre aussitôt, et les vecteurs
+        du contexte local sont relus pendant qu'elle tourne.
+        Retourne (contexte assemblé, résultats web ou None) pour générer une réponse
+        (voir contexte.py), ou (None, résultats web) quand le contexte local n'est pas pertinent.
+        """
+        # Comprend l'embedding de la requête quand elle diffère de la question
+        with self.metriques.etape("recherche"), filtres_requete(**filtres):
+            resultats = self.retriever.rechercher_candidats(requete, contexte.CANDIDATS)
+        decision = confiance.decider([(doc, distance) for doc, distance, _ in resultats], filtres)
+        self.metriques.incrementer(metriques.DECISIONS, decision=decision)
+        metriques.noter("decision", decision)
+        metriques.noter("web", decision != confiance.LOCALE)
+        logging.info(f"Décision contexte : {decision} ({len(resultats)} résultats)")
+        if decision == confiance.LOCALE:
+            return self.assembler_contexte(resultats), None
+
+        web = self.web_executor.submit(search_web, question)
+        vecteurs = self.vecteurs_resultats(resultats) if decision == confiance.MIXTE else None
+        with self.metriques.etape("web"):
+            web_result = web.result()
+        if decision == confiance.WEB:
+            return None, web_result
+        return self.assembler_contexte(resultats, web_result, vecteurs), web_result
+
+    def vecteurs_resultats(self, resultats: list):
+        """Vecteurs stockés des résultats (pour le MMR du contexte), relus dans l'index."""
+        with self.metriques.etape("contexte"):
+            return vecteurs_stockes(self.vectorstore.index, [position for _, _, position in resultats])
+
+    def assembler_contexte(self, resultats: list, web_result: str = None, vecteurs=None) -> str:
+        """Événements distincts et diversifiés, dans le budget de jetons."""
+        if vecteurs is None:
+            vecteurs = self.vecteurs_resultats(resultats)
+        with self.metriques.etape("contexte"):
+            texte, nb_evenements = contexte.assembler_contexte(resultats, vecteurs, web=web_result)
+        jetons = estimer_jetons(texte)
+        metriques.noter("contexte_jetons", jetons)
+        logging.info(f"Contexte : {nb_evenements} événements sur {len(resultats)} morceaux, {jetons} jetons")
+        return texte
+
+    def chercher_en_cache(self, question: str, filtres: dict, user_location: dict = None):
+        """
+        Réponse déjà donnée à une question similaire (même ville, même jour, mêmes `filtres`).
+        Retourne (réponse ou None, clé pour `mettre_en_cache`).
+        L'embedding de la question brute est celui que la recherche locale réutilisera.
+        """
+        vecteur = self.embeddings.embed_query(question)
+        ville = (user_location or {}).get("city", "")
+        with self.metriques.etape("cache"):
+            partition = self.cache_reponses.partition(ville, date.today().isoformat(), filtres)
+            result = self.cache_reponses.chercher(vecteur, partition)
+        self.metriques.incrementer(metriques.CACHE, resultat="hit" if result is not None else "miss")
+        metriques.noter("cache", result is not None)
+        return result, (vecteur, partition)
+
+    def construire_prompt(self, question: str, chat_history_str: str, contexte_prompt: str) -> str:
+        prompt = construire_prompt(question, chat_history_str, contexte_prompt)
+        jetons = estimer_jetons(prompt)
+        self.metriques.observer(metriques.PROMPT_JETONS, jetons)
+        metriques.noter("prompt_jetons", jetons)
+        logging.info(f"Prompt : {jetons} jetons")
+        return prompt
 
-        mots_cles_fallback = [
-            "je n'ai pas", "aucune information", "aucun événement",
-            "pas d'informations", "je ne trouve pas"
-        ]
-        besoin_recherche_web = (not result) or any(m in result.lower() for m in mots_cles_fallback)
+    def terminer(self, debut: float, mode: str, releve: dict, erreur: bool = False, **evenement):
+        """Compte la réponse (durée totale, ou erreur) et la consigne dans le journal des conversations."""
+        if erreur:
+            self.metriques.incrementer(metriques.ERREURS)
+            releve["durees"]["total"] = time.perf_counter() - debut
+        else:
+            self.metriques.observer(metriques.DUREES, time.perf_counter() - debut, etape="total")
+            self.metriques.incrementer(metriques.REPONSES, mode=mode)
+        if self.journal is not None:
+            self.journal.enregistrer({"type": "reponse", "mode": mode, "erreur": erreur, **evenement, **releve})
 
-        if besoin_recherche_web:
-            web_result = search_web(question)
-            return web_result
+    def enregistrer_retour(self, session_id: str, utile: bool, commentaire: str = None):
+        """Retour de l'utilisateur sur la conversation, consigné dans le journal."""
+        if self.journal is not None:
+            self.journal.enregistrer(
+                {"type": "retour", "session_id": session_id, "utile": utile, "commentaire": commentaire}
+            )
 
+    def mettre_en_cache(self, cle, result: str, debut: float, contexte_prompt: str, web_result: str = None):
+        """
+        Seules les réponses générées sont réutilisées : ni les résultats web bruts
+        (décision WEB), ni une réponse construite sur une recherche web sans résultat,
+        ni un message d'erreur.
+        """
+        if cle is None or contexte_prompt is None or not result or result == MESSAGE_ERREUR:
+            return
+        if web_result in (WEB_ECHEC, WEB_AUCUN_RESULTAT):
+            return
+        self.cache_reponses.enregistrer(cle[0], cle[1], result, time.perf_counter() - debut)
+
+    def get_bot_response(self, question: str, user_location: dict = None, session_id: str = "default") -> str:
+        """
+        Retourne la réponse du chatbot pour une question donnée,
+        en utilisant la localisation passée (optionnelle) et l'historique
+        de la session `session_id`.
+        """
+        debut = time.perf_counter()
+        with metriques.releve() as releve:
+            try:
+                with self.profileur.echantillon("get_bot_response"):
+                    result = self._repondre(question, user_location, session_id, debut)
+                erreur = False
+            except Exception as e:
+                logging.exception("Erreur lors de la réponse :")
+                result, erreur = MESSAGE_ERREUR, True
+            self.terminer(
+                debut, "sync", releve, erreur,
+                session_id=session_id, ville=(user_location or {}).get("city"), question=question, reponse=result,
+            )
         return result
 
-    except Exception as e:
-        logging.exception("Erreur lors de la réponse :")
-        return "❌ Une erreur est survenue lors du traitement de votre demande."
+    def _repondre(self, question: str, user_location: dict, session_id: str, debut: float) -> str:
+        session = self.sessions.session(session_id)
+        with self.metriques.etape("preparation"):
+            parsed_question, filtres = self.preparer_question(question, user_location)
+
+        # Les questions d'une même session sont traitées dans l'ordre
+        with session.verrou:
+            chat_history = session.memoire.load_memory_variables({})["chat_history"]
+            chat_history_str = _get_chat_history(chat_history)
+
+            # Sans historique, la réponse ne dépend que de la question : cache sémantique
+            cle_cache = None
+            if not chat_history_str:
+                result, cle_cache = self.chercher_en_cache(question, filtres, user_location)
+                if result is not None:
+                    session.sujet = question
+                    session.memoire.save_context({"question": parsed_question}, {"answer": result})
+                    return result
+
+            # Relances décidées localement : le LLM ne reformule que si la question en dépend
+            mode, requete, new_question, filtres = self.question_autonome(
+                session, question, user_location, chat_history_str, parsed_question, filtres
+            )
+            question_web = question if mode == reformulation.LLM else requete
+            if requete is None:
+                requete = new_question = self.reformuler_question(parsed_question, chat_history_str)
+            self.retenir_question(session, question, chat_history_str, mode, requete)
+
+            contexte_prompt, web_result = self.preparer_contexte(question_web, requete, filtres)
+            if contexte_prompt is None:
+                result = web_result
+            else:
+                prompt = self.construire_prompt(new_question, chat_history_str, contexte_prompt)
+                with self.metriques.etape("generation"):
+                    result = self.llm.invoke(prompt).content.strip()
+            session.memoire.save_context({"question": parsed_question}, {"answer": result})
+            self.mettre_en_cache(cle_cache, result, debut, contexte_prompt, web_result)
+        return result
+
+    async def astream_bot_response(self, question: str, user_location: dict = None, session_id: str = "default",
+                                   mesures: dict = None):
+        """
+        Variante asynchrone de `get_bot_response` qui produit la réponse token par token.
+
+        La décision de recours au web est prise avant la génération, d'après le
+        score de confiance de la recherche locale (voir confiance.py).
+        `mesures` (optionnel) reçoit `ttft` (temps jusqu'au premier token) et `total`, en secondes.
+        """
+        debut = time.perf_counter()
+        mesures = {} if mesures is None else mesures
+        morceaux, erreur = [], False
+        with metriques.releve() as releve:
+            try:
+                async for token in self._astream_reponse(question, user_location, session_id, mesures, debut):
+                    morceaux.append(token)
+                    yield token
+            except Exception:
+                erreur = True
+                raise
+            finally:
+                # Réponse interrompue par l'appelant : consignée telle quelle
+                self.terminer(
+                    debut, "stream", releve, erreur, session_id=session_id,
+                    ville=(user_location or {}).get("city"), question=question, reponse="".join(morceaux).strip(),
+                )
+
+    async def _astream_reponse(self, question: str, user_location: dict, session_id: str, mesures: dict,
+                               debut: float):
+        with self.metriques.etape("preparation"):
+            parsed_question, filtres = await _en_thread(self.preparer_question, question, user_location)
+        session = self.sessions.session(session_id)
+
+        await _en_thread(session.verrou.acquire)
+        try:
+            chat_history = session.memoire.load_memory_variables({})["chat_history"]
+            chat_history_str = _get_chat_history(chat_history)
+
+            cle_cache = None
+            if not chat_history_str:
+                result, cle_cache = await _en_thread(self.chercher_en_cache, question, filtres, user_location)
+                if result is not None:
+                    session.sujet = question
+                    mesures["ttft"] = time.perf_counter() - debut
+                    mesures["cache"] = True
+                    mesures["total"] = mesures["ttft"]
+                    session.memoire.save_context({"question": parsed_question}, {"answer": result})
+                    yield result
+                    return
+
+            mode, requete, new_question, filtres = await _en_thread(
+                self.question_autonome, session, question, user_location, chat_history_str, parsed_question, filtres
+            )
+            question_web = question if mode == reformulation.LLM else requete
+
+            if requete is None:
+                with self.metriques.etape("reformulation"):
+                    generated = await self.qa_chain.question_generator.ainvoke(
+                        {"question": parsed_question, "chat_history": chat_history_str}
+                    )
+                requete = new_question = generated["text"].strip()
+            self.retenir_question(session, question, chat_history_str, mode, requete)
+
+            contexte_prompt, web_result = await _en_thread(
+                self.preparer_contexte, question_web, requete, filtres
+            )
+            if contexte_prompt is None:
+                # Contexte local insuffisant : résultats web, sans appel au LLM
+                mesures["ttft"] = time.perf_counter() - debut
+                result = web_result
+                yield web_result
+            else:
+                prompt = self.construire_prompt(new_question, chat_history_str, contexte_prompt)
+                morceaux = []
+                debut_generation = time.perf_counter()
+                async for chunk in self.llm.astream(prompt):
+                    if not chunk.content:
+                        continue
+                    if not morceaux:
+                        mesures["ttft"] = time.perf_counter() - debut
+                        self.metriques.observer(
+                            metriques.DUREES, time.perf_counter() - debut_generation, etape="premier_token"
+                        )
+                    morceaux.append(chunk.content)
+                    yield chunk.content
+                result = "".join(morceaux).strip()
+                self.metriques.observer(metriques.DUREES, time.perf_counter() - debut_generation, etape="generation")
+
+            session.memoire.save_context({"question": parsed_question}, {"answer": result})
+            self.mettre_en_cache(cle_cache, result, debut, contexte_prompt, web_result)
+        finally:
+            session.verrou.release()
+
+        mesures["total"] = time.perf_counter() - debut
+        logging.info(
+            f"Réponse en streaming : premier token {mesures.get('ttft', float('nan')):.2f}s, "
+            f"total {mesures['total']:.2f}s"
+        )
+
+    def stream_bot_response(self, question: str, user_location: dict = None, session_id: str = "default",
+                            mesures: dict = None):
+        """
+        Générateur synchrone (pour `st.write_stream`) : le pipeline tourne sur la
+        boucle de fond et le thread appelant ne fait que consommer les tokens.
+        """
+        tokens = queue.Queue()
+
+        async def produire():
+            try:
+                async for token in self.astream_bot_response(question, user_location, session_id, mesures):
+                    tokens.put(token)
+            except Exception:
+                logging.exception("Erreur lors de la réponse :")
+                tokens.put(MESSAGE_ERREUR)
+            finally:
+                tokens.put(None)
+
+        asyncio.run_coroutine_threadsafe(produire(), _boucle_de_fond())
+        while True:
+            token = tokens.get()
+            if token is None:
+                break
+            yield token
+
+
+def construire_prompt(question: str, chat_history_str: str, contexte_prompt: str) -> str:
+    """Même prompt que la chaîne « stuff », avec le contexte assemblé (voir contexte.py)."""
+    return prompt_template.format(chat_history=chat_history_str, context=contexte_prompt, question=question)
+
+
+# -------- Pipeline asynchrone en streaming --------
+def _en_thread(fonction, *args):
+    """Équivalent d'`asyncio.to_thread` (Python 3.9+) qui conserve le contexte (filtres de la requête)."""
+    contexte = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(None, functools.partial(contexte.run, fonction, *args))
+
+
+_boucle = None
+_boucle_lock = threading.Lock()
+
+
+def _boucle_de_fond() -> asyncio.AbstractEventLoop:
+    """Boucle asyncio partagée, dans un thread démon, qui exécute les pipelines de streaming."""
+    global _boucle
+    with _boucle_lock:
+        if _boucle is None:
+            _boucle = asyncio.new_event_loop()
+            threading.Thread(target=_boucle.run_forever, name="chatbot-async", daemon=True).start()
+        return _boucle
+
+
+# -------- Moteur par défaut du processus --------
+_moteur = None
+_moteur_lock = threading.Lock()
+
+
+def obtenir_moteur() -> MoteurChatbot:
+    """Moteur partagé par le processus (Streamlit, CLI), créé au premier appel."""
+    global _moteur
+    with _moteur_lock:
+        if _moteur is None:
+            configurer_logs()
+            _moteur = MoteurChatbot(journal=JournalConversations())
+            metriques.demarrer_exports(_moteur.metriques)
+        return _moteur
+
+
+def prechauffer(en_arriere_plan: bool = False):
+    return obtenir_moteur().prechauffer(en_arriere_plan)
+
+
+def get_bot_response(question: str, user_location: dict = None, session_id: str = "default") -> str:
+    return obtenir_moteur().get_bot_response(question, user_location, session_id)
+
+
+def enregistrer_retour(session_id: str, utile: bool, commentaire: str = None):
+    obtenir_moteur().enregistrer_retour(session_id, utile, commentaire)
+
+
+def astream_bot_response(question: str, user_location: dict = None, session_id: str = "default",
+                         mesures: dict = None):
+    return obtenir_moteur().astream_bot_response(question, user_location, session_id, mesures)
+
+
+def stream_bot_response(question: str, user_location: dict = None, session_id: str = "default",
+                        mesures: dict = None):
+    return obtenir_moteur().stream_bot_response(question, user_location, session_id, mesures)
+
+
+def __getattr__(nom):
+    # `chatbot_core.vectorstore`, `chatbot_core.sessions`... : composants du moteur par défaut
+    if nom in COMPOSANTS or nom in ("sessions", "web_executor"):
+        return getattr(obtenir_moteur(), nom)
+    raise AttributeError(f"module {__name__!r} has no attribute {nom!r}")
+
+
+DUREE_IMPORT = time.perf_counter() - _DEBUT_IMPORT
+
+
+if __name__ == "__main__":
+    # Profil de démarrage : python chatbot_core.py
+    for etape, duree in obtenir_moteur().prechauffer().items():
+        print(f"{etape:<15} {duree:.3f} s")
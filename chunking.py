@@ -0,0 +1,101 @@
+"""
+Découpe sémantique par lots.
+
+Même algorithme que `SemanticChunker` (phrases combinées avec leurs voisines,
+rupture quand la distance cosinus dépasse le 95e percentile du document),
+mais les phrases de nombreux événements partagent un seul appel d'embedding,
+les distances sont calculées en NumPy vectorisé, les lots peuvent être traités
+par un pool de threads, et chaque morceau garde les métadonnées de son
+événement parent ainsi que son numéro d'ordre (`chunk_index`).
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.documents import Document
+from tqdm import tqdm
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.?!])\s+")
+BUFFER_SIZE = 1
+BREAKPOINT_PERCENTILE = 95
+PHRASES_PAR_LOT = 512
+
+
+def phrases_combinees(phrases: list, buffer_size: int = BUFFER_SIZE) -> list:
+    """Chaque phrase est entourée de `buffer_size` voisines de part et d'autre."""
+    return [
+        " ".join(phrases[max(0, i - buffer_size):i + 1 + buffer_size])
+        for i in range(len(phrases))
+    ]
+
+
+def distances_cosinus(vecteurs: np.ndarray) -> np.ndarray:
+    """Distances cosinus entre chaque vecteur et le suivant."""
+    normes = np.linalg.norm(vecteurs, axis=1, keepdims=True)
+    unitaires = vecteurs / np.where(normes == 0, 1, normes)
+    return 1 - np.einsum("ij,ij->i", unitaires[:-1], unitaires[1:])
+
+
+def regrouper_phrases(phrases: list, distances: np.ndarray, percentile: float = BREAKPOINT_PERCENTILE) -> list:
+    seuil = np.percentile(distances, percentile)
+    ruptures = np.flatnonzero(distances > seuil)
+    bornes = zip(np.concatenate(([0], ruptures + 1)), np.concatenate((ruptures + 1, [len(phrases)])))
+    return [" ".join(phrases[debut:fin]) for debut, fin in bornes if debut < fin]
+
+
+def decouper_lot(documents: list, embeddings, buffer_size: int = BUFFER_SIZE,
+                 percentile: float = BREAKPOINT_PERCENTILE) -> list:
+    """Découpe un lot de documents avec un seul appel `embed_documents`."""
+    phrases_par_doc = [SENTENCE_SPLIT.split(doc.page_content) for doc in documents]
+
+    textes, positions = [], []
+    for phrases in phrases_par_doc:
+        debut = len(textes)
+        if len(phrases) > 1:
+            textes += phrases_combinees(phrases, buffer_size)
+        positions.append((debut, len(textes)))
+
+    vecteurs = np.asarray(embeddings.embed_documents(textes), dtype=np.float32) if textes else None
+
+    chunks = []
+    for doc, phrases, (debut, fin) in zip(documents, phrases_par_doc, positions):
+        if fin - debut > 1:
+            morceaux = regrouper_phrases(phrases, distances_cosinus(vecteurs[debut:fin]), percentile)
+        else:
+            morceaux = phrases
+        for index, morceau in enumerate(morceaux):
+            chunks.append(Document(page_content=morceau, metadata={**doc.metadata, "chunk_index": index}))
+    return chunks
+
+
+def iterer_lots(documents, phrases_par_lot: int = PHRASES_PAR_LOT):
+    """Regroupe les documents (itérable quelconque) jusqu'à environ `phrases_par_lot` phrases par lot."""
+    lot, taille = [], 0
+    for doc in documents:
+        lot.append(doc)
+        taille += len(SENTENCE_SPLIT.split(doc.page_content))
+        if taille >= phrases_par_lot:
+            yield lot
+            lot, taille = [], 0
+    if lot:
+        yield lot
+
+
+def former_lots(documents: list, phrases_par_lot: int = PHRASES_PAR_LOT) -> list:
+    """Regroupe les documents jusqu'à environ `phrases_par_lot` phrases par appel d'embedding."""
+    return list(iterer_lots(documents, phrases_par_lot))
+
+
+def decouper_documents_par_lots(documents: list, embeddings, phrases_par_lot: int = PHRASES_PAR_LOT,
+                                workers: int = 4) -> list:
+    """
+    Découpe tous les documents, lot par lot, sur `workers` threads.
+    L'ordre des morceaux suit celui des documents.
+    """
+    lots = former_lots(documents, phrases_par_lot)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        resultats = pool.map(lambda lot: decouper_lot(lot, embeddings), lots)
+        chunks = []
+        for morceaux in tqdm(resultats, total=len(lots), desc="Découpe des documents", unit="lot"):
+            chunks.extend(morceaux)
+    return chunks
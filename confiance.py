@@ -0,0 +1,45 @@
+"""
+Décision de recours au web avant la génération.
+
+Plutôt que de générer une réponse complète puis d'y chercher « je n'ai pas »,
+on évalue la confiance dans le contexte local à partir des scores FAISS et des
+filtres de métadonnées satisfaits :
+- LOCALE : le contexte local suffit, une seule génération sans recherche web
+- MIXTE : confiance limite, les résultats web rejoignent le contexte local
+  dans une seule génération
+- WEB : rien de pertinent localement, les résultats web sont renvoyés sans appel au LLM
+"""
+LOCALE = "locale"
+MIXTE = "mixte"
+WEB = "web"
+
+SEUIL_HAUT = 0.80
+SEUIL_BAS = 0.70
+# Un résultat qui respecte une ville, un code postal ou un rayon demandés est plus fiable
+BONUS_METADONNEES = 0.05
+FILTRES_LIEU = ("villes", "codes_postaux", "centre")
+
+
+def similarite(distance: float) -> float:
+    """Cosinus à partir de la distance L2 au carré de FAISS (vecteurs normalisés)."""
+    return 1 - distance / 2
+
+
+def score_confiance(resultats: list, filtres: dict = None) -> float:
+    """Meilleure similarité parmi [(Document, distance)], bonifiée si un filtre de lieu s'applique."""
+    if not resultats:
+        return 0.0
+    score = max(similarite(distance) for _, distance in resultats)
+    if filtres and any(filtres.get(cle) for cle in FILTRES_LIEU):
+        score += BONUS_METADONNEES
+    return score
+
+
+def decider(resultats: list, filtres: dict = None, seuil_haut: float = SEUIL_HAUT,
+            seuil_bas: float = SEUIL_BAS) -> str:
+    score = score_confiance(resultats, filtres)
+    if score >= seuil_haut:
+        return LOCALE
+    if score >= seuil_bas:
+        return MIXTE
+    return WEB
@@ -0,0 +1,169 @@
+"""
+Assemblage du contexte entre la recherche et le LLM.
+
+Les morceaux renvoyés par la recherche étaient collés tels quels dans le
+prompt : plusieurs morceaux d'un même événement, chacun répétant titre, lieu
+et dates, et des événements quasi identiques côte à côte. Ici :
+- la recherche ramène davantage de candidats (`CANDIDATS`)
+- les morceaux sont regroupés par événement (`uid`), au meilleur score
+- les événements sont reclassés par MMR (maximal marginal relevance) sur les
+  vecteurs déjà stockés dans l'index, sans nouvel embedding : chaque choix
+  équilibre pertinence et différence avec les événements déjà retenus
+- chaque événement devient une ligne compacte tirée des métadonnées
+  (titre, ville, dates, lieu) suivie d'un court extrait
+- les lignes sont ajoutées dans l'ordre MMR tant que le budget de jetons
+  (`CHATBOT_BUDGET_CONTEXTE`, estimé comme dans embedding_client.py) le permet ;
+  les résultats web éventuels en occupent la moitié au plus
+"""
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import confiance
+from embedding_client import estimer_jetons
+
+CANDIDATS = 16
+BUDGET_JETONS = int(os.getenv("CHATBOT_BUDGET_CONTEXTE", "1200"))
+EVENEMENTS_MAX = 8
+# Poids de la pertinence face à la diversité (1 : pertinence seule)
+LAMBDA_MMR = 0.7
+JETONS_EXTRAIT = 60
+# En-têtes de page_content (voir Openagenda.generer_documents), déjà rendus par les métadonnées
+EN_TETES = re.compile(r"^(?:Titre|Lieu|Dates|Mots-clés)\s*:.*$", re.M)
+DESCRIPTION = re.compile(r"^Description\s*:\s*", re.M)
+
+
+def regrouper_par_evenement(resultats: list) -> list:
+    """
+    [(Document, distance, position)] regroupés par événement (`id` des
+    métadonnées, le texte à défaut). Retourne [(meilleur résultat, morceaux)],
+    meilleur événement d'abord ; les morceaux suivent l'ordre des résultats.
+    """
+    groupes = {}
+    for resultat in resultats:
+        doc = resultat[0]
+        uid = doc.metadata.get("id") or doc.page_content
+        groupes.setdefault(uid, []).append(resultat)
+    return sorted(
+        ((min(morceaux, key=lambda r: r[1]), morceaux) for morceaux in groupes.values()),
+        key=lambda groupe: groupe[0][1],
+    )
+
+
+def mmr(pertinences, vecteurs, k: int, lambda_mmr: float = LAMBDA_MMR) -> list:
+    """
+    Indices de `k` éléments au plus, choisis un à un pour maximiser
+    lambda · pertinence - (1 - lambda) · similarité maximale aux éléments déjà choisis.
+    Sans vecteurs, l'ordre de pertinence est conservé.
+    """
+    pertinences = np.asarray(pertinences, dtype=np.float32)
+    k = min(k, len(pertinences))
+    if vecteurs is None:
+        return np.argsort(-pertinences, kind="stable")[:k].tolist()
+    x = np.asarray(vecteurs, dtype=np.float32)
+    x = x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+    similarites = x @ x.T
+
+    choisis = []
+    redondance = np.full(len(pertinences), -np.inf, dtype=np.float32)
+    restants = np.ones(len(pertinences), dtype=bool)
+    while len(choisis) < k:
+        penalite = np.where(np.isfinite(redondance), redondance, 0.0)
+        scores = np.where(restants, lambda_mmr * pertinences - (1 - lambda_mmr) * penalite, -np.inf)
+        meilleur = int(np.argmax(scores))
+        choisis.append(meilleur)
+        restants[meilleur] = False
+        redondance = np.maximum(redondance, similarites[meilleur])
+    return choisis
+
+
+def _texte(valeur) -> str:
+    if valeur is None or (isinstance(valeur, float) and np.isnan(valeur)):
+        return ""
+    return " ".join(str(valeur).split())
+
+
+def _date(valeur) -> str:
+    date = pd.to_datetime(_texte(valeur) or None, errors="coerce")
+    if date is None or pd.isna(date):
+        return _texte(valeur)
+    if (date.hour, date.minute) == (0, 0):
+        return date.strftime("%d/%m/%Y")
+    return date.strftime("%d/%m/%Y %Hh%M")
+
+
+def _tronquer(texte: str, jetons: int) -> str:
+    """Coupe `texte` à un mot près pour tenir dans `jetons` jetons estimés."""
+    if estimer_jetons(texte) <= jetons:
+        return texte
+    mots, garde = texte.split(), []
+    for mot in mots:
+        if estimer_jetons(" ".join(garde + [mot]) + " …") > jetons:
+            break
+        garde.append(mot)
+    return " ".join(garde) + " …"
+
+
+def extrait(morceaux: list, jetons: int = JETONS_EXTRAIT) -> str:
+    """
+    Texte des morceaux d'un événement dans l'ordre du document (`chunk_index`),
+    sans les en-têtes déjà rendus, limité à `jetons`.
+    """
+    textes = []
+    for doc, _, _ in sorted(morceaux, key=lambda r: r[0].metadata.get("chunk_index", 0)):
+        texte = _texte(DESCRIPTION.sub("", EN_TETES.sub("", doc.page_content)))
+        if texte and texte not in textes:
+            textes.append(texte)
+    return _tronquer(" ".join(textes), jetons) if textes else ""
+
+
+def ligne_evenement(morceaux: list, jetons_extrait: int = JETONS_EXTRAIT) -> str:
+    """« - Titre | Ville | dates | lieu : extrait », à partir des métadonnées du meilleur morceau."""
+    meta = morceaux[0][0].metadata
+    titre = _texte(meta.get("title"))
+    debut, fin = _date(meta.get("firstdate_begin")), _date(meta.get("lastdate_end"))
+    dates = f"du {debut} au {fin}" if debut and fin and debut != fin else debut or fin
+    champs = [titre, _texte(meta.get("location_city")), dates, _texte(meta.get("location_name"))]
+    ligne = "- " + " | ".join(champ for champ in champs if champ)
+    texte = extrait(morceaux, jetons_extrait)
+    if texte and texte != titre:
+        ligne = f"{ligne} : {texte}" if len(ligne) > 2 else f"- {texte}"
+    return ligne
+
+
+def assembler_contexte(resultats: list, vecteurs=None, budget_jetons: int = BUDGET_JETONS,
+                       evenements_max: int = EVENEMENTS_MAX, lambda_mmr: float = LAMBDA_MMR,
+                       jetons_extrait: int = JETONS_EXTRAIT, web: str = None) -> tuple:
+    """
+    Contexte du prompt à partir de [(Document, distance, position)] et des
+    vecteurs stockés de ces résultats (même ordre, None pour ne pas diversifier).
+    Les résultats `web` suivent les événements.
+    Retourne (texte, nombre d'événements retenus).
+    """
+    bloc_web = ""
+    if web:
+        bloc_web = _tronquer(f"Résultats web :\n{web.strip()}", budget_jetons // 2)
+        budget_jetons -= estimer_jetons(bloc_web + "\n\n")
+    groupes = regrouper_par_evenement(resultats)
+    if not groupes:
+        return bloc_web, 0
+    vecteurs_groupes = None
+    if vecteurs is not None:
+        rang = {id(resultat): i for i, resultat in enumerate(resultats)}
+        vecteurs_groupes = np.asarray(vecteurs)[[rang[id(meilleur)] for meilleur, _ in groupes]]
+    pertinences = [confiance.similarite(meilleur[1]) for meilleur, _ in groupes]
+
+    lignes, jetons = [], 0
+    for i in mmr(pertinences, vecteurs_groupes, evenements_max, lambda_mmr):
+        ligne = ligne_evenement(groupes[i][1], jetons_extrait)
+        cout = estimer_jetons(ligne + "\n")
+        if jetons + cout > budget_jetons:
+            if lignes:
+                continue
+            # Le premier événement figure toujours, tronqué au budget
+            ligne, cout = _tronquer(ligne, budget_jetons), budget_jetons
+        lignes.append(ligne)
+        jetons += cout
+    return "\n\n".join(bloc for bloc in ("\n".join(lignes), bloc_web) if bloc), len(lignes)
@@ -0,0 +1,186 @@
+"""
+Cache persistant d'embeddings, adressé par contenu.
+
+Les vecteurs sont stockés dans SQLite, clé = hash(modèle + texte normalisé).
+`CachedEmbeddings` enveloppe n'importe quel objet `Embeddings` LangChain :
+découpe sémantique, indexation et questions des utilisateurs partagent le même
+cache, et un texte déjà vu ne repart jamais vers l'API Mistral.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embedding_client import EMBEDDING_MODEL, MISTRAL_API_URL, obtenir_client
+
+DEFAULT_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "cache/embeddings.sqlite")
+DEFAULT_MAX_ENTRIES = 200_000
+# Recomptage exact de la table toutes les N insertions : le compteur local
+# ignore les lignes ajoutées par les autres processus qui partagent le fichier
+RECOMPTAGE_TOUS = 10_000
+
+
+def normaliser(texte: str) -> str:
+    """Normalisation avant hachage : Unicode NFC et espaces compactés."""
+    return " ".join(unicodedata.normalize("NFC", texte).split())
+
+
+def cle_embedding(model: str, texte: str) -> str:
+    return hashlib.sha256(f"{model}\0{normaliser(texte)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Stockage SQLite (mode WAL, partageable entre processus) des vecteurs float32.
+    L'éviction est LRU : au-delà de `max_entries`, les entrées les moins
+    récemment lues sont supprimées. Le nombre de lignes est tenu à jour à
+    chaque insertion plutôt que recompté (COUNT(*) parcourt toute la table).
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        self._recompter()
+
+    def _recompter(self):
+        self._lignes = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self._depuis_recomptage = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: list) -> dict:
+        """Retourne {clé: vecteur} pour les clés présentes et met à jour leur date d'accès."""
+        trouves = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                lot = keys[i:i + 500]
+                placeholders = ",".join("?" * len(lot))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", lot
+                ).fetchall()
+                trouves.update((k, np.frombuffer(v, dtype=np.float32).tolist()) for k, v in rows)
+            if trouves:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, k) for k in trouves]
+                )
+                self._conn.commit()
+        return trouves
+
+    def put_many(self, items: dict):
+        now = time.time()
+        with self._lock:
+            # Les clés déjà présentes sont remplacées sans ajouter de ligne
+            existantes = 0
+            keys = list(items)
+            for i in range(0, len(keys), 500):
+                lot = keys[i:i + 500]
+                placeholders = ",".join("?" * len(lot))
+                existantes += self._conn.execute(
+                    f"SELECT COUNT(*) FROM embeddings WHERE key IN ({placeholders})", lot
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                [(k, np.asarray(v, dtype=np.float32).tobytes(), now) for k, v in items.items()]
+            )
+            self._lignes += len(keys) - existantes
+            self._depuis_recomptage += len(keys)
+            if self._depuis_recomptage >= RECOMPTAGE_TOUS:
+                self._recompter()
+            if self._lignes > self.max_entries:
+                supprimees = self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    " SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                    (self._lignes - self.max_entries,)
+                ).rowcount
+                self._lignes -= supprimees
+            self._conn.commit()
+
+    def compter(self, hits: int = 0, misses: int = 0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """Enveloppe un client d'embeddings : seuls les textes absents du cache sont envoyés."""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model: str = EMBEDDING_MODEL):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model
+
+    def embed_documents(self, texts: list) -> list:
+        keys = [cle_embedding(self.model, t) for t in texts]
+        trouves = self.cache.get_many(list(dict.fromkeys(keys)))
+
+        # Un même texte manquant n'est envoyé qu'une fois par lot
+        manquants = {}
+        for key, texte in zip(keys, texts):
+            if key not in trouves:
+                manquants.setdefault(key, texte)
+        nb_manquants = sum(key not in trouves for key in keys)
+        self.cache.compter(len(keys) - nb_manquants, nb_manquants)
+
+        if manquants:
+            vecteurs = self.embeddings.embed_documents(list(manquants.values()))
+            nouveaux = dict(zip(manquants.keys(), vecteurs))
+            self.cache.put_many(nouveaux)
+            trouves.update(nouveaux)
+        return [trouves[key] for key in keys]
+
+    def embed_query(self, text: str) -> list:
+        key = cle_embedding(self.model, text)
+        trouve = self.cache.get_many([key])
+        if key in trouve:
+            self.cache.compter(hits=1)
+            return trouve[key]
+        self.cache.compter(misses=1)
+        vecteur = self.embeddings.embed_query(text)
+        self.cache.put_many({key: vecteur})
+        return vecteur
+
+
+_caches = {}
+
+
+def creer_embeddings(api_key: str, cache_path: str = DEFAULT_CACHE_PATH, **options) -> CachedEmbeddings:
+    """
+    Client `mistral-embed` partagé du processus (lots, concurrence et débit communs,
+    voir embedding_client.py), enveloppé par le cache partagé du processus.
+    `MISTRAL_API_URL` permet de viser un autre serveur compatible.
+    """
+    if cache_path not in _caches:
+        _caches[cache_path] = EmbeddingCache(cache_path)
+    options.setdefault("base_url", os.getenv("MISTRAL_API_URL", MISTRAL_API_URL))
+    return CachedEmbeddings(obtenir_client(api_key, **options), _caches[cache_path])
@@ -0,0 +1,262 @@
+"""
+Client d'embeddings Mistral partagé, par lots et sensible aux limites de débit.
+
+Remplace `MistralAIEmbeddings` (un appel séquentiel par lot de taille fixe,
+sans coordination sur les 429) derrière le cache de embedding_cache.py :
+- les textes sont regroupés en lots bornés en jetons (`jetons_par_lot`) et en
+  nombre de textes, envoyés par `concurrence` requêtes simultanées au plus
+- un seau à jetons commun (harvester.TokenBucket) limite les requêtes par
+  seconde ; un 429 met tous les appels en pause le temps indiqué par
+  `Retry-After` et divise le débit par deux, qui remonte ensuite à chaque succès
+- côté chatbot, les questions arrivées à quelques millisecondes d'intervalle
+  (`fenetre_ms`) partagent une seule requête
+
+Un même client est partagé par la découpe, l'indexation et le chatbot d'un
+processus (`obtenir_client`).
+"""
+import math
+import time
+import queue
+import random
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from langchain_core.embeddings import Embeddings
+
+from harvester import TokenBucket
+
+MISTRAL_API_URL = "https://api.mistral.ai/v1"
+EMBEDDING_MODEL = "mistral-embed"
+# Limite de l'API : 16 384 jetons par requête ; l'estimation ci-dessous est prudente
+JETONS_PAR_LOT = 8000
+TEXTES_PAR_LOT = 128
+CONCURRENCE = 4
+DEBIT = 10.0
+DEBIT_MIN = 0.5
+FENETRE_MS = 5.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+
+def estimer_jetons(texte: str) -> int:
+    """Majorant du nombre de jetons, sans tokenizer : environ 3 octets UTF-8 par jeton."""
+    return max(1, math.ceil(len(texte.encode("utf-8")) / 3))
+
+
+def former_lots(textes: list, jetons_par_lot: int = JETONS_PAR_LOT, textes_par_lot: int = TEXTES_PAR_LOT) -> list:
+    """Positions des textes regroupées en lots contigus respectant les deux budgets."""
+    lots, lot, jetons = [], [], 0
+    for position, texte in enumerate(textes):
+        cout = estimer_jetons(texte)
+        if lot and (jetons + cout > jetons_par_lot or len(lot) >= textes_par_lot):
+            lots.append(lot)
+            lot, jetons = [], 0
+        lot.append(position)
+        jetons += cout
+    if lot:
+        lots.append(lot)
+    return lots
+
+
+class LimiteurAdaptatif:
+    """
+    Débit commun à tous les appels : seau à jetons dont le débit est divisé par
+    deux à chaque 429 (au plus une fois par pause) et remonte de 10 % à chaque
+    succès, jusqu'au débit initial. `Retry-After` suspend tous les appels.
+    """
+
+    def __init__(self, debit: float = DEBIT, debit_min: float = DEBIT_MIN, capacite: float = None):
+        self.debit_max = float(debit)
+        self.debit_min = min(float(debit_min), self.debit_max) if debit > 0 else 0.0
+        self.seau = TokenBucket(debit, capacite)
+        self.limites = 0
+        self._pause_jusqua = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def debit(self) -> float:
+        return self.seau.rate
+
+    def attendre(self):
+        while True:
+            with self._lock:
+                reste = self._pause_jusqua - time.monotonic()
+            if reste <= 0:
+                break
+            time.sleep(reste)
+        self.seau.acquire()
+
+    def limite(self, retry_after: float):
+        with self._lock:
+            self.limites += 1
+            maintenant = time.monotonic()
+            if self._pause_jusqua <= maintenant and self.debit_max > 0:
+                self.seau.rate = max(self.debit_min, self.seau.rate / 2)
+            self._pause_jusqua = max(self._pause_jusqua, maintenant + retry_after)
+
+    def succes(self):
+        if self.debit_max <= 0:
+            return
+        with self._lock:
+            self.seau.rate = min(self.debit_max, self.seau.rate * 1.1)
+
+
+class ClientEmbeddings(Embeddings):
+    """Client HTTP de l'API d'embeddings Mistral (`POST /embeddings`)."""
+
+    def __init__(self, api_key: str, base_url: str = MISTRAL_API_URL, model: str = EMBEDDING_MODEL,
+                 jetons_par_lot: int = JETONS_PAR_LOT, textes_par_lot: int = TEXTES_PAR_LOT,
+                 concurrence: int = CONCURRENCE, debit: float = DEBIT, fenetre_ms: float = FENETRE_MS,
+                 max_retries: int = 6, backoff: float = 0.5, timeout: float = 30.0,
+                 session: requests.Session = None):
+        self.api_key = api_key
+        self.url = base_url.rstrip("/") + "/embeddings"
+        self.model = model
+        self.jetons_par_lot = jetons_par_lot
+        self.textes_par_lot = textes_par_lot
+        self.concurrence = concurrence
+        self.fenetre = fenetre_ms / 1000
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.limiteur = LimiteurAdaptatif(debit, capacite=max(1, concurrence))
+        self.session = session or self._creer_session(concurrence)
+        self.requetes = 0
+        self.textes = 0
+        self._compteur_lock = threading.Lock()
+        # Les requêtes simultanées passent toutes par ce pool, quel que soit l'appelant
+        self._pool = ThreadPoolExecutor(max_workers=concurrence, thread_name_prefix="embeddings")
+        self._questions = queue.Queue()
+        self._regroupeur = None
+        self._regroupeur_lock = threading.Lock()
+
+    @staticmethod
+    def _creer_session(concurrence: int) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrence, pool_maxsize=concurrence)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    # — Requêtes —
+
+    def _attente(self, tentative: int, response=None) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+        return self.backoff * (2 ** tentative) * (1 + random.random() / 2)
+
+    def _envoyer(self, textes: list) -> list:
+        """Une requête (avec reprises) pour un lot ; vecteurs dans l'ordre des textes."""
+        for tentative in range(self.max_retries + 1):
+            self.limiteur.attendre()
+            with self._compteur_lock:
+                self.requetes += 1
+            try:
+                response = self.session.post(
+                    self.url,
+                    json={"model": self.model, "input": textes},
+                    headers={"Authorization": f"Bearer {self.api_key}"},
+                    timeout=self.timeout,
+                )
+            except requests.RequestException as e:
+                if tentative == self.max_retries:
+                    raise
+                logger.warning(f"Erreur réseau de l'API d'embeddings ({e}), nouvelle tentative")
+                time.sleep(self._attente(tentative))
+                continue
+
+            if response.status_code == 429 and tentative < self.max_retries:
+                attente = self._attente(tentative, response)
+                self.limiteur.limite(attente)
+                logger.warning(f"API d'embeddings : 429, pause de {attente:.2f} s, débit {self.limiteur.debit:.1f} req/s")
+                continue
+            if response.status_code in RETRY_STATUSES and tentative < self.max_retries:
+                logger.warning(f"API d'embeddings : {response.status_code}, nouvelle tentative")
+                time.sleep(self._attente(tentative, response))
+                continue
+            response.raise_for_status()
+            self.limiteur.succes()
+            with self._compteur_lock:
+                self.textes += len(textes)
+            donnees = sorted(response.json()["data"], key=lambda d: d["index"])
+            return [d["embedding"] for d in donnees]
+
+    def embed_documents(self, texts: list) -> list:
+        """Lots bornés en jetons, envoyés en parallèle ; résultats dans l'ordre des textes."""
+        texts = list(texts)
+        lots = former_lots(texts, self.jetons_par_lot, self.textes_par_lot)
+        futures = [self._pool.submit(self._envoyer, [texts[i] for i in lot]) for lot in lots]
+        vecteurs = [None] * len(texts)
+        for lot, future in zip(lots, futures):
+            for position, vecteur in zip(lot, future.result()):
+                vecteurs[position] = vecteur
+        return vecteurs
+
+    # — Questions regroupées (chatbot) —
+
+    def embed_query(self, text: str) -> list:
+        """Vecteur d'une question ; les questions simultanées partagent une requête."""
+        future = Future()
+        self._demarrer_regroupeur()
+        self._questions.put((text, future))
+        return future.result()
+
+    def _demarrer_regroupeur(self):
+        with self._regroupeur_lock:
+            if self._regroupeur is None:
+                self._regroupeur = threading.Thread(target=self._regrouper, name="embeddings-questions", daemon=True)
+                self._regroupeur.start()
+
+    def _regrouper(self):
+        while True:
+            attentes = [self._questions.get()]
+            limite = time.monotonic() + self.fenetre
+            while len(attentes) < self.textes_par_lot:
+                reste = limite - time.monotonic()
+                if reste <= 0:
+                    break
+                try:
+                    attentes.append(self._questions.get(timeout=reste))
+                except queue.Empty:
+                    break
+            self._pool.submit(self._repondre, attentes)
+
+    def _repondre(self, attentes: list):
+        try:
+            vecteurs = self._envoyer([texte for texte, _ in attentes])
+        except Exception as e:
+            for _, future in attentes:
+                future.set_exception(e)
+            return
+        for (_, future), vecteur in zip(attentes, vecteurs):
+            future.set_result(vecteur)
+
+    def stats(self) -> dict:
+        return {
+            "requetes": self.requetes,
+            "textes": self.textes,
+            "limites_429": self.limiteur.limites,
+            "debit": self.limiteur.debit,
+        }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def obtenir_client(api_key: str, **options) -> ClientEmbeddings:
+    """Client partagé du processus pour cette clé (pool, débit et regroupement communs)."""
+    cle = (api_key, tuple(sorted(options.items())))
+    with _clients_lock:
+        if cle not in _clients:
+            _clients[cle] = ClientEmbeddings(api_key, **options)
+        return _clients[cle]
@@ -1,45 +1,302 @@
 # geo.py
+"""
+Localisation de l'utilisateur à partir de son adresse IP, sans bloquer l'affichage.
+
+`get_user_location` interrogeait ipapi.co avant le premier affichage : jusqu'à
+3 s perdues sur un délai dépassé, des réponses 429, et sur un serveur c'est
+le serveur qui était localisé. Ici :
+- une base locale de plages IPv4 triées (`python geo.py construire dbip-city-lite.csv`),
+  projetée en mémoire (mmap) et parcourue par recherche dichotomique
+- un cache à durée de vie par adresse IP du client
+- une résolution en arrière-plan (`soumettre`) : la page s'affiche tout de
+  suite et la localisation s'ajoute dès qu'elle est prête
+- en dernier recours, le service distant (`GEO_DISTANT=0` pour s'en passer),
+  par un pool de connexions, mis en pause après un 429
+"""
+import os
+import csv
+import json
+import time
+import logging
+import ipaddress
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+
+BASE_DIR = os.getenv("GEO_BASE", "geo_ip")
+SERVICE_URL = "https://ipapi.co/{ip}json/"
+DUREE_CACHE = 6 * 3600
+TAILLE_CACHE = 10000
+CONNEXIONS = 4
+TIMEOUT = 3
+# Pause du service distant après un 429 sans Retry-After
+PAUSE_429 = 60
+
+DEFAUT = {
+    "city": "Toulouse",
+    "region": "Occitanie",
+    "latitude": 43.6045,
+    "longitude": 1.444
+}
+
+logger = logging.getLogger(__name__)
+
 
-def get_user_location():
+# -------- Base locale --------
+def ip_en_entier(ip: str):
+    """Adresse IPv4 en entier ; None pour une adresse IPv6 ou invalide."""
     try:
-        response = requests.get("https://ipapi.co/json/", timeout=3)
+        adresse = ipaddress.ip_address(ip.strip())
+    except (AttributeError, ValueError):
+        return None
+    return int(adresse) if adresse.version == 4 else None
+
+
+def construire_base(chemin_csv: str, dossier: str = BASE_DIR) -> int:
+    """
+    Base locale à partir d'un CSV au format DB-IP « IP to City Lite »
+    (ip_debut, ip_fin, continent, pays, région, ville, latitude, longitude ; sans en-tête).
+    Les plages IPv6 sont ignorées. Retourne le nombre de plages.
+    """
+    debuts, fins, lieux_idx = [], [], []
+    lieux, index_lieux = [], {}
+    with open(chemin_csv, encoding="utf-8", newline="") as f:
+        for ligne in csv.reader(f):
+            if len(ligne) < 8:
+                continue
+            debut, fin = ip_en_entier(ligne[0]), ip_en_entier(ligne[1])
+            if debut is None or fin is None:
+                continue
+            try:
+                lieu = (ligne[5], ligne[4], float(ligne[6]), float(ligne[7]))
+            except ValueError:
+                continue
+            if lieu not in index_lieux:
+                index_lieux[lieu] = len(lieux)
+                lieux.append(dict(zip(("city", "region", "latitude", "longitude"), lieu)))
+            debuts.append(debut)
+            fins.append(fin)
+            lieux_idx.append(index_lieux[lieu])
+
+    ordre = np.argsort(np.asarray(debuts, dtype=np.uint32), kind="stable")
+    dossier = Path(dossier)
+    dossier.mkdir(parents=True, exist_ok=True)
+    np.save(dossier / "debuts.npy", np.asarray(debuts, dtype=np.uint32)[ordre])
+    np.save(dossier / "fins.npy", np.asarray(fins, dtype=np.uint32)[ordre])
+    np.save(dossier / "lieux_idx.npy", np.asarray(lieux_idx, dtype=np.uint32)[ordre])
+    with open(dossier / "lieux.json", "w", encoding="utf-8") as f:
+        json.dump(lieux, f, ensure_ascii=False)
+    return len(ordre)
+
+
+class BaseIP:
+    """Plages IPv4 triées, projetées en mémoire : seules les pages parcourues par la dichotomie sont lues."""
+
+    def __init__(self, dossier: str = BASE_DIR):
+        dossier = Path(dossier)
+        self.debuts = np.load(dossier / "debuts.npy", mmap_mode="r")
+        self.fins = np.load(dossier / "fins.npy", mmap_mode="r")
+        self.lieux_idx = np.load(dossier / "lieux_idx.npy", mmap_mode="r")
+        with open(dossier / "lieux.json", encoding="utf-8") as f:
+            self.lieux = json.load(f)
+
+    @classmethod
+    def charger(cls, dossier: str = BASE_DIR):
+        """Base du dossier, ou None s'il n'y en a pas."""
+        if not (Path(dossier) / "debuts.npy").exists():
+            return None
+        try:
+            return cls(dossier)
+        except (OSError, ValueError) as e:
+            logger.error(f"Base de géolocalisation illisible dans {dossier} : {e}")
+            return None
+
+    def __len__(self):
+        return len(self.debuts)
+
+    def chercher(self, ip: str):
+        """Lieu de la plage qui contient `ip`, ou None."""
+        valeur = ip_en_entier(ip)
+        if valeur is None or not len(self.debuts):
+            return None
+        i = int(np.searchsorted(self.debuts, np.uint32(valeur), side="right")) - 1
+        if i < 0 or valeur > int(self.fins[i]):
+            return None
+        return dict(self.lieux[int(self.lieux_idx[i])])
+
+
+def ip_depuis_entetes(entetes) -> str:
+    """
+    Adresse du client d'après les en-têtes HTTP (première adresse de
+    X-Forwarded-For derrière un proxy). None pour une adresse privée ou locale :
+    l'application tourne alors sur la machine de l'utilisateur.
+    """
+    entetes = entetes or {}
+    ip = (entetes.get("X-Forwarded-For") or entetes.get("X-Real-Ip") or "").split(",")[0].strip()
+    try:
+        return ip if ipaddress.ip_address(ip).is_global else None
+    except ValueError:
+        return None
+
+
+# -------- Cache --------
+class CacheTTL:
+    """Cache LRU borné dont les entrées expirent après `duree` secondes."""
+
+    def __init__(self, duree: float = DUREE_CACHE, taille: int = TAILLE_CACHE):
+        self.duree = duree
+        self.taille = taille
+        self._entrees = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cle):
+        with self._lock:
+            entree = self._entrees.get(cle)
+            if entree is None:
+                return None
+            expiration, valeur = entree
+            if expiration < time.monotonic():
+                del self._entrees[cle]
+                return None
+            self._entrees.move_to_end(cle)
+            return valeur
+
+    def set(self, cle, valeur):
+        with self._lock:
+            self._entrees[cle] = (time.monotonic() + self.duree, valeur)
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.taille:
+                self._entrees.popitem(last=False)
+
+
+# -------- Localisation --------
+class Localisateur:
+    """
+    Base locale, puis service distant ; résultats en cache par adresse IP.
+    `ip=None` désigne la machine elle-même (CLI) : seul le service distant la connaît.
+    """
+
+    def __init__(self, base: BaseIP = None, distant: bool = None, service_url: str = SERVICE_URL,
+                 duree_cache: float = DUREE_CACHE, connexions: int = CONNEXIONS, timeout: float = TIMEOUT,
+                 session: requests.Session = None):
+        self.base = base
+        self.distant = distant if distant is not None else os.getenv("GEO_DISTANT", "1") != "0"
+        self.service_url = service_url
+        self.timeout = timeout
+        self.cache = CacheTTL(duree_cache)
+        self.session = session or self._creer_session(connexions)
+        self._pause_jusqua = 0.0
+        self._pool = ThreadPoolExecutor(max_workers=connexions, thread_name_prefix="geo")
+        self._en_cours = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _creer_session(connexions: int) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=connexions, pool_maxsize=connexions)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def localiser(self, ip: str = None):
+        """Lieu de `ip` (dict city, region, latitude, longitude) ou None ; bloquant au plus `timeout`."""
+        cle = ip or "local"
+        lieu = self.cache.get(cle)
+        if lieu is not None:
+            return lieu
+        if ip and self.base is not None:
+            lieu = self.base.chercher(ip)
+        if lieu is None and self.distant:
+            lieu = self._interroger_service(ip)
+        if lieu is not None:
+            self.cache.set(cle, lieu)
+        return lieu
+
+    def soumettre(self, ip: str = None) -> Future:
+        """Résolution en arrière-plan ; une seule requête par adresse à la fois."""
+        cle = ip or "local"
+        lieu = self.cache.get(cle)
+        if lieu is not None:
+            future = Future()
+            future.set_result(lieu)
+            return future
+        with self._lock:
+            future = self._en_cours.get(cle)
+            if future is None:
+                future = self._pool.submit(self._localiser_sans_erreur, ip)
+                self._en_cours[cle] = future
+                future.add_done_callback(lambda _: self._en_cours.pop(cle, None))
+            return future
+
+    def _localiser_sans_erreur(self, ip: str):
+        try:
+            return self.localiser(ip)
+        except Exception:
+            logger.exception("Erreur lors de la géolocalisation :")
+            return None
+
+    def _interroger_service(self, ip: str):
+        if time.monotonic() < self._pause_jusqua:
+            return None
+        try:
+            response = self.session.get(self.service_url.format(ip=f"{ip}/" if ip else ""), timeout=self.timeout)
+        except requests.RequestException as e:
+            logger.warning(f"Géolocalisation distante impossible : {e}")
+            return None
         if response.status_code == 429:
-            return {
-                "city": "Toulouse",
-                "region": "Occitanie",
-                "latitude": 43.6045,
-                "longitude": 1.444
-            }
-
-        data = response.json()
-        city = data.get("city")
-        region = data.get("region")
-        latitude = data.get("latitude")
-        longitude = data.get("longitude")
-
-        if city:
-            print(f" Localisation détectée automatiquement : {city}, {region}")
-            return {
-                "city": city,
-                "region": region,
-                "latitude": latitude,
-                "longitude": longitude
-            }
-        else:
-            print(" Aucune ville détectée → Ville par défaut : Toulouse")
-            return {
-                "city": "Toulouse",
-                "region": "Occitanie",
-                "latitude": 43.6045,
-                "longitude": 1.444
-            }
-
-    except Exception as e:
-        print(" Erreur lors de la récupération de la géolocalisation :", e)
-        return {
-            "city": "Toulouse",
-            "region": "Occitanie",
-            "latitude": 43.6045,
-            "longitude": 1.444
-        }
+            try:
+                pause = float(response.headers.get("Retry-After", PAUSE_429))
+            except ValueError:
+                pause = PAUSE_429
+            self._pause_jusqua = time.monotonic() + pause
+            logger.warning(f"Géolocalisation distante limitée (429) : pause de {pause:.0f} s")
+            return None
+        try:
+            data = response.json()
+        except ValueError:
+            return None
+        if not data.get("city"):
+            return None
+        return {cle: data.get(cle) for cle in ("city", "region", "latitude", "longitude")}
+
+
+_localisateur = None
+_localisateur_lock = threading.Lock()
+
+
+def obtenir_localisateur() -> Localisateur:
+    """Localisateur partagé par le processus, avec la base locale si elle existe."""
+    global _localisateur
+    with _localisateur_lock:
+        if _localisateur is None:
+            _localisateur = Localisateur(BaseIP.charger())
+        return _localisateur
+
+
+def localiser_en_arriere_plan(ip: str = None) -> Future:
+    return obtenir_localisateur().soumettre(ip)
+
+
+def get_user_location(ip: str = None) -> dict:
+    """Lieu de `ip` (de la machine si None), Toulouse par défaut."""
+    lieu = obtenir_localisateur().localiser(ip)
+    if lieu is None:
+        logger.info("Aucune ville détectée → Ville par défaut : Toulouse")
+        return dict(DEFAUT)
+    return lieu
+
+
+if __name__ == "__main__":
+    # python geo.py construire dbip-city-lite.csv [dossier]
+    import sys
+
+    if len(sys.argv) >= 3 and sys.argv[1] == "construire":
+        nombre = construire_base(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else BASE_DIR)
+        print(f"{nombre} plages IPv4 enregistrées")
+    else:
+        print(get_user_location(sys.argv[1] if len(sys.argv) > 1 else None))
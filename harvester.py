@@ -0,0 +1,383 @@
+"""
+Collecte concurrente et reprenable des événements OpenAgenda (API Opendatasoft).
+
+Remplace la boucle séquentielle de `Openagenda.obtenir_evenements_structures` :
+une session HTTP partagée (pool de connexions), un pool de threads borné,
+un seau à jetons qui limite le nombre de requêtes par seconde, des reprises
+avec backoff sur 429/5xx et un journal des pages terminées pour reprendre
+une collecte interrompue sans tout retélécharger.
+
+Les mots-clés se recoupent (« musique », « concert », « jazz »...) : ils sont
+combinés par OR dans une même requête (clause `where`), ou exportés en un seul
+flux JSONL (`export=True`). Chaque événement n'est téléchargé qu'une fois par
+groupe de mots-clés ; les doublons restants sont écartés au fil de l'eau et
+les enregistrements sont rangés par colonnes plutôt qu'en liste de dictionnaires.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+import tracemalloc
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+BASE_URL = (
+    "https://public.opendatasoft.com/api/explore/v2.1/catalog/datasets/"
+    "evenements-publics-openagenda/records"
+)
+PAGE_SIZE = 100
+# L'API records refuse offset + limit > 10 000 : un groupe de mots-clés plus
+# gros est coupé en deux. L'export n'a pas cette limite.
+MAX_OFFSET = 10000
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+SEPARATEUR_MOTS_CLES = "|"
+
+logger = logging.getLogger(__name__)
+
+
+def url_export(base_url: str) -> str:
+    """Point d'accès d'export JSONL correspondant à l'URL `.../records`."""
+    return base_url.rsplit("/records", 1)[0] + "/exports/jsonl"
+
+
+def clause_mots_cles(keywords) -> str:
+    return " OR ".join(f'keywords_fr = "{keyword}"' for keyword in keywords)
+
+
+class TokenBucket:
+    """Seau à jetons thread-safe : `rate` requêtes/seconde, rafales jusqu'à `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                attente = (1 - self._tokens) / self.rate
+            time.sleep(attente)
+
+
+class Checkpoint:
+    """
+    Journal JSONL des pages terminées, une ligne par (mots-clés, offset).
+    Une ligne tronquée (arrêt brutal pendant l'écriture) est ignorée au chargement.
+    Seules les pages lues au chargement restent en mémoire ; les nouvelles
+    pages sont écrites dans le fichier et passent directement au tampon.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.pages = {}
+        self.totals = {}
+        if path and os.path.exists(path):
+            self._charger()
+
+    def _charger(self):
+        with open(self.path, encoding="utf-8") as f:
+            for ligne in f:
+                try:
+                    entree = json.loads(ligne)
+                except json.JSONDecodeError:
+                    continue
+                cle = (entree["keyword"], entree["offset"])
+                self.pages[cle] = entree["results"]
+                if entree.get("total_count") is not None:
+                    self.totals[entree["keyword"]] = entree["total_count"]
+
+    def get(self, keyword: str, offset: int):
+        return self.pages.get((keyword, offset))
+
+    def record(self, keyword: str, offset: int, results: list, total_count: int = None):
+        with self._lock:
+            if total_count is not None:
+                self.totals[keyword] = total_count
+            if not self.path:
+                return
+            entree = {"keyword": keyword, "offset": offset, "total_count": total_count, "results": results}
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entree, ensure_ascii=False) + "\n")
+
+
+class TamponColonnes:
+    """
+    Enregistrements rangés par colonnes (une liste par champ), dédoublonnés par `uid`.
+    Un événement déjà vu n'ajoute que ses mots-clés manquants à `keywords_fr`.
+    `colonnes()` se passe directement à `pd.DataFrame`.
+    """
+
+    def __init__(self):
+        self._colonnes = {}
+        self._lignes = {}
+        self.doublons = 0
+
+    def __len__(self):
+        return len(self._lignes)
+
+    def ajouter(self, record: dict):
+        uid = record.get("uid")
+        ligne = self._lignes.get(uid)
+        if ligne is not None:
+            self.doublons += 1
+            self._fusionner_mots_cles(ligne, record.get("keywords_fr"))
+            return
+        n = len(self._lignes)
+        self._lignes[uid] = n
+        for champ, valeur in record.items():
+            colonne = self._colonnes.get(champ)
+            if colonne is None:
+                colonne = self._colonnes[champ] = [None] * n
+            colonne.append(valeur)
+        for colonne in self._colonnes.values():
+            if len(colonne) == n:
+                colonne.append(None)
+
+    def ajouter_page(self, records: list):
+        for record in records:
+            self.ajouter(record)
+
+    def _fusionner_mots_cles(self, ligne: int, mots_cles):
+        if not isinstance(mots_cles, list):
+            return
+        colonne = self._colonnes.setdefault("keywords_fr", [None] * len(self._lignes))
+        existants = colonne[ligne] if isinstance(colonne[ligne], list) else []
+        nouveaux = [mot for mot in mots_cles if mot not in existants]
+        if nouveaux:
+            colonne[ligne] = existants + nouveaux
+
+    def colonnes(self) -> dict:
+        return self._colonnes
+
+
+class OpenAgendaHarvester:
+    """
+    Récupère tous les événements d'une liste de mots-clés en parallèle.
+
+    Les mots-clés sont regroupés par `mots_par_requete` (tous par défaut) dans
+    une clause OR. La première page de chaque groupe (offset 0) fournit aussi
+    `total_count` : il n'y a plus de requête de sondage `limit=1` séparée.
+    Avec `export=True`, chaque groupe est téléchargé en un seul flux JSONL
+    (sans journal de reprise).
+    """
+
+    def __init__(self, base_url: str = BASE_URL, location: str = "Occitanie", start_year: int = 2025,
+                 workers: int = 8, rate: float = 5.0, max_retries: int = 5, backoff: float = 0.5,
+                 timeout: float = 10.0, checkpoint_path: str = None, session: requests.Session = None,
+                 mots_par_requete: int = None, export: bool = False, mesurer_memoire: bool = False):
+        self.base_url = base_url
+        self.location = location
+        self.start_year = start_year
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.mots_par_requete = mots_par_requete
+        self.export = export
+        self.mesurer_memoire = mesurer_memoire
+        self.bucket = TokenBucket(rate)
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.session = session or self._creer_session(workers)
+        self.requetes = 0
+        self.octets = 0
+        self.pic_memoire = None
+        self.tampon = TamponColonnes()
+        self._vus = set()
+        self._doublons_flux = 0
+        self._compteur_lock = threading.Lock()
+
+    @staticmethod
+    def _creer_session(workers: int) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _params(self, keywords: list, offset: int = None) -> list:
+        params = [] if offset is None else [("limit", PAGE_SIZE), ("offset", offset), ("order_by", "uid")]
+        return params + [
+            ("where", clause_mots_cles(keywords)),
+            ("refine", f'firstdate_begin:"{self.start_year}"'),
+            ("refine", f'location_region:"{self.location}"'),
+        ]
+
+    def _attente(self, tentative: int, response=None) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+        return self.backoff * (2 ** tentative) * (1 + random.random() / 2)
+
+    def _compter(self, requetes: int = 0, octets: int = 0):
+        with self._compteur_lock:
+            self.requetes += requetes
+            self.octets += octets
+
+    def _get(self, params: list, url: str = None, stream: bool = False):
+        for tentative in range(self.max_retries + 1):
+            self.bucket.acquire()
+            self._compter(requetes=1)
+            try:
+                response = self.session.get(url or self.base_url, params=params, timeout=self.timeout, stream=stream)
+            except requests.RequestException as e:
+                if tentative == self.max_retries:
+                    raise
+                logger.warning(f"Erreur réseau OpenAgenda ({e}), nouvelle tentative")
+                time.sleep(self._attente(tentative))
+                continue
+
+            if response.status_code in RETRY_STATUSES and tentative < self.max_retries:
+                logger.warning(f"OpenAgenda a répondu {response.status_code}, nouvelle tentative")
+                time.sleep(self._attente(tentative, response))
+                continue
+            response.raise_for_status()
+            return response
+
+    def fetch_page(self, keywords: list, offset: int) -> list:
+        """Retourne les résultats d'une page, depuis le journal si elle est déjà terminée."""
+        cle = SEPARATEUR_MOTS_CLES.join(keywords)
+        results = self.checkpoint.get(cle, offset)
+        if results is not None:
+            return results
+        response = self._get(self._params(keywords, offset))
+        self._compter(octets=len(response.content))
+        data = response.json()
+        results = data.get("results", [])
+        total = data.get("total_count") if offset == 0 else None
+        self.checkpoint.record(cle, offset, results, total)
+        return results
+
+    def exporter(self, keywords: list):
+        """Lit l'export JSONL d'un groupe de mots-clés ligne par ligne, par paquets de `PAGE_SIZE` événements."""
+        response = self._get(self._params(keywords), url=url_export(self.base_url), stream=True)
+        with response:
+            page = []
+            for ligne in response.iter_lines():
+                self._compter(octets=len(ligne) + 1)
+                if ligne:
+                    page.append(json.loads(ligne))
+                if len(page) == PAGE_SIZE:
+                    yield page
+                    page = []
+            if page:
+                yield page
+
+    def _groupes(self, keywords: list) -> list:
+        taille = self.mots_par_requete or max(1, len(keywords))
+        return [list(keywords[i:i + taille]) for i in range(0, len(keywords), taille)]
+
+    def _map_borne(self, pool, fonction, elements):
+        """
+        Comme `pool.map`, dans l'ordre, mais avec au plus 2 × `workers` pages en vol :
+        un consommateur lent ne laisse pas les pages s'accumuler en mémoire.
+        """
+        en_vol = deque()
+        for element in elements:
+            en_vol.append(pool.submit(fonction, element))
+            if len(en_vol) >= 2 * self.workers:
+                yield en_vol.popleft().result()
+        while en_vol:
+            yield en_vol.popleft().result()
+
+    def _pages(self, pool, groupes: list):
+        """Premières pages, groupes trop gros coupés en deux, puis pages suivantes, dans un ordre stable."""
+        retenus = []
+        while groupes:
+            premieres = list(pool.map(lambda groupe: self.fetch_page(groupe, 0), groupes))
+            a_couper = []
+            for groupe, results in zip(groupes, premieres):
+                total = self.checkpoint.totals.get(SEPARATEUR_MOTS_CLES.join(groupe), 0)
+                if total > MAX_OFFSET and len(groupe) > 1:
+                    moitie = len(groupe) // 2
+                    a_couper += [groupe[:moitie], groupe[moitie:]]
+                    continue
+                if total > MAX_OFFSET:
+                    logger.warning(f"{total} événements pour « {groupe[0]} », seuls {MAX_OFFSET} sont accessibles")
+                retenus.append((groupe, total))
+                yield results
+            groupes = a_couper
+
+        pages = (
+            (groupe, offset)
+            for groupe, total in retenus
+            for offset in range(PAGE_SIZE, min(total, MAX_OFFSET), PAGE_SIZE)
+        )
+        yield from self._map_borne(pool, lambda page: self.fetch_page(*page), pages)
+
+    def iterer_pages(self, keywords: list):
+        """Pages brutes (listes d'enregistrements), dans un ordre stable, téléchargées au fur et à mesure."""
+        groupes = self._groupes(keywords)
+        if self.export:
+            # Un flux par groupe, lus l'un après l'autre
+            for groupe in groupes:
+                yield from self.exporter(groupe)
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                yield from self._pages(pool, groupes)
+
+    def iterer_evenements(self, keywords: list):
+        """
+        Pages d'événements jamais vus, pour un traitement en flux (pipeline.py) :
+        seuls les uid déjà rencontrés sont gardés en mémoire. Un doublon est écarté
+        sans fusion de ses mots-clés, l'événement étant déjà parti en aval.
+        """
+        for page in self.iterer_pages(keywords):
+            nouveaux = []
+            for record in page:
+                uid = record.get("uid")
+                if uid in self._vus:
+                    self._doublons_flux += 1
+                else:
+                    self._vus.add(uid)
+                    nouveaux.append(record)
+            if nouveaux:
+                yield nouveaux
+
+    def harvest(self, keywords: list) -> dict:
+        """
+        Collecte tous les événements des mots-clés donnés, sans doublon.
+        Retourne les colonnes du tampon ({champ: [valeurs]}), dans un ordre stable.
+        """
+        if self.mesurer_memoire:
+            tracemalloc.start()
+        try:
+            for page in self.iterer_pages(keywords):
+                self.tampon.ajouter_page(page)
+        finally:
+            if self.mesurer_memoire:
+                self.pic_memoire = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        logger.info(
+            "Collecte OpenAgenda : %(evenements)d événements, %(doublons)d doublons écartés, "
+            "%(requetes)d requêtes, %(octets)d octets", self.statistiques()
+        )
+        return self.tampon.colonnes()
+
+    def statistiques(self) -> dict:
+        return {
+            "evenements": len(self.tampon) + len(self._vus),
+            "doublons": self.tampon.doublons + self._doublons_flux,
+            "requetes": self.requetes,
+            "octets": self.octets,
+            "pic_memoire": self.pic_memoire,
+        }
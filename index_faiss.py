@@ -1,59 +1,292 @@
 import os
-import pickle
-from langchain_community.vectorstores import FAISS
-from langchain_mistralai import MistralAIEmbeddings
+import json
+import hashlib
+import argparse
+from datetime import datetime, timezone
+from pathlib import Path
+import faiss
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from embedding_cache import creer_embeddings
+from index_lexical import IndexLexical
+from index_store import charger_index, exiger_format_compact, sauvegarder_index
+from index_types import (
+    TYPES_INDEX, METRIQUES, creer_index, creer_vectorstore, parametres_index, supporte_suppression,
+)
 from Openagenda import (
     obtenir_evenements_structures,
     generer_documents,
     decouper_documents,
 )
 
-load_dotenv()
-api_key = os.getenv('MISTRAL_AI_KEY')
+INDEX_DIR = "faiss_index"
+MANIFEST_FILE = "manifest.json"
+
+
+def hash_document(doc) -> str:
+    """Empreinte du contenu d'un événement : texte indexé + métadonnées."""
+    contenu = json.dumps(
+        {"page_content": doc.page_content, "metadata": doc.metadata},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(contenu.encode("utf-8")).hexdigest()
+
+
+def charger_manifest(chemin_index: str) -> dict:
+    path = Path(chemin_index) / MANIFEST_FILE
+    if not path.exists():
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("events", {})
+
+
+def sauvegarder_manifest(chemin_index: str, manifest: dict):
+    path = Path(chemin_index) / MANIFEST_FILE
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "events": manifest}, f, ensure_ascii=False)
+
+
+def documents_a_indexer(df_events, now):
+    """Événements encore à venir, convertis en Documents."""
+    df_events["lastdate_end"] = pd.to_datetime(df_events["lastdate_end"], errors="coerce", utc=True)
+    df_events["firstdate_begin"] = pd.to_datetime(df_events["firstdate_begin"], errors="coerce", utc=True)
+    df_events = df_events[
+        (df_events["lastdate_end"] >= now) &
+        (df_events["description_fr"].notnull()) &
+        (df_events["title_fr"].notnull())
+    ]
+    return generer_documents(df_events)
+
+
+def charger_evenements(now):
+    """Étapes 1 et 2 : événements OpenAgenda encore à venir, convertis en Documents."""
+    print(" Récupération des événements...")
+    df_events = obtenir_evenements_structures()
+
+    print(" Filtrage et conversion en objets Documents...")
+    return documents_a_indexer(df_events, now)
+
+
+def decouper_avec_ids(documents):
+    """
+    Découpe les documents et attribue à chaque morceau un id stable `<uid>:<n>`,
+    ce qui permet de supprimer précisément les morceaux d'un événement.
+    Retourne (morceaux, ids, {uid: [ids]}).
+    """
+    chunks = decouper_documents(documents)
+    ids, ids_par_uid = attribuer_ids(chunks)
+    return chunks, ids, ids_par_uid
+
+
+def attribuer_ids(chunks):
+    """Ids `<uid>:<n>` des morceaux, dans l'ordre ; retourne (ids, {uid: [ids]})."""
+    ids, ids_par_uid = [], {}
+    for chunk in chunks:
+        uid = chunk.metadata.get("id", "")
+        chunk_ids = ids_par_uid.setdefault(uid, [])
+        chunk_ids.append(f"{uid}:{len(chunk_ids)}")
+        ids.append(chunk_ids[-1])
+    return ids, ids_par_uid
+
+
+def entree_manifest(doc, chunk_ids):
+    return {
+        "hash": hash_document(doc),
+        "chunk_ids": chunk_ids,
+        "lastdate_end": str(doc.metadata.get("lastdate_end", "")),
+    }
+
+
+def sauvegarder_indexes(vectorstore, chemin_index: str, manifest: dict):
+    """
+    Index FAISS au format compact, index lexical BM25 aligné sur ses positions et
+    manifest, publiés ensemble dans une nouvelle version de l'index.
+    """
+    def completer(dossier):
+        IndexLexical.depuis_vectorstore(vectorstore).sauvegarder(dossier)
+        sauvegarder_manifest(dossier, manifest)
+
+    sauvegarder_index(vectorstore, chemin_index, completer)
+
+
+def indexer(chunks, ids, embeddings, type_index: str = "flat", metrique: str = "l2", **params):
+    """
+    Embeddings des morceaux, puis index FAISS du type demandé (voir index_types.py),
+    entraîné sur ces mêmes vecteurs. Avec la métrique `ip`, vecteurs et requêtes
+    sont normalisés : le produit scalaire est le cosinus.
+    """
+    textes = [chunk.page_content for chunk in chunks]
+    vecteurs = np.asarray(embeddings.embed_documents(textes), dtype=np.float32)
+    if metrique == "ip":
+        faiss.normalize_L2(vecteurs)
+
+    index = creer_index(vecteurs, type_index, metrique, **params)
+    vectorstore = creer_vectorstore(embeddings, index, InMemoryDocstore(), {})
+    vectorstore.add_embeddings(
+        zip(textes, vecteurs.tolist()), metadatas=[chunk.metadata for chunk in chunks], ids=ids
+    )
+    return vectorstore
+
+
+def construire_index(documents, embeddings, chemin_index: str = INDEX_DIR,
+                     type_index: str = "flat", metrique: str = "l2", **params):
+    """Construction complète : découpe, embeddings et sauvegarde de tous les événements."""
+    print("✂ Découpage sémantique des documents...")
+    chunks, ids, ids_par_uid = decouper_avec_ids(documents)
+
+    print(f" Indexation FAISS ({type_index}, {metrique})...")
+    vectorstore = indexer(chunks, ids, embeddings, type_index, metrique, **params)
+
+    manifest = {
+        doc.metadata.get("id", ""): entree_manifest(doc, ids_par_uid.get(doc.metadata.get("id", ""), []))
+        for doc in documents
+    }
+    print(" Sauvegarde locale de l'index FAISS...")
+    sauvegarder_indexes(vectorstore, chemin_index, manifest)
+    return vectorstore, {
+        "ajoutes": len(manifest), "mis_a_jour": 0, "supprimes": 0, "inchanges": 0,
+        "embeddings_economises": 0,
+    }
+
+
+def est_termine(lastdate_end: str, now) -> bool:
+    fin = pd.to_datetime(lastdate_end, errors="coerce", utc=True)
+    return pd.notna(fin) and fin < now
+
+
+def rafraichir_index(documents, embeddings, now, chemin_index: str = INDEX_DIR):
+    """
+    Mise à jour incrémentale, clé = uid OpenAgenda + empreinte du contenu :
+    - nouveaux événements ou contenus modifiés : découpés, embeddés et ajoutés
+    - événements terminés ou plus renvoyés par l'API : supprimés de l'index et du docstore
+    - événements inchangés : laissés tels quels, sans appel d'embedding
+    """
+    manifest = charger_manifest(chemin_index)
+    if not manifest or not (Path(chemin_index) / "index.faiss").exists():
+        print(" Aucun index incrémental existant, construction complète.")
+        return construire_index(documents, embeddings, chemin_index)
+
+    exiger_format_compact(chemin_index)
+    vectorstore = charger_index(chemin_index, embeddings, mmap_vecteurs=False)
+    courants = {doc.metadata.get("id", ""): doc for doc in documents}
+
+    retires = [uid for uid in manifest if uid not in courants]
+    nouveaux, modifies, inchanges = [], [], []
+    for uid, doc in courants.items():
+        entree = manifest.get(uid)
+        if est_termine(doc.metadata.get("lastdate_end", ""), now):
+            if entree is not None:
+                retires.append(uid)
+        elif entree is None:
+            nouveaux.append(doc)
+        elif entree["hash"] != hash_document(doc):
+            modifies.append(doc)
+        else:
+            inchanges.append(uid)
+
+    ids_a_supprimer = [
+        chunk_id
+        for uid in retires + [doc.metadata.get("id", "") for doc in modifies]
+        for chunk_id in manifest[uid]["chunk_ids"]
+    ]
+    if ids_a_supprimer and not supporte_suppression(vectorstore.index):
+        # HNSW, IVF : reconstruction du même type, avec les mêmes paramètres (les embeddings viennent du cache)
+        type_index, metrique, params = parametres_index(vectorstore.index)
+        print(f" Index {type_index} : reconstruction complète pour retirer les morceaux obsolètes.")
+        a_garder = [
+            doc for doc in courants.values() if not est_termine(doc.metadata.get("lastdate_end", ""), now)
+        ]
+        try:
+            return construire_index(a_garder, embeddings, chemin_index, type_index, metrique, **params)
+        except ValueError as e:
+            # Trop peu de morceaux restants pour les paramètres d'origine (nlist, nbits)
+            print(f" {e} : paramètres recalculés pour {type_index}.")
+            return construire_index(a_garder, embeddings, chemin_index, type_index, metrique)
+    if ids_a_supprimer:
+        print(f" Suppression de {len(ids_a_supprimer)} morceaux obsolètes...")
+        vectorstore.delete(ids_a_supprimer)
+    for uid in retires:
+        manifest.pop(uid, None)
+
+    a_indexer = nouveaux + modifies
+    if a_indexer:
+        print(f"✂ Découpage sémantique de {len(a_indexer)} événements nouveaux ou modifiés...")
+        chunks, ids, ids_par_uid = decouper_avec_ids(a_indexer)
+        if chunks:
+            vectorstore.add_documents(chunks, ids=ids)
+        for doc in a_indexer:
+            uid = doc.metadata.get("id", "")
+            manifest[uid] = entree_manifest(doc, ids_par_uid.get(uid, []))
+
+    print(" Sauvegarde locale de l'index FAISS...")
+    sauvegarder_indexes(vectorstore, chemin_index, manifest)
+
+    return vectorstore, {
+        "ajoutes": len(nouveaux),
+        "mis_a_jour": len(modifies),
+        "supprimes": len(retires),
+        "inchanges": len(inchanges),
+        "embeddings_economises": sum(len(manifest[uid]["chunk_ids"]) for uid in inchanges),
+    }
 
-now = datetime.now(timezone.utc)
-print("Date actuelle:", now)
 
-# — Étape 1 : Charger les événements
-print(" Récupération des événements...")
-df_events = obtenir_evenements_structures()
-df_events["lastdate_end"] = pd.to_datetime(df_events["lastdate_end"], errors="coerce", utc=True)
-df_events["firstdate_begin"] = pd.to_datetime(df_events["firstdate_begin"], errors="coerce", utc=True)
+def main():
+    parser = argparse.ArgumentParser(description="Construction de l'index FAISS des événements OpenAgenda")
+    parser.add_argument("--incremental", action="store_true",
+                        help="ne réindexe que les événements nouveaux, modifiés ou terminés")
+    parser.add_argument("--index", default=INDEX_DIR, help="dossier de l'index FAISS")
+    parser.add_argument("--type", default="flat", choices=TYPES_INDEX,
+                        help="type d'index FAISS (construction complète, voir index_types.py)")
+    parser.add_argument("--metrique", default="l2", choices=sorted(METRIQUES),
+                        help="l2, ou ip : produit scalaire sur vecteurs normalisés (cosinus)")
+    parser.add_argument("--par-etapes", action="store_true",
+                        help="construction complète étape par étape, sans le pipeline en flux (pipeline.py)")
+    args = parser.parse_args()
 
-print(" Filtrage des événements...")
-df_events = df_events[
-    (df_events["lastdate_end"] >= now) &
-    (df_events["description_fr"].notnull()) &
-    (df_events["title_fr"].notnull())
-]
+    load_dotenv()
+    api_key = os.getenv('MISTRAL_AI_KEY')
 
-# — Étape 2 : Convertir en documents Langchain
-print(" Conversion en objets Documents...")
-documents = generer_documents(df_events)
+    now = datetime.now(timezone.utc)
+    print("Date actuelle:", now)
 
+    print(" Génération des embeddings (Mistral)...")
+    embeddings = creer_embeddings(api_key)
 
-# — Étape 3 : Découpage sémantique
-print("✂ Découpage sémantique des documents...")
-docs_chunked = decouper_documents(documents)
+    if args.incremental or args.par_etapes:
+        # — Étapes 1 et 2 : Charger les événements et les convertir en documents
+        documents = charger_evenements(now)
 
-# — Étape 4 : Initialiser les embeddings
-print(" Génération des embeddings (Mistral)...")
-embeddings = MistralAIEmbeddings(model="mistral-embed", api_key=api_key)
+        # — Étapes 3 et 4 : Découpage, indexation et sauvegarde
+        if args.incremental:
+            vectorstore, rapport = rafraichir_index(documents, embeddings, now, args.index)
+        else:
+            vectorstore, rapport = construire_index(documents, embeddings, args.index, args.type, args.metrique)
+    else:
+        # — Étapes 1 à 4 en flux : chaque page est indexée dès son arrivée
+        from pipeline import construire_index_en_flux
+        vectorstore, rapport = construire_index_en_flux(
+            embeddings, now, args.index, type_index=args.type, metrique=args.metrique
+        )
+    print(
+        f" Ajoutés: {rapport['ajoutes']} | Mis à jour: {rapport['mis_a_jour']} | "
+        f"Supprimés: {rapport['supprimes']} | Inchangés: {rapport['inchanges']} | "
+        f"Appels d'embedding économisés: {rapport['embeddings_economises']}"
+    )
+    cache = embeddings.cache.stats()
+    print(f" Cache d'embeddings : {cache['hits']} hits / {cache['misses']} misses")
 
-# — Étape 5 : Indexation dans FAISS
-print(" Indexation FAISS...")
-vectorstore = FAISS.from_documents(docs_chunked, embeddings)
+    # — Étape 5 : Test
+    query = "événements de jazz à Toulouse"
+    print(f"🔍 Recherche sémantique : {query}")
+    docs_retrieved = vectorstore.similarity_search(query, k=3)
 
-# — Étape 6 : Sauvegarde
-print(" Sauvegarde locale de l'index FAISS...")
-vectorstore.save_local("faiss_index")
+    for i, doc in enumerate(docs_retrieved, 1):
+        print(f"\n Résultat {i}:")
+        print(doc.page_content)
+        print(" Métadonnées:", doc.metadata)
 
-# — Étape 7 : Test
-query = "événements de jazz à Toulouse"
-print(f"🔍 Recherche sémantique : {query}")
-docs_retrieved = vectorstore.similarity_search(query, k=3)
 
-for i, doc in enumerate(docs_retrieved, 1):
-    print(f"\n Résultat {i}:")
-    print(doc.page_content)
-    print(" Métadonnées:", doc.metadata)
+if __name__ == "__main__":
+    main()
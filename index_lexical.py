@@ -0,0 +1,206 @@
+"""
+Index lexical BM25, construit à côté de l'index FAISS.
+
+Les embeddings denses captent mal les correspondances exactes : noms de lieux,
+codes postaux, artistes, mots-clés comme « jazz » ou « cirque ». Cet index
+inversé note les morceaux avec BM25 sur un texte normalisé comme
+`nettoyer_texte` (minuscules, ponctuation retirée), sans accents ni mots vides.
+Les documents sont les positions FAISS : les deux classements se fusionnent
+directement (voir `fusion_rrf` dans retrieval.py).
+
+Stockage dans `<index>/bm25/` : listes de postings au format CSR (indptr,
+documents, fréquences) et longueurs des documents en .npy lus en mmap,
+vocabulaire et paramètres dans lexical.json. Pas de pickle.
+"""
+import re
+import json
+import logging
+import unicodedata
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from index_store import remplacer_fichier
+
+VERSION_LEXICAL = 2
+DOSSIER_LEXICAL = "bm25"
+K1 = 1.2
+B = 0.75
+# Métadonnées ajoutées au texte de chaque morceau : un morceau sans le titre
+# ni le lieu de son événement doit quand même correspondre à ces mots
+CHAMPS_INDEXES = ("title", "location_name", "location_city", "location_postalcode", "keywords")
+# Gabarit des documents (Openagenda.generer_documents) : libellés et dates, présents
+# dans chaque morceau, ne sont pas indexés ; les métadonnées ci-dessus les remplacent
+LIBELLES = re.compile(r"\b(?:Titre|Description|Lieu|Mots-clés)\s*:")
+LIGNE_DATES = re.compile(r"\bDates\s*:.*?(?=\bMots-clés\s*:|\n|$)")
+MOTS_VIDES = frozenset("""
+a au aux avec ce ces cet cette d dans de des du elle en est et il ils j je l la le les leur lui m ma
+me mes moi mon n ne nous on ou par pas pour qu que quel quelle quelles quels qui quoi s sa se ses
+son sont sur t ta te tes toi ton tu un une vos votre vous y
+""".split())
+CARACTERES_RETIRES = re.compile(r'[^\w\s.,!?;:\'\"À-ÿ]')
+TERME = re.compile(r"\w+")
+
+
+def normaliser_texte(texte) -> str:
+    """Mêmes règles que `nettoyer_texte` pour un texte sans HTML, puis accents retirés."""
+    if not texte or not isinstance(texte, str):
+        return ""
+    texte = CARACTERES_RETIRES.sub(" ", texte.lower())
+    texte = unicodedata.normalize("NFKD", texte)
+    return " ".join("".join(c for c in texte if not unicodedata.combining(c)).split())
+
+
+def termes(texte) -> list:
+    """Termes indexés : mots normalisés, hors mots vides."""
+    return [t for t in TERME.findall(normaliser_texte(texte)) if t not in MOTS_VIDES]
+
+
+def texte_indexe(doc) -> str:
+    extras = []
+    for champ in CHAMPS_INDEXES:
+        valeur = doc.metadata.get(champ)
+        if isinstance(valeur, (list, tuple)):
+            extras.extend(map(str, valeur))
+        elif valeur:
+            extras.append(str(valeur))
+    contenu = LIBELLES.sub(" ", LIGNE_DATES.sub(" ", doc.page_content))
+    return " ".join([contenu, *extras])
+
+
+class IndexLexical:
+    """Index inversé BM25 dont les documents sont les positions FAISS."""
+
+    def __init__(self, vocabulaire: list, indptr, documents, frequences, longueurs, k1: float = K1, b: float = B):
+        self.vocabulaire = vocabulaire
+        self.ids_termes = {terme: i for i, terme in enumerate(vocabulaire)}
+        self.indptr = indptr
+        self.documents = documents
+        self.frequences = frequences
+        self.longueurs = longueurs
+        self.k1 = k1
+        self.b = b
+        self.taille = len(longueurs)
+        df = np.diff(np.asarray(indptr)).astype(np.float64)
+        self.idf = np.log1p((self.taille - df + 0.5) / (df + 0.5)).astype(np.float32)
+        self.longueur_moyenne = float(np.mean(longueurs)) if self.taille else 1.0
+
+    @classmethod
+    def construire(cls, textes) -> "IndexLexical":
+        """`textes` : un texte par position FAISS, dans l'ordre."""
+        ids_termes, vocabulaire = {}, []
+        lignes_termes, lignes_docs, lignes_tf, longueurs = [], [], [], []
+        for position, texte in enumerate(textes):
+            compte = Counter(termes(texte))
+            longueurs.append(sum(compte.values()))
+            for terme, tf in compte.items():
+                if terme not in ids_termes:
+                    ids_termes[terme] = len(vocabulaire)
+                    vocabulaire.append(terme)
+                lignes_termes.append(ids_termes[terme])
+                lignes_docs.append(position)
+                lignes_tf.append(tf)
+
+        # Postings regroupés par terme (CSR), documents croissants dans chaque liste
+        lignes_termes = np.asarray(lignes_termes, dtype=np.int64)
+        ordre = np.argsort(lignes_termes, kind="stable")
+        indptr = np.zeros(len(vocabulaire) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(lignes_termes, minlength=len(vocabulaire)), out=indptr[1:])
+        return cls(
+            vocabulaire, indptr,
+            np.asarray(lignes_docs, dtype=np.int32)[ordre],
+            np.asarray(lignes_tf, dtype=np.float32)[ordre],
+            np.asarray(longueurs, dtype=np.float32),
+        )
+
+    @classmethod
+    def depuis_vectorstore(cls, vectorstore) -> "IndexLexical":
+        ids = vectorstore.index_to_docstore_id
+        return cls.construire(
+            texte_indexe(vectorstore.docstore.search(ids[position]))
+            for position in range(vectorstore.index.ntotal)
+        )
+
+    def rechercher(self, question: str, candidats=None, k: int = 10):
+        """
+        Positions les mieux notées parmi `candidats` (toutes si None).
+        Retourne (positions, scores BM25, complet) ; `complet[i]` indique que la
+        position contient tous les termes de la question.
+        """
+        vides = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=bool)
+        mots = set(termes(question))
+        connus = sorted({self.ids_termes[m] for m in mots if m in self.ids_termes})
+        if not connus:
+            return vides
+
+        docs, contributions = [], []
+        for t in connus:
+            debut, fin = self.indptr[t], self.indptr[t + 1]
+            d = np.asarray(self.documents[debut:fin])
+            tf = np.asarray(self.frequences[debut:fin])
+            norme = self.k1 * (1 - self.b + self.b * self.longueurs[d] / self.longueur_moyenne)
+            docs.append(d)
+            contributions.append(self.idf[t] * tf * (self.k1 + 1) / (tf + norme))
+        docs = np.concatenate(docs)
+        contributions = np.concatenate(contributions)
+        if candidats is not None:
+            garder = np.isin(docs, candidats)
+            docs, contributions = docs[garder], contributions[garder]
+        if len(docs) == 0:
+            return vides
+
+        positions, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=contributions).astype(np.float32)
+        # Un mot absent du vocabulaire n'est couvert par aucun document
+        complet = np.bincount(inverse) == len(mots)
+        meilleurs = np.lexsort((positions, -scores))[:k]
+        return positions[meilleurs].astype(np.int64), scores[meilleurs], complet[meilleurs]
+
+    def sauvegarder(self, chemin_index: str):
+        dossier = Path(chemin_index) / DOSSIER_LEXICAL
+        dossier.mkdir(parents=True, exist_ok=True)
+
+        def ecrire_tableau(tableau):
+            def ecrire(chemin):
+                with open(chemin, "wb") as f:
+                    np.save(f, np.asarray(tableau))
+            return ecrire
+
+        for nom, tableau in [("indptr", self.indptr), ("documents", self.documents),
+                             ("frequences", self.frequences), ("longueurs", self.longueurs)]:
+            remplacer_fichier(dossier / f"{nom}.npy", ecrire_tableau(tableau))
+
+        def ecrire_parametres(chemin):
+            with open(chemin, "w", encoding="utf-8") as f:
+                json.dump({"version": VERSION_LEXICAL, "ntotal": self.taille, "k1": self.k1, "b": self.b,
+                           "vocabulaire": self.vocabulaire}, f, ensure_ascii=False)
+        remplacer_fichier(dossier / "lexical.json", ecrire_parametres)
+
+    @classmethod
+    def charger(cls, chemin_index: str) -> "IndexLexical":
+        dossier = Path(chemin_index) / DOSSIER_LEXICAL
+        with open(dossier / "lexical.json", encoding="utf-8") as f:
+            parametres = json.load(f)
+        if parametres.get("version") != VERSION_LEXICAL:
+            raise ValueError(f"Version d'index lexical non prise en charge : {parametres.get('version')}")
+        tableaux = {
+            nom: np.load(dossier / f"{nom}.npy", mmap_mode="r")
+            for nom in ("indptr", "documents", "frequences", "longueurs")
+        }
+        return cls(parametres["vocabulaire"], k1=parametres["k1"], b=parametres["b"], **tableaux)
+
+
+def charger_index_lexical(chemin_index: str, ntotal: int):
+    """Index lexical de `chemin_index`, ou None s'il est absent ou ne correspond plus à l'index FAISS."""
+    if not (Path(chemin_index) / DOSSIER_LEXICAL / "lexical.json").exists():
+        return None
+    try:
+        lexical = IndexLexical.charger(chemin_index)
+    except (OSError, ValueError) as e:
+        logging.error(f"Erreur de chargement de l'index lexical : {e}")
+        return None
+    if lexical.taille != ntotal:
+        logging.warning(f"Index lexical obsolète ({lexical.taille} documents pour {ntotal} vecteurs), ignoré")
+        return None
+    return lexical
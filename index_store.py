@@ -0,0 +1,390 @@
+"""
+Format compact de l'index FAISS, sans pickle.
+
+`FAISS.save_local` enregistre le docstore (textes et métadonnées complets) dans
+`index.pkl`, que chaque processus doit dépickler en entier. Ici le dossier de
+l'index contient :
+- index.faiss : les vecteurs, projetés en mémoire (`IO_FLAG_MMAP_IFC`) : les
+  processus Streamlit partagent le cache de pages au lieu d'en garder chacun une copie
+- documents.jsonl : un document par ligne (id, texte, métadonnées), dans l'ordre des positions FAISS
+- offsets.npy : début de chaque ligne de documents.jsonl ; un document n'est lu qu'à la demande
+- ids.json : id du docstore de chaque position FAISS
+- colonnes.json : métadonnées du préfiltrage (dates, ville, code postal, coordonnées)
+- format.json : nom et version du format, écrit en dernier
+
+Chaque sauvegarde écrit une nouvelle version complète du dossier, publiée
+d'un coup (voir `publier_dossier`) : le chemin de l'index est un lien symbolique
+vers la version publiée, et un processus qui lit l'ancienne version garde ses
+projections valides et un ensemble de fichiers cohérent.
+
+`EcrivainIndex` écrit le même format lot par lot (construction en flux,
+pipeline.py) : les documents sont ajoutés à documents.jsonl au fil de l'eau,
+et chaque sauvegarde partielle laisse un index chargeable et reprenable.
+Sa publication remplace l'index entier de la même façon.
+"""
+import os
+import json
+import mmap
+import shutil
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+
+from index_types import creer_vectorstore
+from retrieval import CHAMPS_METADONNEES
+
+FORMAT = "faiss-jsonl"
+VERSION_FORMAT = 1
+FORMAT_FILE = "format.json"
+# Fichiers écrits à côté de l'index par index_faiss.py (manifest) et index_lexical.py (bm25/)
+FICHIERS_ANNEXES = ("manifest.json", "bm25")
+# Projection sans copie des vecteurs des index plats. `IO_FLAG_MMAP` ne projette pas
+# ces vecteurs : sans ce drapeau (anciennes versions de faiss), pas de projection.
+IO_FLAG_MMAP_IFC = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+
+
+def exiger_format_compact(chemin_index: str):
+    """
+    Un index picklé (`FAISS.save_local`) n'est jamais dépicklé au chargement :
+    RuntimeError qui indique comment le convertir ou le reconstruire.
+    """
+    if not est_format_compact(chemin_index):
+        raise RuntimeError(
+            f"L'index de {chemin_index} n'est pas au format compact (index.pkl) : convertissez-le une fois "
+            f"avec `python index_store.py {chemin_index}` ou reconstruisez-le avec `python index_faiss.py`"
+        )
+
+
+def flags_mmap() -> int:
+    if IO_FLAG_MMAP_IFC is None:
+        raise RuntimeError(
+            f"faiss {faiss.__version__} ne sait pas projeter les vecteurs en mémoire (IO_FLAG_MMAP_IFC) : "
+            "installez la version de requirements.txt"
+        )
+    return IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+
+
+def est_format_compact(chemin_index: str) -> bool:
+    return (Path(chemin_index) / FORMAT_FILE).exists()
+
+
+class DocstoreMmap(Docstore, AddableMixin):
+    """
+    Docstore en lecture seule sur documents.jsonl projeté en mémoire.
+    Les ajouts et suppressions (mise à jour incrémentale) sont gardés à part
+    jusqu'à la prochaine sauvegarde.
+    """
+
+    def __init__(self, chemin_index: str, ids: list, colonnes: dict = None):
+        dossier = Path(chemin_index)
+        self._positions = {docstore_id: position for position, docstore_id in enumerate(ids)}
+        self._offsets = np.load(dossier / "offsets.npy", mmap_mode="r")
+        with open(dossier / "documents.jsonl", "rb") as f:
+            taille = os.fstat(f.fileno()).st_size
+            self._donnees = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if taille else b""
+        self._colonnes = colonnes
+        self._ajouts = {}
+        self._supprimes = set()
+
+    def __len__(self):
+        return len(self._positions) - len(self._supprimes) + len(self._ajouts)
+
+    def __contains__(self, docstore_id):
+        return docstore_id in self._ajouts or (
+            docstore_id in self._positions and docstore_id not in self._supprimes
+        )
+
+    def search(self, search: str):
+        if search in self._ajouts:
+            return self._ajouts[search]
+        if search not in self:
+            return f"ID {search} not found."
+        position = self._positions[search]
+        ligne = self._donnees[int(self._offsets[position]):int(self._offsets[position + 1])]
+        enregistrement = json.loads(ligne)
+        return Document(page_content=enregistrement["page_content"], metadata=enregistrement["metadata"])
+
+    def add(self, texts: dict) -> None:
+        existants = [docstore_id for docstore_id in texts if docstore_id in self]
+        if existants:
+            raise ValueError(f"Tried to add ids that already exist: {existants}")
+        self._ajouts.update(texts)
+
+    def delete(self, ids: list) -> None:
+        manquants = [docstore_id for docstore_id in ids if docstore_id not in self]
+        if manquants:
+            raise ValueError(f"Tried to delete ids that does not exist: {manquants}")
+        for docstore_id in ids:
+            if self._ajouts.pop(docstore_id, None) is None:
+                self._supprimes.add(docstore_id)
+
+    @property
+    def colonnes(self):
+        """Colonnes de préfiltrage alignées sur l'index, tant que le docstore n'a pas été modifié."""
+        if self._ajouts or self._supprimes:
+            return None
+        return self._colonnes
+
+
+def remplacer_fichier(chemin: Path, ecrire):
+    """Écrit `chemin` à côté puis le remplace d'un coup."""
+    temporaire = chemin.with_name(chemin.name + ".tmp")
+    ecrire(temporaire)
+    os.replace(temporaire, chemin)
+
+
+def publier_dossier(source: Path, chemin_index: str):
+    """
+    Remplace l'index `chemin_index` par le dossier complet `source` (index lexical
+    et manifest compris), en une opération : `chemin_index` est un lien symbolique
+    vers `.<nom>.versions/<n>`, remplacé par `os.replace`. Un lecteur voit
+    l'ancienne version ou la nouvelle, jamais un mélange des deux. La version
+    précédente est gardée pour les processus qui ne l'ont pas encore quittée.
+    """
+    lien = Path(chemin_index)
+    versions = lien.with_name(f".{lien.name}.versions")
+    versions.mkdir(parents=True, exist_ok=True)
+    numeros = [int(p.name) for p in versions.iterdir() if p.name.isdigit()]
+    numero = max(numeros, default=0) + 1
+    if lien.is_dir() and not lien.is_symlink():
+        # Index publié avant le passage aux versions : il devient la version précédente
+        os.replace(lien, versions / str(numero))
+        numero += 1
+    os.replace(source, versions / str(numero))
+
+    temporaire = lien.with_name(f".{lien.name}.lien")
+    temporaire.unlink(missing_ok=True)
+    os.symlink(Path(versions.name) / str(numero), temporaire, target_is_directory=True)
+    os.replace(temporaire, lien)
+    for ancienne in versions.iterdir():
+        if ancienne.name.isdigit() and int(ancienne.name) < numero - 1:
+            shutil.rmtree(ancienne, ignore_errors=True)
+
+
+def ligne_document(docstore_id: str, doc) -> bytes:
+    """Ligne de documents.jsonl pour `doc`."""
+    return json.dumps(
+        {"id": docstore_id, "page_content": doc.page_content, "metadata": doc.metadata},
+        ensure_ascii=False, default=str
+    ).encode("utf-8") + b"\n"
+
+
+def ecrire_json(contenu):
+    def ecrire(chemin):
+        with open(chemin, "w", encoding="utf-8") as f:
+            json.dump(contenu, f, ensure_ascii=False, default=str)
+    return ecrire
+
+
+def ecrire_offsets(offsets):
+    def ecrire(chemin):
+        with open(chemin, "wb") as f:
+            np.save(f, np.asarray(offsets, dtype=np.uint64))
+    return ecrire
+
+
+def description_format(index, **extras) -> dict:
+    return {"format": FORMAT, "version": VERSION_FORMAT, "ntotal": index.ntotal, "dimension": index.d, **extras}
+
+
+def sauvegarder_index(vectorstore, chemin_index: str, completer=None):
+    """
+    Enregistre `vectorstore` (FAISS LangChain) au format compact dans une nouvelle
+    version de `chemin_index`, publiée d'un coup (voir `publier_dossier`).
+    `completer(dossier)` y ajoute auparavant ses fichiers (index lexical, manifest).
+    """
+    lien = Path(chemin_index)
+    lien.parent.mkdir(parents=True, exist_ok=True)
+    dossier = Path(tempfile.mkdtemp(prefix=f".{lien.name}.", dir=lien.parent))
+    try:
+        os.chmod(dossier, 0o755)
+        ecrire_index(vectorstore, dossier)
+        if completer is not None:
+            completer(str(dossier))
+    except BaseException:
+        shutil.rmtree(dossier, ignore_errors=True)
+        raise
+    publier_dossier(dossier, chemin_index)
+
+
+def ecrire_index(vectorstore, dossier: Path):
+    """Fichiers du format compact de `vectorstore` dans `dossier`."""
+    ntotal = vectorstore.index.ntotal
+    ids = [vectorstore.index_to_docstore_id[position] for position in range(ntotal)]
+    colonnes = {champ: [] for champ in CHAMPS_METADONNEES}
+    offsets = np.zeros(ntotal + 1, dtype=np.uint64)
+
+    def ecrire_documents(chemin):
+        with open(chemin, "wb") as f:
+            for position, docstore_id in enumerate(ids):
+                doc = vectorstore.docstore.search(docstore_id)
+                if not isinstance(doc, Document):
+                    raise ValueError(f"Document {docstore_id} absent du docstore")
+                for champ in CHAMPS_METADONNEES:
+                    colonnes[champ].append(doc.metadata.get(champ))
+                ligne = ligne_document(docstore_id, doc)
+                f.write(ligne)
+                offsets[position + 1] = offsets[position] + len(ligne)
+
+    remplacer_fichier(dossier / "documents.jsonl", ecrire_documents)
+    remplacer_fichier(dossier / "offsets.npy", ecrire_offsets(offsets))
+    remplacer_fichier(dossier / "ids.json", ecrire_json(ids))
+    remplacer_fichier(dossier / "colonnes.json", ecrire_json(colonnes))
+    remplacer_fichier(dossier / "index.faiss", lambda chemin: faiss.write_index(vectorstore.index, str(chemin)))
+    remplacer_fichier(dossier / FORMAT_FILE, ecrire_json(description_format(vectorstore.index)))
+
+
+class EcrivainIndex:
+    """
+    Écriture du format compact par lots, dans un dossier de travail.
+
+    Seuls les vecteurs (index FAISS), les ids, les offsets et les colonnes de
+    préfiltrage restent en mémoire ; textes et métadonnées partent directement
+    dans documents.jsonl. `sauvegarder` écrit un index partiel complet
+    (format.json marqué `partiel`, écrit en dernier) ; un nouvel écrivain sur
+    le même dossier reprend à cette sauvegarde.
+    `publier` remplace d'un coup l'index final par le dossier de travail.
+    """
+
+    def __init__(self, chemin_travail: str):
+        self.dossier = Path(chemin_travail)
+        self.dossier.mkdir(parents=True, exist_ok=True)
+        self.index = None
+        self.ids = []
+        self.colonnes = {champ: [] for champ in CHAMPS_METADONNEES}
+        self.offsets = [0]
+        if (self.dossier / FORMAT_FILE).exists():
+            try:
+                self._reprendre()
+            except (OSError, ValueError, RuntimeError) as e:
+                logging.warning(f"Index partiel inutilisable ({e}), construction reprise de zéro")
+                shutil.rmtree(self.dossier)
+                self.dossier.mkdir(parents=True)
+        self._documents = open(self.dossier / "documents.jsonl", "ab")
+        self._documents.truncate(self.offsets[-1])
+
+    def _reprendre(self):
+        with open(self.dossier / FORMAT_FILE, encoding="utf-8") as f:
+            description = json.load(f)
+        index = faiss.read_index(str(self.dossier / "index.faiss"))
+        with open(self.dossier / "ids.json", encoding="utf-8") as f:
+            ids = json.load(f)
+        with open(self.dossier / "colonnes.json", encoding="utf-8") as f:
+            colonnes = json.load(f)
+        offsets = np.load(self.dossier / "offsets.npy").tolist()
+        ntotal = description.get("ntotal")
+        if not (index.ntotal == len(ids) == len(offsets) - 1 == ntotal):
+            raise ValueError(f"sauvegarde interrompue ({index.ntotal} vecteurs, {len(ids)} ids, {ntotal} attendus)")
+        if (self.dossier / "documents.jsonl").stat().st_size < offsets[-1]:
+            raise ValueError("documents.jsonl tronqué")
+        self.index, self.ids, self.colonnes, self.offsets = index, ids, colonnes, offsets
+
+    def __len__(self):
+        return len(self.ids)
+
+    def ajouter(self, index, vecteurs: np.ndarray, documents: list, ids: list):
+        """Ajoute un lot ; `index` (vide, déjà entraîné) n'est utilisé qu'au premier lot."""
+        if self.index is None:
+            self.index = index
+        self.index.add(np.ascontiguousarray(vecteurs, dtype=np.float32))
+        for docstore_id, doc in zip(ids, documents):
+            ligne = ligne_document(docstore_id, doc)
+            self._documents.write(ligne)
+            self.offsets.append(self.offsets[-1] + len(ligne))
+            for champ in CHAMPS_METADONNEES:
+                self.colonnes[champ].append(doc.metadata.get(champ))
+        self.ids.extend(ids)
+
+    def sauvegarder(self, partiel: bool = True):
+        """Index partiel chargeable : documents d'abord, format.json en dernier."""
+        if self.index is None:
+            return
+        self._documents.flush()
+        os.fsync(self._documents.fileno())
+        remplacer_fichier(self.dossier / "offsets.npy", ecrire_offsets(self.offsets))
+        remplacer_fichier(self.dossier / "ids.json", ecrire_json(self.ids))
+        remplacer_fichier(self.dossier / "colonnes.json", ecrire_json(self.colonnes))
+        remplacer_fichier(self.dossier / "index.faiss", lambda chemin: faiss.write_index(self.index, str(chemin)))
+        remplacer_fichier(self.dossier / FORMAT_FILE, ecrire_json(
+            description_format(self.index, partiel=partiel)
+        ))
+
+    def publier(self, chemin_index: str, completer=None):
+        """
+        Sauvegarde finale, puis publication du dossier de travail à la place de
+        l'index de `chemin_index` (voir `publier_dossier`). `completer(dossier)`
+        ajoute auparavant ses fichiers au dossier de travail (index lexical, manifest).
+        """
+        self.sauvegarder(partiel=False)
+        self._documents.close()
+        if self.index is None:
+            raise ValueError("Aucun document indexé")
+        if completer is not None:
+            completer(str(self.dossier))
+        publier_dossier(self.dossier, chemin_index)
+
+    def fermer(self):
+        self._documents.close()
+
+
+def charger_index(chemin_index: str, embeddings, mmap_vecteurs: bool = True):
+    """
+    Charge un index au format compact, sans pickle. Avec `mmap_vecteurs`, les vecteurs
+    restent dans le fichier (lecture seule, RuntimeError si faiss ne sait pas les
+    projeter) ; sans, ils sont copiés en mémoire et l'index peut être modifié
+    (mise à jour incrémentale).
+    """
+    dossier = Path(chemin_index)
+    with open(dossier / FORMAT_FILE, encoding="utf-8") as f:
+        description = json.load(f)
+    if description.get("format") != FORMAT or description.get("version") != VERSION_FORMAT:
+        raise ValueError(
+            f"Format d'index non pris en charge : {description.get('format')} v{description.get('version')}"
+        )
+
+    index = faiss.read_index(str(dossier / "index.faiss"), flags_mmap() if mmap_vecteurs else 0)
+    with open(dossier / "ids.json", encoding="utf-8") as f:
+        ids = json.load(f)
+    with open(dossier / "colonnes.json", encoding="utf-8") as f:
+        colonnes = json.load(f)
+    if len(ids) != index.ntotal:
+        raise ValueError(f"Index incohérent : {index.ntotal} vecteurs pour {len(ids)} documents")
+
+    return creer_vectorstore(embeddings, index, DocstoreMmap(chemin_index, ids, colonnes), dict(enumerate(ids)))
+
+
+def convertir(chemin_index: str):
+    """
+    Réécrit au format compact un index enregistré par `FAISS.save_local` (dépickle une
+    dernière fois). Le manifest et l'index lexical, aux mêmes positions, sont repris.
+    """
+    vectorstore = FAISS.load_local(chemin_index, None, allow_dangerous_deserialization=True)
+
+    def reprendre_annexes(dossier):
+        for nom in FICHIERS_ANNEXES:
+            source = Path(chemin_index) / nom
+            if source.is_dir():
+                shutil.copytree(source, Path(dossier) / nom)
+            elif source.exists():
+                shutil.copy2(source, Path(dossier) / nom)
+
+    sauvegarder_index(vectorstore, chemin_index, reprendre_annexes)
+    return vectorstore.index.ntotal
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversion d'un index FAISS picklé au format compact")
+    parser.add_argument("index", nargs="?", default="faiss_index", help="dossier de l'index FAISS")
+    args = parser.parse_args()
+    print(f" {convertir(args.index)} documents convertis dans {args.index}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Types d'index FAISS pour les événements.
+
+- flat : recherche exacte (par défaut), coût linéaire en nombre de morceaux
+- ivf : vecteurs répartis en `nlist` listes (k-means) ; `nprobe` listes parcourues par requête
+- hnsw : graphe de voisinage, sans entraînement ; ne permet pas de supprimer des vecteurs
+- ivfpq : IVF + quantification produit (`m` sous-vecteurs codés sur `nbits` bits)
+- sq8 : quantification scalaire sur 8 bits, parcours exhaustif, index 4 fois plus petit
+
+Métrique `ip` : produit scalaire sur vecteurs normalisés, c'est-à-dire le cosinus.
+Les scores sont reconvertis en distance L2 au carré équivalente (2 - 2·cos) par
+`distances_l2`, si bien que le reste du pipeline (confiance.py, spatial.py) ne
+dépend pas de la métrique.
+"""
+import math
+import threading
+import warnings
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+TYPES_INDEX = ("flat", "ivf", "hnsw", "ivfpq", "sq8")
+# Types dont l'entraînement dépend des vecteurs (k-means, quantification)
+TYPES_ENTRAINES = ("ivf", "ivfpq", "sq8")
+METRIQUES = {"l2": faiss.METRIC_L2, "ip": faiss.METRIC_INNER_PRODUCT}
+# k-means de FAISS : au moins 39 points d'entraînement par centroïde
+POINTS_PAR_LISTE = 39
+
+# La table position -> liste des index IVF est créée une fois, au premier besoin
+_lock_direct_map = threading.Lock()
+
+
+def parametres_par_defaut(type_index: str, n: int, dimension: int) -> dict:
+    """Paramètres raisonnables pour `n` vecteurs de dimension `dimension`."""
+    nlist = max(1, min(int(4 * math.sqrt(n)), n // POINTS_PAR_LISTE))
+    if type_index == "ivf":
+        return {"nlist": nlist, "nprobe": min(nlist, 16)}
+    if type_index == "hnsw":
+        return {"m": 32, "ef_construction": 200, "ef_search": 64}
+    if type_index == "ivfpq":
+        # Sous-vecteurs d'au moins 4 dimensions, 64 au plus (16 dimensions pour mistral-embed)
+        m = max(d for d in range(1, max(1, min(64, dimension // 4)) + 1) if dimension % d == 0)
+        return {"nlist": nlist, "nprobe": min(nlist, 16), "m": m, "nbits": 8}
+    return {}
+
+
+def description_factory(type_index: str, **params) -> str:
+    """Chaîne `faiss.index_factory` du type demandé."""
+    if type_index == "flat":
+        return "Flat"
+    if type_index == "ivf":
+        return f"IVF{params['nlist']},Flat"
+    if type_index == "hnsw":
+        return f"HNSW{params['m']}"
+    if type_index == "ivfpq":
+        return f"IVF{params['nlist']},PQ{params['m']}x{params['nbits']}"
+    if type_index == "sq8":
+        return "SQ8"
+    raise ValueError(f"Type d'index inconnu : {type_index} (attendu : {', '.join(TYPES_INDEX)})")
+
+
+def creer_index(vecteurs_entrainement, type_index: str = "flat", metrique: str = "l2", **params):
+    """
+    Index vide du type demandé, entraîné sur `vecteurs_entrainement` si nécessaire
+    (déjà normalisés pour la métrique `ip`). Les paramètres absents prennent
+    les valeurs de `parametres_par_defaut`.
+    """
+    x = np.ascontiguousarray(vecteurs_entrainement, dtype=np.float32)
+    n, dimension = x.shape
+    params = {**parametres_par_defaut(type_index, n, dimension), **params}
+    index = faiss.index_factory(dimension, description_factory(type_index, **params), METRIQUES[metrique])
+
+    if type_index == "hnsw":
+        index.hnsw.efConstruction = params["ef_construction"]
+        index.hnsw.efSearch = params["ef_search"]
+    if isinstance(index, faiss.IndexIVFPQ):
+        # Entraînement « polysémique » activé par index_factory : très lent, et inutile
+        # sans recherche par distance de Hamming (polysemous_ht)
+        index.do_polysemous_training = False
+    if not index.is_trained:
+        minimum = max(params.get("nlist", 1), 2 ** params.get("nbits", 0))
+        if n < minimum:
+            raise ValueError(f"Index {type_index} : {n} vecteurs d'entraînement, au moins {minimum} nécessaires")
+        index.train(x)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = params["nprobe"]
+    return index
+
+
+def est_produit_scalaire(index) -> bool:
+    return index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+
+def distances_l2(index, distances: np.ndarray) -> np.ndarray:
+    """Distances L2 au carré, quelle que soit la métrique de l'index (vecteurs normalisés)."""
+    return 2 - 2 * distances if est_produit_scalaire(index) else distances
+
+
+def creer_vectorstore(embeddings, index, docstore, index_to_docstore_id: dict) -> FAISS:
+    """
+    Vectorstore LangChain sur `index` ; avec la métrique `ip`, les vecteurs ajoutés
+    et les requêtes sont normalisés.
+    """
+    produit_scalaire = est_produit_scalaire(index)
+    with warnings.catch_warnings():
+        # LangChain prévient que la normalisation ne concerne que L2 : elle est voulue ici
+        warnings.filterwarnings("ignore", message="Normalizing L2 is not applicable")
+        return FAISS(
+            embeddings, index, docstore, index_to_docstore_id,
+            normalize_L2=produit_scalaire,
+            distance_strategy=(DistanceStrategy.MAX_INNER_PRODUCT if produit_scalaire
+                               else DistanceStrategy.EUCLIDEAN_DISTANCE),
+        )
+
+
+def supporte_suppression(index) -> bool:
+    """
+    Suppression en place compatible avec le vectorstore, qui renumérote ses
+    positions après `delete`. HNSW ne sait pas retirer de vecteurs, et un index
+    IVF les retire sans renuméroter les suivants : une mise à jour avec
+    suppressions reconstruit alors l'index.
+    """
+    return not isinstance(index, faiss.IndexHNSW) and faiss.try_extract_index_ivf(index) is None
+
+
+def parametres_index(index) -> tuple:
+    """
+    (type, métrique, paramètres) d'un index existant, pour le reconstruire à l'identique
+    avec `creer_index`.
+    """
+    metrique = "ip" if est_produit_scalaire(index) else "l2"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw", metrique, {
+            "m": index.hnsw.nb_neighbors(1), "ef_construction": index.hnsw.efConstruction,
+            "ef_search": index.hnsw.efSearch,
+        }
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq", metrique, {
+            "nlist": index.nlist, "nprobe": index.nprobe, "m": index.pq.M, "nbits": index.pq.nbits,
+        }
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return "ivf", metrique, {"nlist": ivf.nlist, "nprobe": ivf.nprobe}
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "sq8", metrique, {}
+    return "flat", metrique, {}
+
+
+def parametres_selection(index, selecteur) -> faiss.SearchParameters:
+    """Paramètres de recherche restreinte à `selecteur`, avec le nprobe / efSearch de l'index."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selecteur, nprobe=ivf.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selecteur, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selecteur)
+
+
+def vecteurs_stockes(index, positions) -> np.ndarray:
+    """
+    Vecteurs stockés aux `positions` (approchés pour ivfpq et sq8, normalisés avec
+    la métrique `ip`), sans recalculer d'embedding. None si l'index ne sait pas
+    les relire.
+    """
+    positions = np.ascontiguousarray(positions, dtype=np.int64)
+    try:
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+            with _lock_direct_map:
+                if ivf.direct_map.type == faiss.DirectMap.NoMap:
+                    ivf.make_direct_map()
+        return index.reconstruct_batch(positions)
+    except RuntimeError:
+        return None
+
+
+def taille_octets(index) -> int:
+    """Taille de l'index sérialisé, proche de sa place en mémoire."""
+    return int(faiss.serialize_index(index).nbytes)
@@ -0,0 +1,129 @@
+"""
+Journal structuré des conversations, écrit en arrière-plan.
+
+Les réponses (session, ville, recours au web, cache, durée de chaque étape,
+taille du prompt) et les retours des utilisateurs sont déposés dans une file
+sans attendre le disque ; un thread les écrit par lots dans des fichiers JSONL :
+- un lot part dès `taille_lot` événements, ou toutes les `intervalle` secondes
+- un fichier par jour et par processus (pas d'écritures entremêlées entre les
+  processus Streamlit), qui passe au suivant au-delà de `taille_max` octets
+- si la file est pleine, l'événement est compté dans `perdus` plutôt que de
+  ralentir la réponse
+- `fermer()` (appelé aussi à la sortie du processus) écrit ce qui reste
+
+    pd.read_json("logs/conversations/conversations_2025-07-01_1234.jsonl", lines=True)
+"""
+import os
+import json
+import queue
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, date
+
+DOSSIER = "logs/conversations"
+TAILLE_LOT = 100
+INTERVALLE = 2.0
+TAILLE_MAX = 50 * 2 ** 20
+TAILLE_FILE = 10000
+
+FIN = object()
+
+
+class JournalConversations:
+    """File d'événements et thread d'écriture, démarré au premier événement."""
+
+    def __init__(self, dossier: str = DOSSIER, taille_lot: int = TAILLE_LOT, intervalle: float = INTERVALLE,
+                 taille_max: int = TAILLE_MAX, taille_file: int = TAILLE_FILE):
+        self.dossier = dossier
+        self.taille_lot = taille_lot
+        self.intervalle = intervalle
+        self.taille_max = taille_max
+        self.ecrits = 0
+        self.perdus = 0
+        self.fichiers = []
+        self._file = queue.Queue(maxsize=taille_file)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._ferme = False
+        self._jour = None
+        self._numero = 0
+
+    def enregistrer(self, evenement: dict):
+        """Dépose l'événement (horodaté) sans bloquer ; ignoré une fois le journal fermé."""
+        if self._ferme:
+            return
+        self._demarrer()
+        evenement = {"horodatage": datetime.now().isoformat(timespec="milliseconds"), **evenement}
+        try:
+            self._file.put_nowait(evenement)
+        except queue.Full:
+            self.perdus += 1
+
+    def _demarrer(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._boucle, name="journal-conversations", daemon=True)
+                self._thread.start()
+                atexit.register(self.fermer)
+
+    # — Thread d'écriture —
+
+    def _boucle(self):
+        lot = []
+        limite = time.monotonic() + self.intervalle
+        while True:
+            try:
+                evenement = self._file.get(timeout=max(0.0, limite - time.monotonic()))
+            except queue.Empty:
+                evenement = None
+            if evenement is FIN:
+                break
+            if evenement is not None:
+                lot.append(evenement)
+            if len(lot) >= self.taille_lot or time.monotonic() >= limite:
+                self._ecrire(lot)
+                lot = []
+                limite = time.monotonic() + self.intervalle
+        self._ecrire(lot)
+
+    def _chemin(self) -> str:
+        """Fichier du jour pour ce processus ; numéro suivant quand il dépasse `taille_max`."""
+        jour = date.today().isoformat()
+        if jour != self._jour:
+            self._jour, self._numero = jour, 0
+        while True:
+            suffixe = f".{self._numero}" if self._numero else ""
+            chemin = os.path.join(self.dossier, f"conversations_{jour}_{os.getpid()}{suffixe}.jsonl")
+            if not os.path.exists(chemin) or os.path.getsize(chemin) < self.taille_max:
+                return chemin
+            self._numero += 1
+
+    def _ecrire(self, lot: list):
+        if not lot:
+            return
+        lignes = "".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in lot)
+        try:
+            os.makedirs(self.dossier, exist_ok=True)
+            chemin = self._chemin()
+            with open(chemin, "a", encoding="utf-8") as f:
+                f.write(lignes)
+        except OSError as e:
+            self.perdus += len(lot)
+            logging.error(f"Écriture du journal des conversations impossible : {e}")
+            return
+        if chemin not in self.fichiers:
+            self.fichiers.append(chemin)
+        self.ecrits += len(lot)
+
+    def fermer(self, timeout: float = 5.0):
+        """Écrit les événements en attente et arrête le thread ; les suivants sont ignorés."""
+        with self._lock:
+            if self._ferme:
+                return
+            self._ferme = True
+            thread = self._thread
+        if thread is not None:
+            self._file.put(FIN)
+            thread.join(timeout)
@@ -0,0 +1,384 @@
+"""
+Mesures de latence du chatbot, étape par étape.
+
+Chaque réponse est découpée en étapes chronométrées (`Metriques.etape`) :
+préparation, embedding, cache, reformulation, recherche, web, génération et
+total. Les durées sont agrégées par étape sur une fenêtre glissante
+(p50/p95/p99, nombre et somme) ; des compteurs suivent les succès du cache,
+les décisions de recours au web et les erreurs, et la taille des prompts est
+estimée en jetons. Les mêmes mesures sont aussi relevées pour chaque réponse
+(`releve`), pour le journal des conversations.
+
+Exports, activés par variables d'environnement (rien n'est démarré à l'import) :
+- `CHATBOT_METRIQUES_PORT` : point d'accès HTTP, `/metrics` au format texte
+  Prometheus et `/metrics.json`
+- `CHATBOT_METRIQUES_JSON` : fichier JSON réécrit toutes les
+  `CHATBOT_METRIQUES_INTERVALLE` secondes (60 par défaut) et à l'arrêt
+- `CHATBOT_PROFILAGE` : fraction des réponses profilées (cProfile, ou
+  pyinstrument avec `CHATBOT_PROFILEUR=pyinstrument`), dans logs/profils/
+
+    python metriques.py logs/metriques.json    # étapes triées par temps cumulé
+"""
+import os
+import json
+import time
+import atexit
+import random
+import logging
+import argparse
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.embeddings import Embeddings
+
+DUREES = "chatbot_etape_secondes"
+PROMPT_JETONS = "chatbot_prompt_jetons"
+CACHE = "chatbot_cache_total"
+DECISIONS = "chatbot_decision_total"
+REFORMULATIONS = "chatbot_reformulation_total"
+REPONSES = "chatbot_reponses_total"
+ERREURS = "chatbot_erreurs_total"
+
+# Observations gardées par série pour les quantiles
+FENETRE = 1024
+QUANTILES = (0.5, 0.95, 0.99)
+INTERVALLE_JSON = 60.0
+DOSSIER_PROFILS = "logs/profils"
+
+# Relevé de la réponse en cours : suit la requête dans les threads (`_en_thread`)
+_releve = contextvars.ContextVar("releve", default=None)
+
+
+def nom_serie(nom: str, labels: tuple) -> str:
+    """`nom{cle="valeur",...}`, comme dans le format texte Prometheus."""
+    if not labels:
+        return nom
+    return nom + "{" + ",".join(f'{cle}="{valeur}"' for cle, valeur in labels) + "}"
+
+
+@contextmanager
+def releve():
+    """
+    Relevé des mesures d'une réponse : `durees` par étape (en secondes) et
+    valeurs notées pendant la réponse (`noter`).
+    """
+    mesures = {"durees": {}}
+    jeton = _releve.set(mesures)
+    try:
+        yield mesures
+    finally:
+        try:
+            _releve.reset(jeton)
+        except ValueError:
+            # Générateur asynchrone fermé depuis un autre contexte : rien à restaurer
+            pass
+
+
+def noter(cle: str, valeur):
+    """Ajoute `cle` au relevé de la réponse en cours, s'il y en a un."""
+    mesures = _releve.get()
+    if mesures is not None:
+        mesures[cle] = valeur
+
+
+class Distribution:
+    """Nombre, somme et maximum depuis le démarrage ; quantiles sur les `fenetre` dernières valeurs."""
+
+    def __init__(self, fenetre: int = FENETRE):
+        self.valeurs = deque(maxlen=fenetre)
+        self.nombre = 0
+        self.somme = 0.0
+        self.maximum = 0.0
+
+    def observer(self, valeur: float):
+        self.valeurs.append(valeur)
+        self.nombre += 1
+        self.somme += valeur
+        self.maximum = max(self.maximum, valeur)
+
+    def quantiles(self, quantiles=QUANTILES) -> dict:
+        if not self.valeurs:
+            return {q: 0.0 for q in quantiles}
+        triees = sorted(self.valeurs)
+        # Rang le plus proche : p99 de 100 valeurs = 99e valeur
+        return {q: triees[min(len(triees) - 1, max(0, int(q * len(triees) + 0.5) - 1))] for q in quantiles}
+
+    def resume(self) -> dict:
+        resume = {"n": self.nombre, "somme": self.somme, "max": self.maximum}
+        resume.update({f"p{round(q * 100)}": v for q, v in self.quantiles().items()})
+        return resume
+
+
+class Metriques:
+    """Compteurs et distributions étiquetés, partagés par les threads d'un moteur."""
+
+    def __init__(self, fenetre: int = FENETRE):
+        self.fenetre = fenetre
+        self.compteurs = {}
+        self.distributions = {}
+        self._lock = threading.Lock()
+
+    def incrementer(self, nom: str, n: int = 1, **labels):
+        cle = (nom, tuple(sorted(labels.items())))
+        with self._lock:
+            self.compteurs[cle] = self.compteurs.get(cle, 0) + n
+
+    def observer(self, nom: str, valeur: float, **labels):
+        cle = (nom, tuple(sorted(labels.items())))
+        with self._lock:
+            if cle not in self.distributions:
+                self.distributions[cle] = Distribution(self.fenetre)
+            self.distributions[cle].observer(valeur)
+        if nom == DUREES:
+            mesures = _releve.get()
+            if mesures is not None:
+                durees = mesures["durees"]
+                durees[labels["etape"]] = durees.get(labels["etape"], 0.0) + valeur
+
+    @contextmanager
+    def etape(self, nom: str):
+        """Chronomètre le bloc (même s'il échoue) dans `chatbot_etape_secondes{etape=nom}`."""
+        debut = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observer(DUREES, time.perf_counter() - debut, etape=nom)
+
+    def compteur(self, nom: str, **labels) -> int:
+        with self._lock:
+            return self.compteurs.get((nom, tuple(sorted(labels.items()))), 0)
+
+    def distribution(self, nom: str, **labels) -> dict:
+        """Résumé d'une série (n, somme, max, p50, p95, p99) ; None si rien n'a été observé."""
+        with self._lock:
+            distribution = self.distributions.get((nom, tuple(sorted(labels.items()))))
+            return distribution.resume() if distribution is not None else None
+
+    # — Exports —
+
+    def instantane(self) -> dict:
+        with self._lock:
+            return {
+                "horodatage": datetime.now().isoformat(timespec="seconds"),
+                "compteurs": {nom_serie(*cle): n for cle, n in sorted(self.compteurs.items())},
+                "distributions": {nom_serie(*cle): d.resume() for cle, d in sorted(self.distributions.items())},
+            }
+
+    def texte_prometheus(self) -> str:
+        """Format d'exposition texte de Prometheus : compteurs, et résumés (quantiles, _sum, _count)."""
+        lignes = []
+        with self._lock:
+            for nom in sorted({nom for nom, _ in self.compteurs}):
+                lignes.append(f"# TYPE {nom} counter")
+                for (n, labels), valeur in sorted(self.compteurs.items()):
+                    if n == nom:
+                        lignes.append(f"{nom_serie(nom, labels)} {valeur}")
+            for nom in sorted({nom for nom, _ in self.distributions}):
+                lignes.append(f"# TYPE {nom} summary")
+                for (n, labels), distribution in sorted(self.distributions.items()):
+                    if n != nom:
+                        continue
+                    for q, valeur in distribution.quantiles().items():
+                        lignes.append(f"{nom_serie(nom, labels + (('quantile', q),))} {valeur:.6g}")
+                    lignes.append(f"{nom_serie(nom + '_sum', labels)} {distribution.somme:.6g}")
+                    lignes.append(f"{nom_serie(nom + '_count', labels)} {distribution.nombre}")
+        return "\n".join(lignes) + "\n"
+
+    def ecrire_json(self, chemin: str):
+        dossier = os.path.dirname(chemin)
+        if dossier:
+            os.makedirs(dossier, exist_ok=True)
+        temporaire = f"{chemin}.tmp"
+        with open(temporaire, "w", encoding="utf-8") as f:
+            json.dump(self.instantane(), f, ensure_ascii=False, indent=1)
+        os.replace(temporaire, chemin)
+
+
+class EmbeddingsMesurees(Embeddings):
+    """Embeddings dont chaque appel est chronométré dans l'étape `embedding`."""
+
+    def __init__(self, embeddings, metriques: Metriques):
+        self.embeddings = embeddings
+        self.metriques = metriques
+
+    def embed_query(self, text: str) -> list:
+        with self.metriques.etape("embedding"):
+            return self.embeddings.embed_query(text)
+
+    def embed_documents(self, texts: list) -> list:
+        with self.metriques.etape("embedding"):
+            return self.embeddings.embed_documents(texts)
+
+    def __getattr__(self, nom):
+        # stats(), modèle... de l'objet mesuré
+        return getattr(self.embeddings, nom)
+
+
+# -------- Exports --------
+class ServeurMetriques:
+    """Point d'accès HTTP (thread démon) : `/metrics` (texte Prometheus) et `/metrics.json`."""
+
+    def __init__(self, metriques: Metriques, port: int = 0, hote: str = "127.0.0.1"):
+        metriques_servies = metriques
+
+        class Gestionnaire(BaseHTTPRequestHandler):
+            def do_GET(self):
+                chemin = self.path.split("?")[0]
+                if chemin == "/metrics":
+                    corps, type_contenu = metriques_servies.texte_prometheus(), "text/plain; version=0.0.4"
+                elif chemin == "/metrics.json":
+                    corps, type_contenu = json.dumps(metriques_servies.instantane()), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                corps = corps.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", f"{type_contenu}; charset=utf-8")
+                self.send_header("Content-Length", str(len(corps)))
+                self.end_headers()
+                self.wfile.write(corps)
+
+            def log_message(self, *args):
+                pass
+
+        self.serveur = ThreadingHTTPServer((hote, port), Gestionnaire)
+        self.serveur.daemon_threads = True
+        self.port = self.serveur.server_address[1]
+        threading.Thread(target=self.serveur.serve_forever, name="metriques-http", daemon=True).start()
+
+    def arreter(self):
+        self.serveur.shutdown()
+        self.serveur.server_close()
+
+
+class ExportJSON:
+    """Réécrit `chemin` toutes les `intervalle` secondes (thread démon) et une dernière fois à l'arrêt."""
+
+    def __init__(self, metriques: Metriques, chemin: str, intervalle: float = INTERVALLE_JSON):
+        self.metriques = metriques
+        self.chemin = chemin
+        self.intervalle = intervalle
+        self._arret = threading.Event()
+        self._thread = threading.Thread(target=self._boucle, name="metriques-json", daemon=True)
+        self._thread.start()
+        atexit.register(self.arreter)
+
+    def _ecrire(self):
+        try:
+            self.metriques.ecrire_json(self.chemin)
+        except OSError as e:
+            logging.error(f"Export des métriques impossible : {e}")
+
+    def _boucle(self):
+        while not self._arret.wait(self.intervalle):
+            self._ecrire()
+
+    def arreter(self):
+        if not self._arret.is_set():
+            self._arret.set()
+            self._thread.join()
+            self._ecrire()
+
+
+def demarrer_exports(metriques: Metriques, port: int = None, chemin_json: str = None,
+                     intervalle: float = None) -> list:
+    """Exports demandés en argument ou par `CHATBOT_METRIQUES_PORT` / `CHATBOT_METRIQUES_JSON`."""
+    port = port if port is not None else os.getenv("CHATBOT_METRIQUES_PORT")
+    chemin_json = chemin_json or os.getenv("CHATBOT_METRIQUES_JSON")
+    intervalle = intervalle or float(os.getenv("CHATBOT_METRIQUES_INTERVALLE", INTERVALLE_JSON))
+    exports = []
+    if port not in (None, ""):
+        serveur = ServeurMetriques(metriques, int(port))
+        logging.info(f"Métriques exposées sur http://127.0.0.1:{serveur.port}/metrics")
+        exports.append(serveur)
+    if chemin_json:
+        exports.append(ExportJSON(metriques, chemin_json, intervalle))
+    return exports
+
+
+# -------- Profilage échantillonné --------
+class Profileur:
+    """
+    Profile une fraction `taux` des réponses (`CHATBOT_PROFILAGE`), une à la
+    fois, avec cProfile (fichier .prof pour pstats/snakeviz) ou pyinstrument
+    (page .html) s'il est installé.
+    """
+
+    def __init__(self, taux: float = None, dossier: str = DOSSIER_PROFILS, outil: str = None):
+        self.taux = float(os.getenv("CHATBOT_PROFILAGE", 0) if taux is None else taux)
+        self.dossier = dossier
+        self.outil = outil or os.getenv("CHATBOT_PROFILEUR", "cprofile")
+        self.profils = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def echantillon(self, nom: str):
+        # Un seul profil à la fois : les profileurs Python sont globaux au processus
+        if self.taux <= 0 or random.random() >= self.taux or not self._lock.acquire(blocking=False):
+            yield
+            return
+        try:
+            profil = self._demarrer()
+            try:
+                yield
+            finally:
+                if profil is not None:
+                    self._enregistrer(profil, nom)
+        finally:
+            self._lock.release()
+
+    def _demarrer(self):
+        try:
+            if self.outil == "pyinstrument":
+                from pyinstrument import Profiler
+                profil = Profiler()
+                profil.start()
+            else:
+                import cProfile
+                profil = cProfile.Profile()
+                profil.enable()
+            return profil
+        except (ImportError, ValueError, RuntimeError) as e:
+            logging.warning(f"Profilage impossible ({self.outil}) : {e}")
+            return None
+
+    def _enregistrer(self, profil, nom: str):
+        os.makedirs(self.dossier, exist_ok=True)
+        base = os.path.join(self.dossier, f"{datetime.now():%Y%m%d-%H%M%S-%f}-{nom}")
+        if self.outil == "pyinstrument":
+            profil.stop()
+            chemin = base + ".html"
+            with open(chemin, "w", encoding="utf-8") as f:
+                f.write(profil.output_html())
+        else:
+            profil.disable()
+            chemin = base + ".prof"
+            profil.dump_stats(chemin)
+        self.profils.append(chemin)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Étapes du chatbot triées par temps cumulé")
+    parser.add_argument("fichier", help="export JSON des métriques (CHATBOT_METRIQUES_JSON)")
+    args = parser.parse_args()
+
+    with open(args.fichier, encoding="utf-8") as f:
+        instantane = json.load(f)
+    etapes = {
+        serie[len(DUREES) + len('{etape="'):-2]: resume
+        for serie, resume in instantane["distributions"].items() if serie.startswith(DUREES + "{")
+    }
+    print(f"{'étape':<14} {'n':>7} {'total s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for etape, r in sorted(etapes.items(), key=lambda e: -e[1]["somme"]):
+        print(f"{etape:<14} {r['n']:>7} {r['somme']:>9.1f} {r['p50'] * 1000:>8.0f} "
+              f"{r['p95'] * 1000:>8.0f} {r['p99'] * 1000:>8.0f}")
+    for serie, n in instantane["compteurs"].items():
+        print(f"{serie} {n}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Construction de l'index en flux, avec une mémoire bornée.
+
+Au lieu d'enchaîner les étapes sur tout le jeu de données (tous les événements,
+puis tous les documents, puis tous les morceaux, puis tous les embeddings),
+chaque page d'événements traverse le pipeline dès son arrivée :
+
+    page OpenAgenda → nettoyage → documents → lots → découpe → embeddings → index
+
+Chaque étape tourne dans son thread et passe ses résultats à la suivante par
+une file bornée : réseau, CPU et appels d'embedding se recouvrent, et une étape
+rapide attend la suivante au lieu d'accumuler. Les lots terminés partent sur
+disque (`index_store.EcrivainIndex`) : seuls les vecteurs de l'index restent en
+mémoire, et une sauvegarde partielle régulière permet de reprendre une
+construction interrompue sans refaire les lots déjà indexés.
+
+    python pipeline.py --index faiss_index --sauvegarde-tous 20
+"""
+import os
+import queue
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+
+from chunking import PHRASES_PAR_LOT, decouper_lot, iterer_lots
+from embedding_cache import creer_embeddings
+from index_faiss import (
+    INDEX_DIR, attribuer_ids, charger_manifest, documents_a_indexer, entree_manifest, sauvegarder_manifest,
+)
+from index_lexical import IndexLexical
+from index_store import EcrivainIndex, charger_index
+from index_types import TYPES_ENTRAINES, TYPES_INDEX, METRIQUES, creer_index
+from Openagenda import EVENT_TYPES, creer_harvester, structurer_evenements
+
+FIN = object()
+TAILLE_FILE = 4
+# Lots indexés entre deux sauvegardes partielles
+SAUVEGARDE_TOUS = 20
+# Vecteurs gardés pour entraîner un index IVF/PQ/SQ8 avant le premier ajout
+VECTEURS_ENTRAINEMENT = 20000
+SUFFIXE_TRAVAIL = ".partiel"
+
+
+class Flux:
+    """
+    Source et étapes reliées par des files bornées, chacune dans son thread.
+    Une étape est une fonction qui reçoit l'itérateur des résultats de la
+    précédente et produit les siens. L'itération du flux rend les résultats
+    de la dernière étape ; une erreur dans une étape arrête les autres et
+    remonte à l'appelant.
+    """
+
+    def __init__(self, source, *etapes, taille_file: int = TAILLE_FILE):
+        self.source = source
+        self.etapes = etapes
+        self.taille_file = taille_file
+        self.pics_files = []
+        self._arret = threading.Event()
+        self._erreurs = []
+
+    def _pousser(self, file, element, rang) -> bool:
+        while not self._arret.is_set():
+            try:
+                file.put(element, timeout=0.1)
+            except queue.Full:
+                continue
+            self.pics_files[rang] = max(self.pics_files[rang], file.qsize())
+            return True
+        return False
+
+    def _lire(self, file):
+        while True:
+            try:
+                element = file.get(timeout=0.1)
+            except queue.Empty:
+                if self._arret.is_set():
+                    return
+                continue
+            if element is FIN:
+                return
+            yield element
+
+    def _executer(self, iterable, file, rang):
+        try:
+            for element in iterable:
+                if not self._pousser(file, element, rang):
+                    break
+        except BaseException as e:
+            self._erreurs.append(e)
+            self._arret.set()
+        finally:
+            fermer = getattr(iterable, "close", None)
+            if fermer is not None:
+                fermer()
+            self._pousser(file, FIN, rang)
+
+    def __iter__(self):
+        threads = []
+        iterable = iter(self.source)
+        for rang, etape in enumerate((None,) + self.etapes):
+            if etape is not None:
+                iterable = etape(self._lire(file))
+            file = queue.Queue(maxsize=self.taille_file)
+            self.pics_files.append(0)
+            thread = threading.Thread(target=self._executer, args=(iterable, file, rang), daemon=True)
+            thread.start()
+            threads.append(thread)
+        try:
+            yield from self._lire(file)
+        finally:
+            self._arret.set()
+            for thread in threads:
+                thread.join()
+        if self._erreurs:
+            raise self._erreurs[0]
+
+
+class ConstructionEnFlux:
+    """
+    Construction complète d'un index à partir d'un flux de pages d'événements.
+    `pages` : itérable de pages (listes d'enregistrements OpenAgenda), par
+    exemple `OpenAgendaHarvester.iterer_evenements`.
+    """
+
+    def __init__(self, embeddings, chemin_index: str = INDEX_DIR, type_index: str = "flat",
+                 metrique: str = "l2", phrases_par_lot: int = PHRASES_PAR_LOT,
+                 sauvegarde_tous: int = SAUVEGARDE_TOUS, vecteurs_entrainement: int = VECTEURS_ENTRAINEMENT,
+                 taille_file: int = TAILLE_FILE, **params):
+        self.embeddings = embeddings
+        self.chemin_index = chemin_index
+        self.chemin_travail = str(chemin_index).rstrip("/\\") + SUFFIXE_TRAVAIL
+        self.type_index = type_index
+        self.metrique = metrique
+        self.phrases_par_lot = phrases_par_lot
+        self.sauvegarde_tous = sauvegarde_tous
+        self.vecteurs_entrainement = vecteurs_entrainement
+        self.taille_file = taille_file
+        self.params = params
+        self.ecrivain = None
+        self.manifest = {}
+        self.repris = 0
+        self.sauvegardes = 0
+        self.pics_files = []
+        self._deja_indexes = frozenset()
+        self._en_attente = []
+
+    # — Étapes exécutées dans leurs threads —
+
+    def documents(self, pages, now):
+        for page in pages:
+            df = structurer_evenements(page)
+            for doc in documents_a_indexer(df, now):
+                if doc.metadata.get("id", "") not in self._deja_indexes:
+                    yield doc
+
+    def decoupes(self, lots):
+        for lot in lots:
+            yield lot, decouper_lot(lot, self.embeddings)
+
+    # — Indexation, dans le thread appelant —
+
+    def _reprendre(self):
+        """Index partiel d'une construction interrompue : ses événements ne sont pas refaits."""
+        self.ecrivain = EcrivainIndex(self.chemin_travail)
+        if not len(self.ecrivain):
+            return
+        indexes = set(self.ecrivain.ids)
+        self.manifest = {
+            uid: entree for uid, entree in charger_manifest(self.chemin_travail).items()
+            if set(entree["chunk_ids"]) <= indexes
+        }
+        self.repris = len(self.manifest)
+        self._deja_indexes = frozenset(self.manifest)
+        print(f" Reprise : {self.repris} événements ({len(indexes)} morceaux) déjà indexés.")
+
+    def _ajouter(self, vecteurs, chunks, ids):
+        if self.ecrivain.index is not None:
+            self.ecrivain.ajouter(None, vecteurs, chunks, ids)
+            return
+        # Premier lot, ou vecteurs mis de côté pour l'entraînement
+        self._en_attente.append((vecteurs, chunks, ids))
+        en_attente = sum(len(v) for v, _, _ in self._en_attente)
+        if self.type_index in TYPES_ENTRAINES and en_attente < self.vecteurs_entrainement:
+            return
+        self._vider_attente()
+
+    def _vider_attente(self):
+        if not self._en_attente:
+            return
+        x = np.concatenate([v for v, _, _ in self._en_attente])
+        index = creer_index(x, self.type_index, self.metrique, **self.params)
+        for vecteurs, chunks, ids in self._en_attente:
+            self.ecrivain.ajouter(index, vecteurs, chunks, ids)
+        self._en_attente = []
+
+    def _sauvegarder(self):
+        if self.ecrivain.index is None:
+            return
+        sauvegarder_manifest(self.chemin_travail, self.manifest)
+        self.ecrivain.sauvegarder()
+        self.sauvegardes += 1
+
+    def _completer(self, dossier: str):
+        """Manifest et index lexical, publiés avec l'index FAISS."""
+        sauvegarder_manifest(dossier, self.manifest)
+        IndexLexical.depuis_vectorstore(charger_index(dossier, self.embeddings)).sauvegarder(dossier)
+
+    def indexer_lot(self, lot, chunks):
+        ids, ids_par_uid = attribuer_ids(chunks)
+        if chunks:
+            vecteurs = np.asarray(
+                self.embeddings.embed_documents([chunk.page_content for chunk in chunks]), dtype=np.float32
+            )
+            if self.metrique == "ip":
+                faiss.normalize_L2(vecteurs)
+            self._ajouter(vecteurs, chunks, ids)
+        for doc in lot:
+            uid = doc.metadata.get("id", "")
+            self.manifest[uid] = entree_manifest(doc, ids_par_uid.get(uid, []))
+
+    def construire(self, pages, now):
+        """Indexe toutes les pages et publie l'index ; retourne (vectorstore, rapport)."""
+        self._reprendre()
+        flux = Flux(
+            pages,
+            lambda pages: self.documents(pages, now),
+            lambda docs: iterer_lots(docs, self.phrases_par_lot),
+            self.decoupes,
+            taille_file=self.taille_file,
+        )
+        lots = 0
+        resultats = iter(flux)
+        try:
+            for lot, chunks in resultats:
+                self.indexer_lot(lot, chunks)
+                lots += 1
+                if lots % self.sauvegarde_tous == 0 and not self._en_attente:
+                    self._sauvegarder()
+                    print(f" Sauvegarde partielle : {len(self.ecrivain)} morceaux, {len(self.manifest)} événements")
+        except BaseException:
+            # Arrêt des étapes ; ce qui a été indexé depuis la dernière sauvegarde n'est pas perdu
+            resultats.close()
+            if not self._en_attente:
+                self._sauvegarder()
+            self.ecrivain.fermer()
+            raise
+
+        self._vider_attente()
+        self.ecrivain.publier(self.chemin_index, self._completer)
+        vectorstore = charger_index(self.chemin_index, self.embeddings)
+        self.pics_files = flux.pics_files
+        return vectorstore, {
+            "ajoutes": len(self.manifest) - self.repris, "mis_a_jour": 0, "supprimes": 0, "inchanges": 0,
+            "embeddings_economises": 0, "repris": self.repris, "lots": lots,
+            "sauvegardes_partielles": self.sauvegardes,
+        }
+
+
+def construire_index_en_flux(embeddings, now, chemin_index: str = INDEX_DIR, checkpoint_path: str = None,
+                             workers: int = 8, rate: float = 5.0, **options):
+    """Construction complète depuis OpenAgenda, page par page (voir `ConstructionEnFlux`)."""
+    harvester = creer_harvester(checkpoint_path, workers, rate)
+    construction = ConstructionEnFlux(embeddings, chemin_index, **options)
+    vectorstore, rapport = construction.construire(harvester.iterer_evenements(EVENT_TYPES), now)
+    stats = harvester.statistiques()
+    print(
+        f" {stats['evenements']} événements reçus ({stats['doublons']} doublons écartés) "
+        f"en {stats['requetes']} requêtes, {stats['octets'] / 2 ** 20:.1f} Mo téléchargés"
+    )
+    return vectorstore, rapport
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construction en flux de l'index FAISS des événements OpenAgenda")
+    parser.add_argument("--index", default=INDEX_DIR, help="dossier de l'index FAISS")
+    parser.add_argument("--type", default="flat", choices=TYPES_INDEX, help="type d'index FAISS")
+    parser.add_argument("--metrique", default="l2", choices=sorted(METRIQUES))
+    parser.add_argument("--phrases-par-lot", type=int, default=PHRASES_PAR_LOT)
+    parser.add_argument("--sauvegarde-tous", type=int, default=SAUVEGARDE_TOUS,
+                        help="lots indexés entre deux sauvegardes partielles")
+    parser.add_argument("--checkpoint", help="journal JSONL des pages (collecte par pages reprenable)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    load_dotenv()
+    embeddings = creer_embeddings(os.getenv('MISTRAL_AI_KEY'))
+    now = datetime.now(timezone.utc)
+    _, rapport = construire_index_en_flux(
+        embeddings, now, args.index, args.checkpoint,
+        type_index=args.type, metrique=args.metrique,
+        phrases_par_lot=args.phrases_par_lot, sauvegarde_tous=args.sauvegarde_tous,
+    )
+    print(
+        f" Indexés: {rapport['ajoutes']} | Repris: {rapport['repris']} | Lots: {rapport['lots']} | "
+        f"Sauvegardes partielles: {rapport['sauvegardes_partielles']}"
+    )
+    print(f" Index publié dans {Path(args.index).resolve()}")
+
+
+if __name__ == "__main__":
+    main()
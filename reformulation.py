@@ -0,0 +1,142 @@
+"""
+Question autonome sans appel au LLM quand c'est possible.
+
+`ConversationalRetrievalChain` fait reformuler chaque question par le LLM dès
+qu'il y a un historique : à partir du deuxième échange, deux appels au LLM se
+suivent avant même la recherche. La plupart des relances se décident pourtant
+localement, à partir de la question et du sujet de l'échange précédent (la
+dernière question autonome de la session) :
+- AUTONOME : pas de pronom ni de relance, et la question a son propre sujet
+  (« Quelles expositions à Montpellier ? »), ou bien son propre lieu ou sa
+  propre date (« Que faire à Montpellier cette semaine ? ») : elle part telle quelle
+- MODELE : relance elliptique (« Et à Sète ? », « et demain ? », « Et des
+  expositions ? », « pour les enfants ? ») : le lieu, la date ou le sujet du
+  tour précédent sont remplacés ou complétés par ceux de la relance
+- LLM : pronom ou renvoi à la réponse précédente (« À quelle heure
+  commence-t-il ? », « Et le prix ? ») : reformulation par le LLM comme avant
+"""
+import re
+
+from index_lexical import termes
+
+AUTONOME = "autonome"
+MODELE = "modele"
+LLM = "llm"
+
+# Mots de relance en tête de question
+RELANCE = re.compile(r"^\s*(?:(?:et|sinon|aussi|mais|alors|puis|ensuite|ok|d['’]accord)\b[\s,]*)+", re.I)
+# Tournures impersonnelles, retirées avant de chercher les pronoms
+IMPERSONNELS = re.compile(
+    r"\b(?:(?:qu['’]|est-ce qu['’])?il y a|y a[- ]t[- ]il|il faut|il fait|s['’]il (?:vous|te) pla[iî]t)\b", re.I
+)
+MOTS_TEMPS = (
+    r"matin|midi|soir|nuit|jour|journ[ée]e|week-?end|semaine|mois|ann[ée]e|[ée]t[ée]|hiver|automne|printemps|"
+    r"lundi|mardi|mercredi|jeudi|vendredi|samedi|dimanche"
+)
+# Pronoms et déterminants qui renvoient à l'échange précédent (« ce concert », pas « ce soir »)
+ANAPHORES = re.compile(
+    r"\b(?:il|ils|elle|elles|lui|leur|leurs|celui|celle|ceux|celles|[çc]a|cela|ceci|c['’](?:est|[ée]tait)|l[àa]-bas|y aller|"
+    r"son|sa|ses|le m[êe]me|la m[êe]me|les m[êe]mes|d['’]autres?|un autre|une autre|"
+    rf"(?:ce|cet|cette|ces)\s+(?!(?:{MOTS_TEMPS}|qui|que|qu)\b)\w+|"
+    r"(?:le|la|les) (?:premi[eè]re?s?|deuxi[eè]mes?|seconde?s?|derni[eè]re?s?|pr[ée]c[ée]dente?s?))\b",
+    re.I,
+)
+# Questions sur un attribut de la réponse précédente
+ATTRIBUTS = re.compile(
+    r"\b(?:prix|tarifs?|co[uû]te|horaires?|heure|adresse|dur[ée]e|r[ée]servation|r[ée]server|billets?|"
+    r"places?|acc[eè]s|lien|site)\b",
+    re.I,
+)
+MOIS = r"janvier|f[ée]vrier|mars|avril|mai|juin|juillet|ao[uû]t|septembre|octobre|novembre|d[ée]cembre"
+TEMPS = re.compile(
+    r"\b(?:aujourd['’]hui|apr[eè]s-demain|demain|ce soir|cette nuit|"
+    rf"(?:ce|cet|cette|le|la)\s+(?:{MOTS_TEMPS})(?:\s+(?:prochaine?|suivante?))?|"
+    r"(?:la semaine|le mois|le week-?end)\s+(?:prochaine?|suivante?)|"
+    rf"(?:du|le|les)\s+\d{{1,2}}(?:er)?(?:\s+(?:au|et)\s+\d{{1,2}}(?:er)?)?(?:\s+(?:{MOIS}))?(?:\s+\d{{4}})?|"
+    rf"(?:en|au mois d['’]|au mois de|d[eè]s|avant|apr[eè]s)\s*(?:{MOIS})(?:\s+\d{{4}})?|"
+    rf"(?:{MOIS})(?:\s+\d{{4}})?|"
+    r"(?:pendant|durant) les vacances(?:\s+\w+)?)\b",
+    re.I,
+)
+# Lieu : préposition puis nom (les mots suivants doivent commencer par une majuscule)
+LIEU = re.compile(
+    r"\b(?:à|a|au|aux|sur|vers|pr[eè]s de|autour de|du c[ôo]t[ée] de)\s+"
+    r"(?!(?:partir|moins|des|du|de|la|le|les|un|une|t|il|faire|voir|quelle|quel|quoi|\d)\b)"
+    r"(?:l['’])?[\w'’-]+(?-i:(?:[\s-](?:sur|de|du|des|en|la|le|l['’])?\s*[A-ZÉÈÀÂÎÔ][\w'’-]*)*)",
+    re.I,
+)
+# Précisions qui s'ajoutent au sujet précédent (« pour », « avec », « sans » suivis d'un complément)
+PRECISION = re.compile(
+    r"^(?:(?:pour|avec|sans)(?=\s+\w)|en famille|en plein air|en int[ée]rieur|gratuits?|pas chers?|[àa] moins de|"
+    r"dans un rayon)\b",
+    re.I,
+)
+# Préposition restée seule une fois le lieu et la date retirés (« Et pour ce soir ? »)
+PREPOSITION_SEULE = re.compile(r"^(?:pour|avec|sans)$", re.I)
+# Question qui commence par un interrogatif (après les mots de relance éventuels)
+INTERROGATIF = re.compile(
+    r"^(?:qu['’]|que\b|quoi\b|quel(?:le)?s?\b|o[uù]\b|comment\b|combien\b|est-ce\b|y a[- ]t[- ]il\b)", re.I
+)
+# Mots sans sujet propre : « Qu'est-ce qui est prévu ? » reste une relance
+GENERIQUES = frozenset(
+    "quoi quels faire sortir voir aller prevu prevus programme programmes propose proposes proposer recommande "
+    "recommandes conseille conseilles conseilles idee idees est sont peut peux pouvez ya".split()
+)
+
+
+def _espaces(texte: str) -> str:
+    return " ".join(texte.split()).strip(" ,;")
+
+
+def _sans_ponctuation(texte: str) -> str:
+    return _espaces(texte).rstrip(" ?!.").strip()
+
+
+def segments(texte: str) -> tuple:
+    """(lieu, date, reste) : premiers lieu et expression de date trouvés, et le texte sans eux."""
+    lieu = LIEU.search(texte)
+    lieu = lieu.group(0) if lieu else ""
+    reste = LIEU.sub(" ", texte)
+    date = TEMPS.search(reste)
+    date = date.group(0) if date else ""
+    reste = TEMPS.sub(" ", reste)
+    return lieu, date, _sans_ponctuation(reste)
+
+
+def a_son_sujet(reste: str) -> bool:
+    return any(t not in GENERIQUES for t in termes(reste))
+
+
+def analyser(question: str, sujet: str) -> tuple:
+    """
+    (mode, question autonome) pour `question` posée après `sujet` (question
+    autonome de l'échange précédent, vide en début de conversation).
+    Avec le mode LLM, la question autonome est None : le LLM doit reformuler.
+    """
+    if not sujet:
+        return AUTONOME, question
+    sans_impersonnels = IMPERSONNELS.sub(" ", question)
+    if ANAPHORES.search(sans_impersonnels) or ATTRIBUTS.search(sans_impersonnels):
+        return LLM, None
+
+    relance = RELANCE.match(question)
+    fragment = _sans_ponctuation(question[relance.end():] if relance else question)
+    lieu, date, reste = segments(fragment)
+    reste = PREPOSITION_SEULE.sub("", reste)
+    precision = PRECISION.match(reste)
+    if not relance and not precision and (a_son_sujet(reste) or (INTERROGATIF.match(fragment) and (lieu or date))):
+        # Sujet, lieu ou date propres : « Que faire à Montpellier cette semaine ? »
+        return AUTONOME, question
+
+    lieu_sujet, date_sujet, reste_sujet = segments(_sans_ponctuation(sujet))
+    if precision:
+        base = f"{reste_sujet} {reste}"
+    elif a_son_sujet(reste):
+        # Nouveau sujet, même lieu et même date : « Et des expositions ? »
+        base = reste
+    elif lieu or date:
+        base = reste_sujet
+    else:
+        # Relance sans sujet, ni lieu, ni date (« Et sinon ? ») : le LLM s'en charge
+        return LLM, None
+    return MODELE, _espaces(f"{base} {lieu or lieu_sujet} {date or date_sujet}") + " ?"
@@ -0,0 +1,319 @@
+"""
+Recherche avec préfiltrage sur les métadonnées des événements.
+
+`IndexMetadonnees` construit des colonnes NumPy alignées sur les positions
+de l'index FAISS (dates de début et de fin, ville, code postal). Les filtres
+réduisent d'abord l'ensemble des candidats, puis la recherche vectorielle ne
+parcourt que ceux-ci via un `IDSelectorBatch` FAISS : un événement terminé
+ou situé dans une autre ville ne peut plus être renvoyé. Les questions
+« près de moi » sont restreintes aux événements dans un rayon autour de
+l'utilisateur (voir spatial.py) et classées par similarité et distance.
+Une période citée (« ce week-end », « en août », voir temporel.py) restreint
+les candidats aux événements qui la chevauchent.
+Avec un index BM25 (voir index_lexical.py), les classements lexical et
+vectoriel sont fusionnés par reciprocal rank fusion.
+"""
+import re
+import unicodedata
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import faiss
+import numpy as np
+import pandas as pd
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+from index_types import distances_l2, parametres_selection
+from spatial import IndexSpatial, haversine_km, rayon_demande, score_combine
+from temporel import periode
+
+K_DEFAUT = 4
+# Candidats supplémentaires récupérés avant le reclassement par distance
+SURECHANTILLONNAGE = 4
+# Constante de la reciprocal rank fusion (valeur usuelle de la littérature)
+K_RRF = 60
+INT64_MIN = np.iinfo(np.int64).min
+INT64_MAX = np.iinfo(np.int64).max
+PREPOSITIONS = r"(?:a|au|aux|de|d|sur|vers|pres de|autour de)"
+CODE_POSTAL = re.compile(r"\b(\d{5})\b")
+# Métadonnées lues par `IndexMetadonnees` (voir aussi les colonnes de index_store.py)
+CHAMPS_METADONNEES = (
+    "firstdate_begin", "lastdate_end", "location_city", "location_postalcode", "latitude", "longitude",
+)
+
+# Filtres de la requête en cours : la chaîne LangChain appelle le retriever
+# sans transmettre ses entrées, les filtres passent donc par le contexte.
+_filtres_requete = ContextVar("filtres_requete", default={})
+
+
+@contextmanager
+def filtres_requete(**filtres):
+    """Applique des filtres de métadonnées aux recherches faites dans ce bloc."""
+    jeton = _filtres_requete.set(filtres)
+    try:
+        yield
+    finally:
+        _filtres_requete.reset(jeton)
+
+
+def normaliser_ville(texte) -> str:
+    """Minuscules, sans accents ni tirets : 'Saint-Gaudens' -> 'saint gaudens'."""
+    if not isinstance(texte, str):
+        return ""
+    texte = unicodedata.normalize("NFKD", texte)
+    texte = "".join(c for c in texte if not unicodedata.combining(c)).lower()
+    return " ".join(re.sub(r"[-'’]", " ", texte).split())
+
+
+def dates_en_ns(valeurs, defaut: int) -> np.ndarray:
+    """Dates (chaînes ou Timestamp) en entiers ns UTC ; les dates inconnues valent `defaut`."""
+    dates = pd.to_datetime(pd.Series(list(valeurs), dtype=object), errors="coerce", utc=True)
+    ns = dates.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    return np.where(dates.isna().to_numpy(), defaut, ns)
+
+
+class IndexMetadonnees:
+    """Colonnes de métadonnées indexées par position FAISS."""
+
+    def __init__(self, metadatas: list):
+        self.taille = len(metadatas)
+        # Une date inconnue ne doit pas exclure l'événement
+        self.debut = dates_en_ns((m.get("firstdate_begin") for m in metadatas), INT64_MIN)
+        self.fin = dates_en_ns((m.get("lastdate_end") for m in metadatas), INT64_MAX)
+
+        villes = [normaliser_ville(m.get("location_city")) for m in metadatas]
+        self.vocabulaire_villes = sorted({v for v in villes if v})
+        self.codes_villes = {v: i for i, v in enumerate(self.vocabulaire_villes)}
+        self.villes = np.array([self.codes_villes.get(v, -1) for v in villes], dtype=np.int32)
+        self.codes_postaux = np.array([str(m.get("location_postalcode") or "") for m in metadatas])
+        self.spatial = IndexSpatial(
+            [m.get("latitude") for m in metadatas], [m.get("longitude") for m in metadatas]
+        )
+
+        # Détection des villes citées dans une question (« concerts à Montpellier »)
+        noms = sorted(self.vocabulaire_villes, key=len, reverse=True)
+        self._regex_villes = re.compile(
+            rf"\b{PREPOSITIONS}\s+({'|'.join(map(re.escape, noms))})\b"
+        ) if noms else None
+
+    @classmethod
+    def depuis_vectorstore(cls, vectorstore) -> "IndexMetadonnees":
+        # Index au format compact : colonnes déjà extraites, sans lire les documents
+        colonnes = getattr(vectorstore.docstore, "colonnes", None)
+        if colonnes is not None:
+            return cls([dict(zip(colonnes, valeurs)) for valeurs in zip(*colonnes.values())])
+
+        ids = vectorstore.index_to_docstore_id
+        metadatas = []
+        for position in range(vectorstore.index.ntotal):
+            doc = vectorstore.docstore.search(ids[position]) if position in ids else None
+            metadatas.append(getattr(doc, "metadata", None) or {})
+        return cls(metadatas)
+
+    def villes_citees(self, question: str) -> list:
+        if self._regex_villes is None:
+            return []
+        return list(dict.fromkeys(self._regex_villes.findall(normaliser_ville(question))))
+
+    def selectionner(self, apres=None, avant=None, villes=None, codes_postaux=None,
+                     centre=None, rayon_km=None):
+        """
+        Positions FAISS des événements qui chevauchent la fenêtre [apres, avant],
+        se trouvent dans l'une des villes / l'un des codes postaux donnés
+        et à moins de `rayon_km` du point `centre` (lat, lon).
+        Retourne None quand aucun filtre ne s'applique.
+        """
+        masque = None
+
+        def combiner(condition):
+            nonlocal masque
+            masque = condition if masque is None else masque & condition
+
+        if apres is not None:
+            combiner(self.fin >= pd.Timestamp(apres).value)
+        if avant is not None:
+            combiner(self.debut <= pd.Timestamp(avant).value)
+        if villes:
+            codes = [self.codes_villes[v] for v in map(normaliser_ville, villes) if v in self.codes_villes]
+            combiner(np.isin(self.villes, codes))
+        if codes_postaux:
+            combiner(np.isin(self.codes_postaux, list(codes_postaux)))
+        if centre is not None and rayon_km:
+            proches = np.zeros(self.taille, dtype=bool)
+            proches[self.spatial.dans_rayon(centre[0], centre[1], rayon_km)] = True
+            combiner(proches)
+
+        if masque is None:
+            return None
+        return np.flatnonzero(masque).astype(np.int64)
+
+    def filtres_question(self, question: str, maintenant, position: dict = None) -> dict:
+        """
+        Filtres déduits de la question : événements non terminés (et qui chevauchent
+        la période citée), villes et codes postaux cités, rayon autour de
+        `position` pour les questions « près de moi ».
+        """
+        filtres = {"apres": maintenant}
+        cible = periode(question, maintenant.astimezone().date())
+        if cible is not None:
+            filtres["apres"] = max(maintenant, cible.debut)
+            if cible.fin is not None:
+                filtres["avant"] = cible.fin
+        villes = self.villes_citees(question)
+        if villes:
+            filtres["villes"] = villes
+        codes = set(CODE_POSTAL.findall(question)) & set(self.codes_postaux.tolist())
+        if codes:
+            filtres["codes_postaux"] = sorted(codes)
+        rayon = rayon_demande(question)
+        if rayon and position and position.get("latitude") is not None and position.get("longitude") is not None:
+            filtres["centre"] = (float(position["latitude"]), float(position["longitude"]))
+            filtres["rayon_km"] = rayon
+        return filtres
+
+
+def voisins(vectorstore, vecteur, candidats=None, k: int = K_DEFAUT):
+    """
+    Positions et distances des k plus proches voisins parmi les positions
+    `candidats` (toutes si None). La distance est toujours une distance L2 au
+    carré (voir index_types.py).
+    """
+    if candidats is not None and len(candidats) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    x = np.asarray([vecteur], dtype=np.float32)
+    if getattr(vectorstore, "_normalize_L2", False):
+        faiss.normalize_L2(x)
+
+    if candidats is None or len(candidats) == vectorstore.index.ntotal:
+        distances, positions = vectorstore.index.search(x, k)
+    else:
+        params = parametres_selection(vectorstore.index, faiss.IDSelectorBatch(candidats))
+        distances, positions = vectorstore.index.search(x, min(k, len(candidats)), params=params)
+    distances = distances_l2(vectorstore.index, distances)[0]
+    trouves = positions[0] != -1
+    return positions[0][trouves].astype(np.int64), distances[trouves]
+
+
+def documents(vectorstore, positions, distances) -> list:
+    """[(Document, distance)] pour des positions FAISS."""
+    return [
+        (vectorstore.docstore.search(vectorstore.index_to_docstore_id[int(position)]), float(distance))
+        for position, distance in zip(positions, distances)
+    ]
+
+
+def recherche_vectorielle(vectorstore, vecteur, candidats=None, k: int = K_DEFAUT) -> list:
+    """Recherche des k plus proches voisins parmi `candidats`. Retourne [(Document, distance)]."""
+    return documents(vectorstore, *voisins(vectorstore, vecteur, candidats, k))
+
+
+def fusion_rrf(*classements, k_rrf: int = K_RRF) -> list:
+    """
+    Reciprocal rank fusion : chaque position reçoit la somme de 1 / (k_rrf + rang)
+    sur les classements où elle apparaît. Retourne les positions, meilleure d'abord.
+    """
+    scores = {}
+    for classement in classements:
+        for rang, position in enumerate(classement, 1):
+            scores[int(position)] = scores.get(int(position), 0.0) + 1.0 / (k_rrf + rang)
+    return sorted(scores, key=lambda position: (-scores[position], position))
+
+
+class RetrieverFiltre(BaseRetriever):
+    """
+    Retriever LangChain qui applique les filtres de métadonnées avant la recherche vectorielle.
+    Filtres fixes via `avec_filtres`, filtres par requête via `filtres_requete`.
+
+    Avec un index lexical (voir index_lexical.py), les classements BM25 et
+    vectoriel sont fusionnés (RRF). Quand des morceaux contiennent tous les mots
+    de la question (`raccourci_lexical`), ils sont renvoyés sans recherche
+    vectorielle ni fusion, avec leur distance vectorielle réelle à la question
+    (c'est elle qui décide de la confiance, voir confiance.py).
+    """
+
+    vectorstore: object
+    index_meta: IndexMetadonnees
+    k: int = K_DEFAUT
+    filtres: dict = {}
+    lexical: object = None
+    raccourci_lexical: bool = True
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def avec_filtres(self, **filtres) -> "RetrieverFiltre":
+        return self.copy(update={"filtres": filtres})
+
+    def rechercher(self, query: str) -> list:
+        """[(Document, distance)], meilleur d'abord."""
+        return [(doc, distance) for doc, distance, _ in self.rechercher_candidats(query)]
+
+    def rechercher_candidats(self, query: str, k: int = None) -> list:
+        """
+        [(Document, distance, position FAISS)] des `k` meilleurs morceaux (`self.k`
+        par défaut) ; la position permet de relire le vecteur stocké du morceau
+        (voir contexte.py).
+        """
+        k = k or self.k
+        filtres = {**self.filtres, **_filtres_requete.get()}
+        candidats = self.index_meta.selectionner(**filtres)
+        if candidats is not None and len(candidats) == 0:
+            return []
+        centre, rayon = filtres.get("centre"), filtres.get("rayon_km")
+        par_distance = centre is not None and bool(rayon)
+        k_recherche = k * SURECHANTILLONNAGE if par_distance else k
+
+        if self.lexical is None:
+            positions, distances = voisins(
+                self.vectorstore, self.vectorstore._embed_query(query), candidats, k_recherche
+            )
+        else:
+            positions, distances = self._recherche_hybride(query, candidats, k_recherche, raccourci=not par_distance)
+        resultats = [
+            (doc, distance, int(position))
+            for (doc, distance), position in zip(documents(self.vectorstore, positions, distances), positions)
+        ]
+        if not par_distance:
+            return resultats
+
+        scores = [
+            score_combine(distance, self._distance_km(doc, centre), rayon)
+            for doc, distance, _ in resultats
+        ]
+        classes = sorted(zip(resultats, scores), key=lambda r: r[1], reverse=True)
+        return [resultat for resultat, _ in classes[:k]]
+
+    def _recherche_hybride(self, query: str, candidats, k: int, raccourci: bool) -> tuple:
+        """(positions, distances) de la fusion des classements BM25 et vectoriel."""
+        lexicaux, _, complets = self.lexical.rechercher(query, candidats, k * SURECHANTILLONNAGE)
+        vecteur = self.vectorstore._embed_query(query)
+        if raccourci and self.raccourci_lexical and complets.any():
+            # Distances limitées aux morceaux exacts, dans l'ordre BM25
+            exacts = lexicaux[complets][:k]
+            positions, distances = voisins(self.vectorstore, vecteur, exacts, len(exacts))
+            distance_de = dict(zip(positions.tolist(), distances.tolist()))
+            exacts = [p for p in exacts.tolist() if p in distance_de]
+            return np.array(exacts, dtype=np.int64), np.array([distance_de[p] for p in exacts], dtype=np.float32)
+
+        positions, distances = voisins(self.vectorstore, vecteur, candidats, k * SURECHANTILLONNAGE)
+        fusion = fusion_rrf(positions, lexicaux)[:k]
+        distance_de = dict(zip(positions.tolist(), distances.tolist()))
+        # Morceaux trouvés par BM25 seulement : leur distance vectorielle sert à la décision de confiance
+        manquants = np.array([p for p in fusion if p not in distance_de], dtype=np.int64)
+        if len(manquants):
+            positions_bm25, distances_bm25 = voisins(self.vectorstore, vecteur, manquants, len(manquants))
+            distance_de.update(zip(positions_bm25.tolist(), distances_bm25.tolist()))
+        fusion = [p for p in fusion if p in distance_de]
+        return np.array(fusion, dtype=np.int64), np.array([distance_de[p] for p in fusion], dtype=np.float32)
+
+    @staticmethod
+    def _distance_km(doc, centre) -> float:
+        try:
+            lat, lon = float(doc.metadata["latitude"]), float(doc.metadata["longitude"])
+        except (KeyError, TypeError, ValueError):
+            return float("inf")
+        return float(haversine_km(centre[0], centre[1], lat, lon))
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list:
+        return [doc for doc, _ in self.rechercher(query)]
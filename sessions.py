@@ -0,0 +1,83 @@
+"""
+Mémoire conversationnelle par session.
+
+Chaque session (un onglet Streamlit, un utilisateur du CLI...) a sa propre
+`ConversationBufferWindowMemory`. Les sessions inactives depuis plus de `ttl`
+secondes sont évincées, et au-delà de `max_sessions` la moins récemment
+utilisée disparaît. Un verrou par session sérialise les questions d'une même
+conversation sans bloquer les autres. Chaque session garde aussi la dernière
+question autonome (`sujet`) et ses reformulations récentes (voir reformulation.py).
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from langchain.memory import ConversationBufferWindowMemory
+
+FENETRE_MEMOIRE = 3
+TTL_SESSION = 30 * 60
+MAX_SESSIONS = 1000
+MAX_REFORMULATIONS = 16
+
+
+@dataclass
+class Session:
+    memoire: ConversationBufferWindowMemory
+    dernier_acces: float
+    verrou: threading.Lock = field(default_factory=threading.Lock)
+    sujet: str = ""
+    reformulations: OrderedDict = field(default_factory=OrderedDict)
+
+    def reformulation(self, cle):
+        return self.reformulations.get(cle)
+
+    def retenir_reformulation(self, cle, valeur):
+        self.reformulations[cle] = valeur
+        self.reformulations.move_to_end(cle)
+        while len(self.reformulations) > MAX_REFORMULATIONS:
+            self.reformulations.popitem(last=False)
+
+
+class SessionStore:
+    def __init__(self, k: int = FENETRE_MEMOIRE, ttl: float = TTL_SESSION, max_sessions: int = MAX_SESSIONS):
+        self.k = k
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._sessions
+
+    def _nouvelle_memoire(self) -> ConversationBufferWindowMemory:
+        return ConversationBufferWindowMemory(k=self.k, return_messages=True, memory_key="chat_history")
+
+    def _evincer(self, maintenant: float):
+        # Les sessions sont rangées de la moins à la plus récemment utilisée
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if maintenant - session.dernier_acces <= self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+    def session(self, session_id: str) -> Session:
+        """Retourne la session (créée si besoin) et la marque comme la plus récente."""
+        maintenant = time.monotonic()
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None or maintenant - session.dernier_acces > self.ttl:
+                session = Session(memoire=self._nouvelle_memoire(), dernier_acces=maintenant)
+            session.dernier_acces = maintenant
+            self._sessions[session_id] = session
+            self._evincer(maintenant)
+            return session
+
+    def supprimer(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
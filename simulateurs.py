@@ -0,0 +1,321 @@
+"""
+Services simulés pour tester et mesurer le chatbot sans réseau (voir benchmark_charge.py).
+
+Remplacent, dans le même processus :
+- le modèle de chat Mistral (`LLMSimule`) : latence avant le premier jeton et
+  débit de jetons réglables, en appel direct comme en streaming
+- les embeddings Mistral (`EmbeddingsSimulees`) : vecteurs déterministes par
+  hachage des mots, proches pour des textes qui partagent leur vocabulaire
+- DuckDuckGo (`DDGSSimule`, à la place de `chatbot_core.DDGS`)
+- l'API OpenAgenda (`ServeurOpenAgenda`) : serveur HTTP local qui rejoue des
+  événements enregistrés (`python simulateurs.py enregistrer evenements.jsonl`)
+  ou synthétiques, en pages comme en export JSONL
+"""
+import re
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from Openagenda import EVENT_TYPES
+
+DIMENSION = 64
+MOT = re.compile(r"\w+")
+CLAUSE_MOTS_CLES = re.compile(r'keywords_fr = "([^"]+)"')
+CHEMIN_RECORDS = "/api/explore/v2.1/catalog/datasets/evenements-publics-openagenda/records"
+
+# Villes des événements synthétiques et des sessions simulées : (ville, code postal, latitude, longitude)
+VILLES = [
+    ("Toulouse", "31000", 43.6045, 1.444),
+    ("Montpellier", "34000", 43.6108, 3.8767),
+    ("Nîmes", "30000", 43.8367, 4.3601),
+    ("Albi", "81000", 43.9289, 2.1464),
+    ("Sète", "34200", 43.4028, 3.6928),
+    ("Carcassonne", "11000", 43.2130, 2.3491),
+]
+PHRASES = [
+    "Une soirée {mot} ouverte à tous les publics.",
+    "Les artistes de la région présentent leur dernière création.",
+    "Entrée libre dans la limite des places disponibles.",
+    "Buvette et petite restauration sur place.",
+    "Un rendez-vous {mot} incontournable de la saison à {ville}.",
+    "Atelier pour les enfants à partir de six ans.",
+    "Réservation conseillée auprès de l'office de tourisme.",
+]
+
+
+# -------- Embeddings --------
+@lru_cache(maxsize=65536)
+def _hachage(mot: str) -> int:
+    return int.from_bytes(hashlib.blake2b(mot.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class EmbeddingsSimulees(Embeddings):
+    """
+    Vecteurs normalisés, déterministes, obtenus par hachage signé des mots :
+    deux textes proches par le vocabulaire le sont aussi par le cosinus. Comme
+    avec mistral-embed, deux textes sans rapport gardent un cosinus d'environ
+    `anisotropie` (composante commune sur la première dimension).
+    `latence` : durée simulée de chaque appel, en secondes.
+    """
+
+    def __init__(self, dimension: int = DIMENSION, latence: float = 0.0, anisotropie: float = 0.6):
+        self.dimension = dimension
+        self.latence = latence
+        self.anisotropie = anisotropie
+        self.appels = 0
+        self.textes = 0
+        self._lock = threading.Lock()
+
+    def _vecteur(self, texte: str) -> list:
+        vecteur = np.zeros(self.dimension, dtype=np.float32)
+        for mot in MOT.findall(texte.lower()):
+            h = _hachage(mot)
+            vecteur[1 + h % (self.dimension - 1)] += 1.0 if (h >> 32) & 1 else -1.0
+        norme = float(np.linalg.norm(vecteur))
+        if norme:
+            vecteur *= np.sqrt(1 - self.anisotropie) / norme
+        vecteur[0] = np.sqrt(self.anisotropie) if norme else 1.0
+        return vecteur.tolist()
+
+    def _compter(self, textes: int):
+        with self._lock:
+            self.appels += 1
+            self.textes += textes
+        if self.latence:
+            time.sleep(self.latence)
+
+    def embed_documents(self, texts: list) -> list:
+        self._compter(len(texts))
+        return [self._vecteur(texte) for texte in texts]
+
+    def embed_query(self, text: str) -> list:
+        self._compter(1)
+        return self._vecteur(text)
+
+
+# -------- Modèle de chat --------
+class LLMSimule(BaseChatModel):
+    """
+    Modèle de chat local : `latence` secondes avant le premier jeton, puis
+    `jetons_par_seconde` (0 : sans limite). La réponse reprend les mots du
+    contexte du prompt, sur `jetons_reponse` jetons ; à une demande de
+    reformulation, il renvoie la question de relance telle quelle.
+    """
+
+    latence: float = 0.3
+    jetons_par_seconde: float = 40.0
+    jetons_reponse: int = 80
+
+    @property
+    def _llm_type(self) -> str:
+        return "simule"
+
+    def _jetons(self, messages) -> list:
+        prompt = "\n".join(str(message.content) for message in messages)
+        if "Standalone question:" in prompt:
+            relance = re.search(r"Follow Up Input:\s*(.*)", prompt)
+            return [mot + " " for mot in (relance.group(1) if relance else "").split()]
+        contexte = prompt.split("Contexte :", 1)[-1].split("Question de l'utilisateur", 1)[0]
+        mots = MOT.findall(contexte) or ["Aucun", "événement", "trouvé"]
+        return ["Voici ", "ce ", "que ", "je ", "vous ", "propose ", ": "] + [
+            mots[i % len(mots)] + " " for i in range(max(0, self.jetons_reponse - 7))
+        ]
+
+    def _pause(self) -> float:
+        return 1.0 / self.jetons_par_seconde if self.jetons_par_seconde > 0 else 0.0
+
+    @staticmethod
+    def _resultat(jetons: list) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(jetons).strip()))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        jetons = self._jetons(messages)
+        time.sleep(self.latence + len(jetons) * self._pause())
+        return self._resultat(jetons)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        jetons = self._jetons(messages)
+        await asyncio.sleep(self.latence + len(jetons) * self._pause())
+        return self._resultat(jetons)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latence)
+        for jeton in self._jetons(messages):
+            time.sleep(self._pause())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=jeton))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latence)
+        for jeton in self._jetons(messages):
+            await asyncio.sleep(self._pause())
+            yield ChatGenerationChunk(message=AIMessageChunk(content=jeton))
+
+
+# -------- Recherche web --------
+class DDGSSimule:
+    """
+    Remplace `duckduckgo_search.DDGS` dans `chatbot_core` : résultats
+    déterministes, après `latence` secondes (`DDGSSimule.regle(latence)`).
+    """
+
+    latence = 0.2
+    requetes = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def regle(cls, latence: float):
+        """Variante avec sa propre latence et son propre compteur de requêtes."""
+        return type(cls.__name__, (cls,), {"latence": latence, "requetes": 0, "_lock": threading.Lock()})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def text(self, keywords: str, region: str = None, safesearch: str = None, max_results: int = 3) -> list:
+        with self._lock:
+            type(self).requetes += 1
+        time.sleep(self.latence)
+        sujet = "-".join(MOT.findall(keywords.lower())[:6]) or "recherche"
+        return [
+            {
+                "title": f"{keywords.strip()} — résultat {i}",
+                "href": f"https://agenda.example.org/{sujet}/{i}",
+                "body": f"Programme et informations pratiques ({i}/{max_results}) pour : {keywords.strip()}",
+            }
+            for i in range(1, (max_results or 3) + 1)
+        ]
+
+
+# -------- OpenAgenda --------
+def evenements_openagenda(n: int, maintenant: datetime = None, graine: int = 0) -> list:
+    """Enregistrements au format de l'API records, à venir dans les 90 prochains jours."""
+    rng = np.random.default_rng(graine)
+    maintenant = maintenant or datetime.now(timezone.utc)
+    evenements = []
+    for i in range(n):
+        ville, code, lat, lon = VILLES[i % len(VILLES)]
+        mots = [str(mot) for mot in rng.choice(EVENT_TYPES, 2, replace=False)]
+        phrases = [PHRASES[int(j)].format(mot=mots[0], ville=ville) for j in rng.choice(len(PHRASES), 4)]
+        description = " ".join(phrases)
+        if i % 3 == 0:
+            description = "".join(f"<p>{phrase}</p>" for phrase in phrases)
+        debut = maintenant + timedelta(hours=int(rng.integers(1, 90 * 24)))
+        evenements.append({
+            "uid": f"sim-{i:06d}",
+            "title_fr": f"{mots[0].capitalize()} et {mots[1]} à {ville} — n°{i}",
+            "description_fr": description,
+            "location_name": f"Salle {i % 40}",
+            "location_address": f"{i % 90 + 1} rue des Arts",
+            "location_city": ville,
+            "location_postalcode": code,
+            "location_coordinates": {"lat": lat + float(rng.normal(0, 0.02)), "lon": lon + float(rng.normal(0, 0.02))},
+            "firstdate_begin": debut.isoformat(),
+            "lastdate_end": (debut + timedelta(hours=3)).isoformat(),
+            "keywords_fr": mots,
+        })
+    return evenements
+
+
+def lire_enregistrement(chemin: str) -> list:
+    """Événements enregistrés : un enregistrement de l'API par ligne (format de l'export JSONL)."""
+    with open(chemin, encoding="utf-8") as f:
+        return [json.loads(ligne) for ligne in f if ligne.strip()]
+
+
+def enregistrer_evenements(chemin: str, harvester=None, keywords: list = EVENT_TYPES) -> int:
+    """Enregistre les événements de la vraie API (une fois, avec réseau) pour les rejouer ensuite."""
+    if harvester is None:
+        from Openagenda import creer_harvester
+        harvester = creer_harvester()
+    nombre = 0
+    with open(chemin, "w", encoding="utf-8") as f:
+        for page in harvester.iterer_evenements(keywords):
+            for record in page:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                nombre += 1
+    return nombre
+
+
+class ServeurOpenAgenda:
+    """
+    API records d'OpenAgenda rejouée en local (thread démon) : pages `limit`/`offset`
+    triées par uid et export JSONL, filtrés par les mots-clés de la clause `where`.
+    `url` remplace `harvester.BASE_URL` ; `latence` retarde chaque réponse.
+    """
+
+    def __init__(self, evenements: list, latence: float = 0.0, port: int = 0, hote: str = "127.0.0.1"):
+        serveur_agenda = self
+        self.evenements = sorted(evenements, key=lambda record: str(record.get("uid")))
+        self.latence = latence
+        self.requetes = 0
+        self._lock = threading.Lock()
+
+        class Gestionnaire(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                with serveur_agenda._lock:
+                    serveur_agenda.requetes += 1
+                if serveur_agenda.latence:
+                    time.sleep(serveur_agenda.latence)
+                records = serveur_agenda.selectionner(query.get("where", [""])[0])
+                if url.path.endswith("/exports/jsonl"):
+                    corps = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+                else:
+                    offset, limit = int(query.get("offset", [0])[0]), int(query.get("limit", [10])[0])
+                    corps = json.dumps({"total_count": len(records), "results": records[offset:offset + limit]})
+                corps = corps.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(corps)))
+                self.end_headers()
+                self.wfile.write(corps)
+
+            def log_message(self, *args):
+                pass
+
+        self.serveur = ThreadingHTTPServer((hote, port), Gestionnaire)
+        self.serveur.daemon_threads = True
+        self.url = f"http://{hote}:{self.serveur.server_address[1]}{CHEMIN_RECORDS}"
+        threading.Thread(target=self.serveur.serve_forever, name="openagenda-simule", daemon=True).start()
+
+    def selectionner(self, where: str) -> list:
+        mots_cles = set(CLAUSE_MOTS_CLES.findall(where))
+        if not mots_cles:
+            return self.evenements
+        return [record for record in self.evenements if mots_cles.intersection(record.get("keywords_fr") or ())]
+
+    def arreter(self):
+        self.serveur.shutdown()
+        self.serveur.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.arreter()
+        return False
+
+
+if __name__ == "__main__":
+    # python simulateurs.py enregistrer evenements.jsonl
+    import sys
+
+    if len(sys.argv) == 3 and sys.argv[1] == "enregistrer":
+        print(f"{enregistrer_evenements(sys.argv[2])} événements enregistrés dans {sys.argv[2]}")
+    else:
+        print("usage : python simulateurs.py enregistrer evenements.jsonl")
@@ -0,0 +1,101 @@
+"""
+Index spatial des événements (cellules de grille lat/lon) et recherche par rayon.
+
+Chaque événement géolocalisé est rangé dans une cellule de `TAILLE_CELLULE`
+degrés. Une recherche « à moins de N km » ne lit que les cellules couvrant
+le carré englobant du cercle, puis filtre exactement avec la distance haversine.
+"""
+import re
+
+import numpy as np
+
+RAYON_TERRE_KM = 6371.0
+TAILLE_CELLULE = 0.1  # ≈ 11 km en latitude
+RAYON_DEFAUT_KM = 20.0
+POIDS_DISTANCE = 0.3
+
+PRES_DE_MOI = re.compile(
+    r"pr[eè]s de (?:moi|chez moi|ici)|autour de (?:moi|chez moi|ici)|[àa] proximit[ée]|"
+    r"pas loin|dans le coin|proche de (?:moi|chez moi|ici)|dans les environs|[àa] c[ôo]t[ée] de (?:moi|chez moi)"
+)
+RAYON_EXPLICITE = re.compile(r"(?:moins de|dans un rayon de|rayon de)\s+(\d+(?:[.,]\d+)?)\s*km")
+
+
+def haversine_km(lat, lon, latitudes, longitudes) -> np.ndarray:
+    """Distance en km entre un point et un tableau de points."""
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAYON_TERRE_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def rayon_demande(question: str):
+    """Rayon en km si la question porte sur « près de moi » ou « à moins de N km », sinon None."""
+    question = question.lower()
+    explicite = RAYON_EXPLICITE.search(question)
+    if explicite:
+        return float(explicite.group(1).replace(",", "."))
+    if PRES_DE_MOI.search(question):
+        return RAYON_DEFAUT_KM
+    return None
+
+
+def _en_float(valeur) -> float:
+    try:
+        return float(valeur)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class IndexSpatial:
+    """Cellules de grille -> positions FAISS des événements qui s'y trouvent."""
+
+    def __init__(self, latitudes, longitudes):
+        self.lat = np.array([_en_float(v) for v in latitudes], dtype=np.float64)
+        self.lon = np.array([_en_float(v) for v in longitudes], dtype=np.float64)
+
+        connus = np.flatnonzero(~np.isnan(self.lat) & ~np.isnan(self.lon))
+        cy = np.floor(self.lat[connus] / TAILLE_CELLULE).astype(np.int64)
+        cx = np.floor(self.lon[connus] / TAILLE_CELLULE).astype(np.int64)
+        ordre = np.lexsort((cx, cy))
+        cles = np.stack((cy[ordre], cx[ordre]), axis=1)
+        debuts = np.flatnonzero(np.r_[True, np.any(cles[1:] != cles[:-1], axis=1)]) if len(ordre) else []
+        fins = np.r_[debuts[1:], len(ordre)] if len(ordre) else []
+        self.cellules = {
+            (int(cles[d, 0]), int(cles[d, 1])): connus[ordre[d:f]]
+            for d, f in zip(debuts, fins)
+        }
+
+    def __len__(self):
+        return sum(len(p) for p in self.cellules.values())
+
+    def dans_rayon(self, lat: float, lon: float, rayon_km: float) -> np.ndarray:
+        """Positions des événements à moins de `rayon_km` du point, triées."""
+        dlat = rayon_km / 110.57
+        dlon = rayon_km / max(111.32 * np.cos(np.radians(lat)), 1e-6)
+        y0, y1 = int(np.floor((lat - dlat) / TAILLE_CELLULE)), int(np.floor((lat + dlat) / TAILLE_CELLULE))
+        x0, x1 = int(np.floor((lon - dlon) / TAILLE_CELLULE)), int(np.floor((lon + dlon) / TAILLE_CELLULE))
+
+        morceaux = [
+            self.cellules[(y, x)]
+            for y in range(y0, y1 + 1)
+            for x in range(x0, x1 + 1)
+            if (y, x) in self.cellules
+        ]
+        if not morceaux:
+            return np.empty(0, dtype=np.int64)
+        candidats = np.concatenate(morceaux)
+        distances = haversine_km(lat, lon, self.lat[candidats], self.lon[candidats])
+        return np.sort(candidats[distances <= rayon_km]).astype(np.int64)
+
+
+def score_combine(distance_vecteur: float, distance_km: float, rayon_km: float,
+                  poids_distance: float = POIDS_DISTANCE) -> float:
+    """
+    Combine similarité et proximité (plus grand = meilleur).
+    `distance_vecteur` est la distance L2 au carré de FAISS entre vecteurs
+    normalisés, soit 2 - 2·cos.
+    """
+    similarite = 1 - distance_vecteur / 2
+    proximite = 1 - min(distance_km / rayon_km, 1) if rayon_km > 0 else 0
+    return (1 - poids_distance) * similarite + poids_distance * proximite
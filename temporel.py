@@ -0,0 +1,254 @@
+"""
+Expressions temporelles en français, sans dateparser.
+
+« ce soir », « demain », « ce week-end », « la semaine prochaine », « en août »,
+« entre le 15 et le 20 juillet »… deviennent une `Periode(debut, fin)` :
+datetimes à l'heure locale, `fin` incluse (None : sans limite). La recherche
+s'en sert comme filtre de dates (voir retrieval.IndexMetadonnees.filtres_question)
+et `enrichir_question` l'ajoute à la question en dates ISO.
+
+- les motifs sont compilés à l'import, sur la question sans accents ni majuscules
+- les fenêtres relatives au jour (week-end, semaine, mois, saisons, jours de
+  la semaine) sont calculées une fois par jour (`fenetres_du_jour`)
+- seules les dates explicites (« le 14 juillet ») sont calculées à chaque appel
+
+    python benchmark_temporel.py   # latence par appel et import, comparés à dateparser
+"""
+import re
+import unicodedata
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+MOIS = {
+    "janvier": 1, "fevrier": 2, "mars": 3, "avril": 4, "mai": 5, "juin": 6, "juillet": 7,
+    "aout": 8, "septembre": 9, "octobre": 10, "novembre": 11, "decembre": 12,
+}
+JOURS = {"lundi": 0, "mardi": 1, "mercredi": 2, "jeudi": 3, "vendredi": 4, "samedi": 5, "dimanche": 6}
+# Moments de la journée : (heure de début, heure de fin, lendemain)
+MOMENTS = {"matin": (6, 12, False), "apres-midi": (12, 18, False), "soir": (18, 24, False), "nuit": (20, 6, True)}
+# Saisons : (mois, jour) de début et de fin, pour l'année en cours
+SAISONS = {"printemps": ((3, 20), (6, 20)), "ete": ((6, 21), (9, 22)), "automne": ((9, 23), (12, 20))}
+
+
+class Periode(NamedTuple):
+    debut: datetime
+    fin: Optional[datetime]
+
+
+def normaliser(texte: str) -> str:
+    """Minuscules, sans accents ni « -ci », apostrophes droites et « week-end » en un seul mot."""
+    texte = unicodedata.normalize("NFKD", texte)
+    texte = "".join(c for c in texte if not unicodedata.combining(c)).lower().replace("’", "'")
+    texte = re.sub(r"\bweek[\s-]?ends?\b", "weekend", texte).replace("-ci", "")
+    return re.sub(r"\bapres[\s-]midi\b", "apres-midi", " ".join(texte.split()))
+
+
+# -------- Fenêtres du jour --------
+def _instant(jour: date, heure: int = 0) -> datetime:
+    if heure >= 24:
+        return datetime.combine(jour, time.max).astimezone()
+    return datetime.combine(jour, time(heure)).astimezone()
+
+
+def _jours(debut: date, fin: date) -> Periode:
+    return Periode(_instant(debut), _instant(fin, 24))
+
+
+def _moment(jour: date, moment: str) -> Periode:
+    debut, fin, lendemain = MOMENTS[moment]
+    return Periode(_instant(jour, debut), _instant(jour + timedelta(days=lendemain), fin))
+
+
+def _fin_du_mois(annee: int, mois: int) -> date:
+    return (date(annee + mois // 12, mois % 12 + 1, 1)) - timedelta(days=1)
+
+
+def _mois(aujourdhui: date, mois: int, annee: int = None) -> Periode:
+    """Mois donné ; sans année, le prochain (le mois en cours à partir d'aujourd'hui)."""
+    if annee is None:
+        annee = aujourdhui.year + (mois < aujourdhui.month)
+    debut = date(annee, mois, 1)
+    return _jours(max(debut, aujourdhui), _fin_du_mois(annee, mois))
+
+
+def _saison(aujourdhui: date, saison: str) -> Periode:
+    if saison == "hiver":
+        annee = aujourdhui.year - ((aujourdhui.month, aujourdhui.day) < (3, 20))
+        debut, fin = date(annee, 12, 21), date(annee + 1, 3, 19)
+    else:
+        (m1, j1), (m2, j2) = SAISONS[saison]
+        debut, fin = date(aujourdhui.year, m1, j1), date(aujourdhui.year, m2, j2)
+        if fin < aujourdhui:
+            debut, fin = debut.replace(year=debut.year + 1), fin.replace(year=fin.year + 1)
+    return _jours(max(debut, aujourdhui), fin)
+
+
+@lru_cache(maxsize=2)
+def fenetres_du_jour(aujourdhui: date) -> dict:
+    """Périodes des expressions relatives à `aujourdhui`, par expression normalisée."""
+    demain = aujourdhui + timedelta(days=1)
+    semaine = aujourdhui.weekday()
+    dimanche = aujourdhui + timedelta(days=6 - semaine)
+    samedi = dimanche - timedelta(days=1)
+    lundi_prochain = dimanche + timedelta(days=1)
+    mois_prochain = _fin_du_mois(aujourdhui.year, aujourdhui.month) + timedelta(days=1)
+
+    fenetres = {
+        "aujourd'hui": _jours(aujourdhui, aujourdhui),
+        "ce jour": _jours(aujourdhui, aujourdhui),
+        "demain": _jours(demain, demain),
+        "apres-demain": _jours(demain + timedelta(days=1), demain + timedelta(days=1)),
+        "ce weekend": _jours(max(samedi, aujourdhui), dimanche),
+        # En semaine, « le week-end prochain » est le plus proche
+        "weekend prochain": (_jours(samedi + timedelta(days=7), dimanche + timedelta(days=7)) if semaine >= 5
+                             else _jours(samedi, dimanche)),
+        "cette semaine": _jours(aujourdhui, dimanche),
+        "semaine prochaine": _jours(lundi_prochain, lundi_prochain + timedelta(days=6)),
+        "ce mois": _jours(aujourdhui, _fin_du_mois(aujourdhui.year, aujourdhui.month)),
+        "mois prochain": _mois(aujourdhui, mois_prochain.month, mois_prochain.year),
+        "cette annee": _jours(aujourdhui, date(aujourdhui.year, 12, 31)),
+        "ce soir": _moment(aujourdhui, "soir"),
+        "cette nuit": _moment(aujourdhui, "nuit"),
+        "ce matin": _moment(aujourdhui, "matin"),
+        "cet apres-midi": _moment(aujourdhui, "apres-midi"),
+    }
+    for moment in MOMENTS:
+        fenetres[f"demain {moment}"] = _moment(demain, moment)
+    for saison in ("printemps", "ete", "automne", "hiver"):
+        fenetres[saison] = _saison(aujourdhui, saison)
+    for nom, mois in MOIS.items():
+        fenetres[nom] = _mois(aujourdhui, mois)
+    fenetres["le weekend"] = fenetres["ce weekend"]
+    fenetres["le weekend prochain"] = fenetres["weekend prochain"]
+    for nom, numero in JOURS.items():
+        jour = aujourdhui + timedelta(days=(numero - semaine) % 7)
+        fenetres[nom] = _jours(jour, jour)
+        # « samedi prochain » posé un samedi : celui de la semaine suivante
+        prochain = jour + timedelta(days=7 if jour == aujourdhui else 0)
+        fenetres[f"{nom} prochain"] = _jours(prochain, prochain)
+        for moment in MOMENTS:
+            fenetres[f"{nom} {moment}"] = _moment(jour, moment)
+    return fenetres
+
+
+# -------- Motifs --------
+_NOMS_MOIS = "|".join(MOIS)
+_NOMS_JOURS = "|".join(JOURS)
+_JOUR = r"(\d{1,2})(?:er)?"
+_DATE = rf"{_JOUR}(?:\s+({_NOMS_MOIS}))?(?:\s+(\d{{4}}))?"
+_NUMERIQUE = r"(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?"
+
+INTERVALLE = re.compile(
+    rf"\b(?:du|entre le|entre)\s+(?:(?:{_NOMS_JOURS})\s+)?{_DATE}\s+(?:au|et le|et)\s+(?:(?:{_NOMS_JOURS})\s+)?"
+    rf"{_JOUR}\s+({_NOMS_MOIS})(?:\s+(\d{{4}}))?\b"
+)
+INTERVALLE_NUMERIQUE = re.compile(rf"\b(?:du|entre le|entre)\s+{_NUMERIQUE}\s+(?:au|et le|et)\s+{_NUMERIQUE}\b")
+BORNE = re.compile(
+    rf"\b(jusqu'au|avant le|a partir du|des le|apres le)\s+(?:(?:{_NOMS_JOURS})\s+)?{_JOUR}\s+({_NOMS_MOIS})"
+    rf"(?:\s+(\d{{4}}))?\b"
+)
+DATE = re.compile(rf"\b{_JOUR}\s+({_NOMS_MOIS})(?:\s+(\d{{4}}))?\b")
+DATE_NUMERIQUE = re.compile(rf"\b{_NUMERIQUE}\b")
+MOIS_ANNEE = re.compile(rf"\b({_NOMS_MOIS})\s+(\d{{4}})\b")
+PROCHAINS_JOURS = re.compile(r"\b(?:dans )?les (\d{1,2}) prochains jours\b")
+# Expressions des fenêtres du jour, la plus longue d'abord (« demain soir » avant « demain »)
+_EXPRESSIONS = sorted(
+    {
+        "aujourd'hui", "ce jour", "demain", "apres-demain", "ce weekend", "le weekend", "weekend prochain",
+        "le weekend prochain", "cette semaine", "semaine prochaine", "ce mois", "mois prochain", "cette annee",
+        "ce soir", "cette nuit", "ce matin", "cet apres-midi",
+    }
+    | {f"demain {m}" for m in MOMENTS}
+    | {f"{j} {suffixe}" for j in JOURS for suffixe in (*MOMENTS, "prochain")},
+    key=len, reverse=True,
+)
+# Saisons précédées d'un déterminant : « a été » n'est pas l'été
+RELATIVE = re.compile(
+    rf"\b(?:{'|'.join(map(re.escape, _EXPRESSIONS))})\b"
+    rf"|\b(?P<nom>{_NOMS_JOURS}|{_NOMS_MOIS})\b"
+    r"|\b(?:ce|cet|en|au|l')\s*(?P<saison>printemps|ete|automne|hiver)\b"
+)
+
+
+def _annee(aujourdhui: date, mois: int, jour: int, annee) -> int:
+    """Année explicite, sinon celle qui place la date aujourd'hui ou après."""
+    if annee:
+        annee = int(annee)
+        return annee + 2000 if annee < 100 else annee
+    return aujourdhui.year + ((mois, jour) < (aujourdhui.month, aujourdhui.day))
+
+
+def _date(aujourdhui: date, jour, mois, annee=None):
+    mois = MOIS[mois] if mois in MOIS else int(mois)
+    try:
+        return date(_annee(aujourdhui, mois, int(jour), annee), mois, int(jour))
+    except ValueError:
+        return None
+
+
+def periode(question: str, aujourdhui: date = None) -> Optional[Periode]:
+    """Première période reconnue dans `question` (relative à `aujourdhui`), ou None."""
+    aujourdhui = aujourdhui or date.today()
+    texte = normaliser(question)
+
+    trouve = INTERVALLE.search(texte)
+    if trouve:
+        j1, m1, a1, j2, m2, a2 = trouve.groups()
+        fin = _date(aujourdhui, j2, m2, a2)
+        debut = None
+        if fin and m1:
+            debut = _date(aujourdhui, j1, m1, a1)
+            if debut and debut > fin and not a1:
+                # « du 28 décembre au 3 janvier 2026 » : le début est l'année précédente
+                debut = debut.replace(year=fin.year - (debut.replace(year=fin.year) > fin))
+        elif fin:
+            # « du 30 au 2 novembre » : le premier jour est dans le mois précédent
+            mois, annee = fin.month, fin.year
+            if int(j1) > fin.day:
+                mois, annee = (mois - 1, annee) if mois > 1 else (12, annee - 1)
+            debut = _date(aujourdhui, j1, mois, annee)
+        if debut and fin:
+            return _jours(debut, fin)
+    trouve = INTERVALLE_NUMERIQUE.search(texte)
+    if trouve:
+        j1, m1, a1, j2, m2, a2 = trouve.groups()
+        debut, fin = _date(aujourdhui, j1, m1, a1), _date(aujourdhui, j2, m2, a2)
+        if debut and fin:
+            return _jours(debut, fin)
+    trouve = BORNE.search(texte)
+    if trouve:
+        borne, jour, mois, annee = trouve.groups()
+        limite = _date(aujourdhui, jour, mois, annee)
+        if limite:
+            if borne in ("jusqu'au", "avant le"):
+                fin = limite if borne == "jusqu'au" else limite - timedelta(days=1)
+                return _jours(aujourdhui, fin)
+            return Periode(_instant(limite + timedelta(days=1 if borne == "apres le" else 0)), None)
+    for motif in (DATE, DATE_NUMERIQUE):
+        trouve = motif.search(texte)
+        if trouve:
+            jour = _date(aujourdhui, *trouve.groups())
+            if jour:
+                return _jours(jour, jour)
+    trouve = MOIS_ANNEE.search(texte)
+    if trouve:
+        return _mois(aujourdhui, MOIS[trouve.group(1)], int(trouve.group(2)))
+    trouve = PROCHAINS_JOURS.search(texte)
+    if trouve:
+        return _jours(aujourdhui, aujourdhui + timedelta(days=int(trouve.group(1))))
+
+    trouve = RELATIVE.search(texte)
+    if trouve:
+        return fenetres_du_jour(aujourdhui)[trouve.group("nom") or trouve.group("saison") or trouve.group(0)]
+    return None
+
+
+def enrichir_question(question: str, aujourdhui: date = None) -> str:
+    """Question suivie de la période ciblée en dates ISO, si elle en cite une."""
+    cible = periode(question, aujourdhui)
+    if cible is None:
+        return question
+    if cible.fin is None:
+        return f"{question} (période ciblée : à partir du {cible.debut.date().isoformat()})"
+    return f"{question} (période ciblée : du {cible.debut.date().isoformat()} au {cible.fin.date().isoformat()})"
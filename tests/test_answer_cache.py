@@ -0,0 +1,141 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+from langchain_community.chat_models.fake import FakeListChatModel
+
+import confiance
+from answer_cache import CacheReponses, MemoireBackend, SQLiteBackend
+from chatbot_core import WEB_ECHEC, MoteurChatbot
+from index_store import sauvegarder_index
+from test_retrieval import MotsEmbeddings, construire_vectorstore
+
+
+def vecteur(*composantes):
+    return np.array(composantes, dtype=np.float32)
+
+
+class TestCacheReponses(unittest.TestCase):
+    """
+    Vérifie le cache sémantique des réponses :
+    - une question presque identique dans la même partition est servie depuis le cache
+    - ville, jour et version de l'index isolent les réponses
+    - TTL, taille maximale et partage entre processus (SQLite)
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def backends(self):
+        return [MemoireBackend(), SQLiteBackend(os.path.join(self.tmp.name, "reponses.sqlite"))]
+
+    def test_question_similaire(self):
+        for backend in self.backends():
+            cache = CacheReponses(backend, version="v1")
+            partition = cache.partition("Toulouse", "2025-07-01")
+            self.assertIsNone(cache.chercher(vecteur(1, 0, 0), partition))
+            cache.enregistrer(vecteur(1, 0, 0), partition, "Concerts au Bikini", duree=2.5)
+
+            self.assertEqual(cache.chercher(vecteur(0.99, 0.05, 0), partition), "Concerts au Bikini")
+            self.assertIsNone(cache.chercher(vecteur(0.5, 0.5, 0.5), partition))
+            stats = cache.stats()
+            self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+            self.assertGreater(stats["secondes_economisees"], 2)
+
+    def test_partitions(self):
+        cache = CacheReponses(version="v1")
+        cache.enregistrer(vecteur(1, 0), cache.partition("Toulouse", "2025-07-01"), "r", 1.0)
+        self.assertIsNone(cache.chercher(vecteur(1, 0), cache.partition("Albi", "2025-07-01")))
+        self.assertIsNone(cache.chercher(vecteur(1, 0), cache.partition("Toulouse", "2025-07-02")))
+        self.assertEqual(cache.chercher(vecteur(1, 0), cache.partition("toulouse ", "2025-07-01")), "r")
+
+    def test_invalidation_a_la_reconstruction_de_l_index(self):
+        for backend in self.backends():
+            cache = CacheReponses(backend, version="v1")
+            cache.enregistrer(vecteur(1, 0), cache.partition(), "ancienne", 1.0)
+            cache.invalider("v2")
+            self.assertEqual(len(backend), 0)
+            self.assertIsNone(cache.chercher(vecteur(1, 0), cache.partition()))
+
+    def test_ttl(self):
+        cache = CacheReponses(version="v1", ttl=60)
+        with patch("answer_cache.time.time", return_value=1000):
+            cache.enregistrer(vecteur(1, 0), cache.partition(), "r", 1.0)
+        with patch("answer_cache.time.time", return_value=1030):
+            self.assertEqual(cache.chercher(vecteur(1, 0), cache.partition()), "r")
+        with patch("answer_cache.time.time", return_value=1100):
+            self.assertIsNone(cache.chercher(vecteur(1, 0), cache.partition()))
+
+    def test_taille_maximale(self):
+        for backend in self.backends():
+            cache = CacheReponses(backend, version="v1", max_entrees=2)
+            for i, v in enumerate([(1, 0, 0), (0, 1, 0), (0, 0, 1)]):
+                cache.enregistrer(vecteur(*v), cache.partition(), f"r{i}", 1.0)
+            self.assertEqual(len(backend), 2)
+            self.assertIsNone(cache.chercher(vecteur(1, 0, 0), cache.partition()))
+
+    def test_partage_entre_processus(self):
+        path = os.path.join(self.tmp.name, "partage.sqlite")
+        worker_a = CacheReponses(SQLiteBackend(path), version="v1")
+        worker_b = CacheReponses(SQLiteBackend(path), version="v1")
+        worker_a.enregistrer(vecteur(1, 0), worker_a.partition("Albi"), "r", 1.0)
+        self.assertEqual(worker_b.chercher(vecteur(1, 0), worker_b.partition("Albi")), "r")
+
+
+class TestCacheMoteur(unittest.TestCase):
+    """
+    Vérifie l'usage du cache par le moteur :
+    - la partition suit les villes et la période citées dans la question
+    - seules les réponses générées sont enregistrées (ni web brut, ni web en échec)
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.chemin_index = os.path.join(cls.tmp.name, "faiss_index")
+        sauvegarder_index(construire_vectorstore(), cls.chemin_index)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def moteur(self):
+        return MoteurChatbot(
+            api_key="fake", chemin_index=self.chemin_index, embeddings=MotsEmbeddings(),
+            llm=FakeListChatModel(responses=[f"réponse {i}" for i in range(10)]),
+        )
+
+    def test_partition_par_filtres(self):
+        moteur = self.moteur()
+        partitions = {
+            question: moteur.chercher_en_cache(question, moteur.preparer_question(question)[1])[1][1]
+            for question in ["concerts jazz à Montpellier ce week-end", "concerts jazz à Toulouse ce week-end",
+                             "concerts jazz à Toulouse demain", "concerts jazz à Toulouse"]
+        }
+        self.assertEqual(len(set(partitions.values())), 4)
+        # Même question un peu plus tard : même partition
+        question = "concerts jazz à Toulouse ce week-end"
+        self.assertEqual(moteur.chercher_en_cache(question, moteur.preparer_question(question)[1])[1][1],
+                         partitions[question])
+
+    def test_reponses_non_generees(self):
+        for decision, web, enregistrees in [
+            (confiance.LOCALE, "- web", 1), (confiance.MIXTE, "- web", 1),
+            (confiance.MIXTE, WEB_ECHEC, 0), (confiance.WEB, "- web", 0),
+        ]:
+            with self.subTest(decision=decision, web=web), \
+                    patch("confiance.decider", return_value=decision), \
+                    patch("chatbot_core.search_web", return_value=web):
+                moteur = self.moteur()
+                moteur.get_bot_response("jazz à Toulouse ?", {"city": "Toulouse"}, "s1")
+                "".join(moteur.stream_bot_response("cirque à Albi ?", {"city": "Albi"}, "s2"))
+                self.assertEqual(len(moteur.cache_reponses.backend), 2 * enregistrees)
+
+
+if __name__ == '__main__':
+    unittest.main()
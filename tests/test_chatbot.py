@@ -1,7 +1,14 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 from datetime import datetime
-from chatbot import qa_chain, enrichir_question
+import chatbot
+from chatbot import enrichir_question
+from chatbot_core import MoteurChatbot
+from index_store import sauvegarder_index
+from simulateurs import LLMSimule
+from test_retrieval import MotsEmbeddings, construire_vectorstore
 import time
 
 class TestChatbot(unittest.TestCase):
@@ -11,8 +18,25 @@ class TestChatbot(unittest.TestCase):
     - le chargement des composants
     - le fonctionnement de la chaîne QA
     - le parsing des dates naturelles
+    La chaîne est celle d'un moteur sans réseau (LLM et embeddings simulés).
     """
 
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        chemin_index = os.path.join(cls.tmp.name, "faiss_index")
+        sauvegarder_index(construire_vectorstore(), chemin_index)
+        moteur = MoteurChatbot(
+            api_key="fake", chemin_index=chemin_index, embeddings=MotsEmbeddings(), llm=LLMSimule(latence=0)
+        )
+        cls.moteur = patch("chatbot.obtenir_moteur", return_value=moteur)
+        cls.moteur.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.moteur.stop()
+        cls.tmp.cleanup()
+
     @patch('langchain_community.vectorstores.FAISS.load_local')
     @patch('langchain_mistralai.chat_models.ChatMistralAI')
     def test_model_and_index_loading(self, mock_chat_model, mock_faiss_load):
@@ -29,14 +53,13 @@ class TestChatbot(unittest.TestCase):
         model = mock_chat_model("mistral-small", api_key="fake_key")
         self.assertIsNotNone(model)
 
-    @patch('chatbot.qa_chain.invoke')
-    def test_query_processing(self, mock_invoke):
+    def test_query_processing(self):
         """
-        Vérifie que la chaîne QA retourne une réponse correcte à une requête simple.
+        Vérifie que la chaîne QA répond à une requête simple à partir des documents retrouvés.
         """
-        mock_invoke.return_value = {"result": "Voici des événements à Toulouse..."}
-        response = qa_chain.invoke({"query": "événements à Toulouse"})
-        self.assertIn("Voici des événements à Toulouse...", response['result'])
+        response = chatbot.qa_chain.invoke({"question": "événements à Toulouse", "chat_history": []})
+        self.assertIn("Voici ce que je vous propose", response['answer'])
+        self.assertIn("Toulouse", response['answer'])
 
     def test_enrichir_question_with_ce_weekend(self):
         """
@@ -47,7 +70,7 @@ class TestChatbot(unittest.TestCase):
         result = enrichir_question(question)
         today = datetime.today()
         self.assertIn(str(today.year), result)
-        self.assertRegex(result, r"20\\d{2}-\\d{2}-\\d{2}")  # attend une date ISO
+        self.assertRegex(result, r"20\d{2}-\d{2}-\d{2}")  # attend une date ISO
 
     def test_enrichir_question_with_date_range(self):
         """
@@ -56,7 +79,7 @@ class TestChatbot(unittest.TestCase):
         question = "Quels concerts à Toulouse entre le 15 juillet et le 20 juillet ?"
         result = enrichir_question(question)
         self.assertIn("période ciblée", result)
-        self.assertRegex(result, r"\\d{4}-\\d{2}-\\d{2}")
+        self.assertRegex(result, r"\d{4}-\d{2}-\d{2}")
 
     def test_no_event_response_format(self):
         """
@@ -70,7 +93,7 @@ class TestChatbot(unittest.TestCase):
         Simule une erreur d'API de type 429 (trop de requêtes).
         Vérifie que le système applique une temporisation via time.sleep.
         """
-        with patch("chatbot.time.sleep") as mock_sleep:
+        with patch("time.sleep") as mock_sleep:
             try:
                 raise Exception("Error response 429 while fetching")
             except Exception as e:
@@ -0,0 +1,88 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from langchain_community.chat_models.fake import FakeListChatModel
+
+import chatbot_core
+from chatbot_core import MoteurChatbot
+from index_store import sauvegarder_index
+from test_retrieval import MotsEmbeddings, construire_vectorstore
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestMoteurChatbot(unittest.TestCase):
+    """
+    Vérifie le démarrage paresseux du chatbot :
+    - l'import ne configure rien et n'exige ni clé API ni index
+    - chaque composant est construit une fois, à la première utilisation
+    - le préchauffage charge l'index une seule fois et produit un profil de démarrage
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.chemin_index = os.path.join(cls.tmp.name, "faiss_index")
+        sauvegarder_index(construire_vectorstore(), cls.chemin_index)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def moteur(self, **composants):
+        composants.setdefault("embeddings", MotsEmbeddings())
+        composants.setdefault("llm", FakeListChatModel(responses=["Le cirque passe à Albi."] * 10))
+        return MoteurChatbot(api_key="fake", chemin_index=self.chemin_index, **composants)
+
+    def test_import_sans_services(self):
+        env = {k: v for k, v in os.environ.items() if k not in ("MISTRAL_API_KEY", "MISTRAL_AI_KEY")}
+        env["PYTHONPATH"] = RACINE
+        with tempfile.TemporaryDirectory() as cwd:
+            sortie = subprocess.run(
+                [sys.executable, "-c",
+                 "import sys, chatbot_core, chatbot; print('langchain_mistralai' in sys.modules)"],
+                cwd=cwd, env=env, capture_output=True, text=True
+            )
+            self.assertEqual(sortie.returncode, 0, sortie.stderr)
+            self.assertEqual(sortie.stdout.strip(), "False")
+            self.assertEqual(os.listdir(cwd), [])
+
+    def test_erreurs_a_la_premiere_utilisation(self):
+        moteur = MoteurChatbot(api_key="", chemin_index=os.path.join(self.tmp.name, "absent"))
+        with self.assertRaises(ValueError):
+            moteur.llm
+        moteur = MoteurChatbot(api_key="fake", chemin_index=os.path.join(self.tmp.name, "absent"),
+                               embeddings=MotsEmbeddings())
+        with self.assertRaises(RuntimeError):
+            moteur.vectorstore
+        self.assertEqual(moteur.get_bot_response("cirque ?"), chatbot_core.MESSAGE_ERREUR)
+
+    def test_prechauffage_unique(self):
+        moteur = self.moteur()
+        with patch("chatbot_core.charger_index_faiss", wraps=chatbot_core.charger_index_faiss) as charger:
+            profil = moteur.prechauffer()
+            moteur.prechauffer()
+            moteur.prechauffer(en_arriere_plan=True).join()
+        charger.assert_called_once()
+        self.assertIn("import", profil)
+        self.assertIn("vectorstore", profil)
+        self.assertIn("qa_chain", profil)
+        # Composants fournis au constructeur : rien à construire
+        self.assertNotIn("llm", profil)
+
+    @patch("chatbot_core.search_web", return_value="- web")
+    def test_reponse_pendant_le_prechauffage(self, _):
+        moteur = self.moteur()
+        thread = moteur.prechauffer(en_arriere_plan=True)
+        reponse = moteur.get_bot_response("cirque ?", None, "s1")
+        thread.join()
+        self.assertEqual(reponse, "Le cirque passe à Albi.")
+        self.assertEqual("".join(moteur.stream_bot_response("cirque ?", None, "s2")), reponse)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_experimental.text_splitter import SemanticChunker
+
+from chunking import decouper_documents_par_lots
+
+
+class FakeEmbeddings(Embeddings):
+    """Embeddings déterministes dépendant des mots, qui comptent les appels."""
+
+    VOCABULAIRE = ["jazz", "concert", "musée", "peinture", "enfants", "atelier", "gratuit"]
+
+    def __init__(self):
+        self.appels = 0
+
+    def embed_documents(self, texts):
+        self.appels += 1
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text):
+        text = text.lower()
+        return [float(text.count(mot)) + 0.01 for mot in self.VOCABULAIRE]
+
+
+TEXTES = [
+    "Titre: soirée jazz. Un concert de jazz ce soir. Le concert est gratuit. "
+    "Un atelier pour enfants suit. Atelier peinture au musée !",
+    "Titre: expo. Peinture au musée. Le musée est gratuit ? Concert jazz le soir.",
+    "Titre: phrase unique sans ponctuation finale",
+]
+
+
+def documents():
+    return [
+        Document(page_content=texte, metadata={"id": f"uid-{i}", "location_city": "Toulouse"})
+        for i, texte in enumerate(TEXTES)
+    ]
+
+
+class TestChunking(unittest.TestCase):
+    """
+    Vérifie la découpe par lots :
+    - mêmes morceaux que SemanticChunker
+    - un seul appel d'embedding pour plusieurs événements
+    - métadonnées du parent et numéro de morceau conservés
+    """
+
+    def test_memes_morceaux_que_semantic_chunker(self):
+        attendus = [
+            chunk.page_content
+            for texte in TEXTES
+            for chunk in SemanticChunker(FakeEmbeddings()).create_documents([texte])
+        ]
+        chunks = decouper_documents_par_lots(documents(), FakeEmbeddings())
+        self.assertEqual([c.page_content for c in chunks], attendus)
+
+    def test_un_appel_par_lot(self):
+        embeddings = FakeEmbeddings()
+        decouper_documents_par_lots(documents(), embeddings, phrases_par_lot=1000)
+        self.assertEqual(embeddings.appels, 1)
+
+        embeddings = FakeEmbeddings()
+        decouper_documents_par_lots(documents(), embeddings, phrases_par_lot=1, workers=3)
+        self.assertEqual(embeddings.appels, 2)  # le document d'une phrase n'est pas embeddé
+
+    def test_metadonnees_conservees(self):
+        chunks = decouper_documents_par_lots(documents(), FakeEmbeddings())
+        for chunk in chunks:
+            self.assertEqual(chunk.metadata["location_city"], "Toulouse")
+        par_uid = {}
+        for chunk in chunks:
+            par_uid.setdefault(chunk.metadata["id"], []).append(chunk.metadata["chunk_index"])
+        self.assertEqual(sorted(par_uid), ["uid-0", "uid-1", "uid-2"])
+        for indices in par_uid.values():
+            self.assertEqual(indices, list(range(len(indices))))
+
+
+if __name__ == '__main__':
+    unittest.main()
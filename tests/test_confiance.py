@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from langchain.schema import Document
+from langchain_community.vectorstores import FAISS
+
+import confiance
+from chatbot_core import MoteurChatbot
+from index_store import sauvegarder_index
+from test_retrieval import MotsEmbeddings
+
+
+def resultats(*similarites):
+    """Résultats FAISS factices : distance L2 au carré = 2 - 2·cos."""
+    return [(Document(page_content=f"doc {i}"), 2 - 2 * s) for i, s in enumerate(similarites)]
+
+
+class TestConfiance(unittest.TestCase):
+    """Vérifie la décision locale / mixte / web prise avant la génération."""
+
+    def test_decision_selon_le_score(self):
+        self.assertEqual(confiance.decider(resultats(0.9, 0.5)), confiance.LOCALE)
+        self.assertEqual(confiance.decider(resultats(0.75)), confiance.MIXTE)
+        self.assertEqual(confiance.decider(resultats(0.4)), confiance.WEB)
+        self.assertEqual(confiance.decider([]), confiance.WEB)
+
+    def test_bonus_filtre_de_lieu(self):
+        self.assertEqual(confiance.decider(resultats(0.77)), confiance.MIXTE)
+        self.assertEqual(confiance.decider(resultats(0.77), {"villes": ["albi"]}), confiance.LOCALE)
+        self.assertEqual(confiance.decider(resultats(0.77), {"apres": "2025-01-01"}), confiance.MIXTE)
+
+
+class TestRecoursAuWeb(unittest.TestCase):
+    """
+    La recherche web dépend du score de confiance, pas du nombre de candidats :
+    - bonne correspondance parmi peu de candidats : pas de recherche web
+    - correspondance faible parmi beaucoup de candidats : résultats web
+    - confiance limite : résultats web dans le contexte local
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.chemin_index = os.path.join(cls.tmp.name, "faiss_index")
+        docs = [
+            Document(page_content=f"{'jazz' if i % 2 else 'cirque'} numéro {i}", metadata={
+                "id": f"uid-{i}", "location_city": "Albi" if i < 2 else "Toulouse",
+                "lastdate_end": "2099-01-01T00:00:00+00:00",
+            })
+            for i in range(40)
+        ]
+        sauvegarder_index(FAISS.from_documents(docs, MotsEmbeddings()), cls.chemin_index)
+        cls.moteur = MoteurChatbot(api_key="fake", chemin_index=cls.chemin_index, embeddings=MotsEmbeddings())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    @patch("chatbot_core.search_web", return_value="- web")
+    def test_selon_le_score(self, search_web):
+        apres = datetime(2025, 6, 1, tzinfo=timezone.utc)
+        # 2 candidats à Albi, dont un concert de jazz
+        contexte, web = self.moteur.preparer_contexte("jazz à Albi", "jazz", {"apres": apres, "villes": ["albi"]})
+        self.assertIn("jazz numéro 1", contexte)
+        self.assertIsNone(web)
+        search_web.assert_not_called()
+
+        # 40 candidats, aucune exposition
+        contexte, web = self.moteur.preparer_contexte("expo", "expo", {"apres": apres})
+        self.assertEqual((contexte, web), (None, "- web"))
+        search_web.assert_called_once_with("expo")
+
+    @patch("chatbot_core.search_web", return_value="- Agenda (https://exemple.fr)")
+    def test_confiance_limite(self, _):
+        with patch("confiance.decider", return_value=confiance.MIXTE):
+            contexte, web = self.moteur.preparer_contexte("jazz", "jazz", {})
+        self.assertIn("jazz numéro", contexte)
+        self.assertIn("Résultats web :", contexte)
+        self.assertEqual(web, "- Agenda (https://exemple.fr)")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+from langchain.schema import Document
+from langchain_community.chat_models.fake import FakeListChatModel
+from langchain_community.vectorstores import FAISS
+
+import contexte
+from chatbot_core import MoteurChatbot
+from contexte import assembler_contexte, ligne_evenement, mmr, regrouper_par_evenement
+from embedding_client import estimer_jetons
+from index_store import sauvegarder_index
+from index_types import creer_index, vecteurs_stockes
+from test_retrieval import MotsEmbeddings
+
+
+def morceau(uid, texte, distance, position, **metadata):
+    return Document(page_content=texte, metadata={"id": uid, **metadata}), distance, position
+
+
+class TestAssemblageContexte(unittest.TestCase):
+    """
+    Vérifie l'assemblage du contexte :
+    - un seul bloc par événement, au meilleur score de ses morceaux
+    - MMR : un quasi-doublon passe après un événement différent
+    - ligne compacte tirée des métadonnées, budget de jetons respecté
+    """
+
+    def test_regroupement(self):
+        resultats = [
+            morceau("a", "jazz 1", 0.4, 0),
+            morceau("b", "cirque", 0.2, 1),
+            morceau("a", "jazz 2", 0.1, 2),
+        ]
+        groupes = regrouper_par_evenement(resultats)
+        self.assertEqual([meilleur[0].metadata["id"] for meilleur, _ in groupes], ["a", "b"])
+        self.assertEqual(groupes[0][0][1], 0.1)
+        self.assertEqual([doc.page_content for doc, _, _ in groupes[0][1]], ["jazz 1", "jazz 2"])
+
+    def test_mmr(self):
+        vecteurs = np.array([[1, 0], [0.99, 0.01], [0, 1]], dtype=np.float32)
+        self.assertEqual(mmr([0.9, 0.89, 0.7], vecteurs, 3), [0, 2, 1])
+        self.assertEqual(mmr([0.9, 0.89, 0.7], vecteurs, 3, lambda_mmr=1.0), [0, 1, 2])
+        self.assertEqual(mmr([0.5, 0.9], None, 1), [1])
+
+    def test_ligne_evenement(self):
+        resultats = [morceau(
+            "a", "Titre: Jazz au Bikini\nDescription: Soirée jazz manouche.\nLieu: Le Bikini - rue, 31400 Toulouse",
+            0.1, 0, title="Jazz au Bikini", location_city="Toulouse", location_name="Le Bikini",
+            firstdate_begin="2025-07-01T20:30:00+02:00", lastdate_end="2025-07-02T00:00:00+02:00",
+        )]
+        self.assertEqual(
+            ligne_evenement(resultats),
+            "- Jazz au Bikini | Toulouse | du 01/07/2025 20h30 au 02/07/2025 | Le Bikini : Soirée jazz manouche.",
+        )
+        self.assertEqual(ligne_evenement([morceau("b", "cirque sans date", 0.1, 1)]), "- cirque sans date")
+
+    def test_budget(self):
+        resultats = [
+            morceau(f"uid-{i}", f"Description: {'concert ' * 40}", 0.1 * i, i, title=f"Concert {i}")
+            for i in range(10)
+        ]
+        texte, nombre = assembler_contexte(resultats, budget_jetons=200, jetons_extrait=30)
+        self.assertLessEqual(estimer_jetons(texte), 200)
+        self.assertTrue(0 < nombre < 10)
+        self.assertTrue(texte.startswith("- Concert 0 : concert"))
+
+        texte, nombre = assembler_contexte(resultats[:1], budget_jetons=10)
+        self.assertEqual(nombre, 1)
+        self.assertLessEqual(estimer_jetons(texte), 10)
+
+        texte, _ = assembler_contexte(resultats, budget_jetons=200, web="- Agenda (https://exemple.fr)\nConcerts")
+        self.assertLessEqual(estimer_jetons(texte), 200)
+        self.assertIn("Résultats web :", texte)
+
+    def test_vecteurs_stockes(self):
+        x = np.random.default_rng(0).random((200, 8), dtype=np.float32)
+        for type_index in ("flat", "ivf", "hnsw"):
+            index = creer_index(x, type_index, nlist=4, nprobe=4)
+            index.add(x)
+            np.testing.assert_allclose(vecteurs_stockes(index, [3, 150]), x[[3, 150]])
+
+
+class TestContexteMoteur(unittest.TestCase):
+    """Le prompt reçoit les lignes compactes des événements, et sa taille est mesurée."""
+
+    @classmethod
+    def setUpClass(cls):
+        meta = {
+            "title": "Nuit du jazz", "location_city": "Montpellier", "location_name": "Le Corum",
+            "firstdate_begin": "2099-07-10T21:00:00+02:00", "lastdate_end": "2099-07-11T02:00:00+02:00",
+        }
+        docs = [
+            Document(page_content="Titre: Nuit du jazz\nDescription: jazz toute la nuit", metadata={
+                "id": "a", "chunk_index": 0, **meta,
+            }),
+            Document(page_content="Description: jazz et jam session", metadata={"id": "a", "chunk_index": 1, **meta}),
+            Document(page_content="Titre: Expo jazz\nDescription: expo photo", metadata={
+                "id": "b", "title": "Expo jazz", "location_city": "Montpellier",
+                "firstdate_begin": "2099-07-01", "lastdate_end": "2099-08-01",
+            }),
+        ]
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.chemin_index = os.path.join(cls.tmp.name, "faiss_index")
+        sauvegarder_index(FAISS.from_documents(docs, MotsEmbeddings()), cls.chemin_index)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    @patch("chatbot_core.search_web", return_value="- web")
+    def test_prompt_compact(self, _):
+        moteur = MoteurChatbot(
+            api_key="fake", chemin_index=self.chemin_index, embeddings=MotsEmbeddings(),
+            llm=FakeListChatModel(responses=["Du jazz à Montpellier."] * 10),
+        )
+        with patch.object(MoteurChatbot, "construire_prompt", wraps=moteur.construire_prompt) as prompt, \
+                self.assertLogs(level="INFO") as logs:
+            moteur.get_bot_response("jazz à Montpellier ?", None, "s1")
+        contexte_prompt = prompt.call_args.args[2]
+        self.assertEqual(contexte_prompt.splitlines(), [
+            "- Nuit du jazz | Montpellier | du 10/07/2099 21h00 au 11/07/2099 02h00 | Le Corum : "
+            "jazz toute la nuit jazz et jam session",
+            "- Expo jazz | Montpellier | du 01/07/2099 au 01/08/2099 : expo photo",
+        ])
+        self.assertTrue(any("Prompt : " in ligne for ligne in logs.output))
+        self.assertLessEqual(estimer_jetons(contexte_prompt), contexte.BUDGET_JETONS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CompteurEmbeddings(Embeddings):
+    """Faux client qui enregistre chaque texte envoyé à l'« API »."""
+
+    def __init__(self):
+        self.envoyes = []
+
+    def embed_documents(self, texts):
+        self.envoyes += texts
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        self.envoyes.append(text)
+        return [float(len(text)), 0.0]
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    """
+    Vérifie le cache d'embeddings :
+    - un texte déjà vu (même après normalisation) n'est plus envoyé
+    - le cache survit à un redémarrage du processus
+    - l'éviction LRU respecte la taille maximale
+    - une insertion ne recompte pas toute la table
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "embeddings.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_hits_et_misses(self):
+        client = CompteurEmbeddings()
+        embeddings = CachedEmbeddings(client, EmbeddingCache(self.path))
+
+        premiers = embeddings.embed_documents(["concert jazz", "cirque", "concert jazz"])
+        seconds = embeddings.embed_documents(["concert  jazz ", "cirque"])
+
+        self.assertEqual(client.envoyes, ["concert jazz", "cirque"])
+        self.assertEqual(seconds, [premiers[0], premiers[1]])
+        self.assertEqual(embeddings.cache.stats()["hits"], 2)
+        self.assertEqual(embeddings.cache.stats()["misses"], 3)
+
+    def test_questions_partagent_le_cache(self):
+        client = CompteurEmbeddings()
+        embeddings = CachedEmbeddings(client, EmbeddingCache(self.path))
+        embeddings.embed_query("concerts à Toulouse ?")
+        embeddings.embed_query("concerts à Toulouse ?")
+        self.assertEqual(client.envoyes, ["concerts à Toulouse ?"])
+
+    def test_persistance_entre_processus(self):
+        CachedEmbeddings(CompteurEmbeddings(), EmbeddingCache(self.path)).embed_documents(["théâtre"])
+
+        client = CompteurEmbeddings()
+        vecteurs = CachedEmbeddings(client, EmbeddingCache(self.path)).embed_documents(["théâtre"])
+        self.assertEqual(client.envoyes, [])
+        self.assertEqual(vecteurs, [[7.0, 1.0]])
+
+    def test_eviction_lru(self):
+        cache = EmbeddingCache(self.path, max_entries=2)
+        embeddings = CachedEmbeddings(CompteurEmbeddings(), cache)
+        embeddings.embed_documents(["a"])
+        embeddings.embed_documents(["b"])
+        embeddings.embed_documents(["a"])   # "a" redevient le plus récent
+        embeddings.embed_documents(["c"])   # évince "b"
+
+        client = CompteurEmbeddings()
+        embeddings.embeddings = client
+        embeddings.embed_documents(["a", "b", "c"])
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(client.envoyes, ["b"])
+
+    def test_insertion_sans_comptage_complet(self):
+        cache = EmbeddingCache(self.path, max_entries=3)
+        requetes = []
+        cache._conn.set_trace_callback(requetes.append)
+        cache.put_many({"a": [1.0], "b": [2.0]})
+        cache.put_many({"a": [3.0], "c": [4.0]})   # "a" remplacée : 3 lignes, pas d'éviction
+        cache.put_many({"d": [5.0]})               # évince "b", la moins récente
+        cache._conn.set_trace_callback(None)
+
+        self.assertFalse([r for r in requetes if r.strip() == "SELECT COUNT(*) FROM embeddings"])
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(set(cache.get_many(["a", "b", "c", "d"])), {"a", "c", "d"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from embedding_client import ClientEmbeddings, estimer_jetons, former_lots
+
+
+def vecteur_attendu(texte, dimension=8):
+    """Vecteur déterministe du faux serveur pour `texte`."""
+    empreinte = hashlib.sha256(texte.encode("utf-8")).digest()
+    return [b / 255 for b in empreinte[:dimension]]
+
+
+class FauxServeurEmbeddings(BaseHTTPRequestHandler):
+    """
+    API d'embeddings factice au format Mistral : vecteurs déterministes,
+    délai de réponse réglable, 429 initiaux avec Retry-After, et mesure des
+    requêtes simultanées.
+    """
+
+    lots = []
+    delai = 0.0
+    erreurs_restantes = 0
+    en_cours = 0
+    max_en_cours = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        corps = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        cls = type(self)
+        with cls.lock:
+            if cls.erreurs_restantes > 0:
+                cls.erreurs_restantes -= 1
+                self.send_response(429)
+                self.send_header("Retry-After", "0.05")
+                self.end_headers()
+                return
+            cls.lots.append(corps["input"])
+            cls.en_cours += 1
+            cls.max_en_cours = max(cls.max_en_cours, cls.en_cours)
+        time.sleep(cls.delai)
+        with cls.lock:
+            cls.en_cours -= 1
+
+        donnees = [{"index": i, "embedding": vecteur_attendu(t)} for i, t in enumerate(corps["input"])]
+        body = json.dumps({"model": corps["model"], "data": donnees[::-1]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestClientEmbeddings(unittest.TestCase):
+    """
+    Vérifie le client d'embeddings contre un faux serveur local :
+    - lots bornés en jetons, résultats dans l'ordre des textes
+    - nombre de requêtes simultanées limité par `concurrence`
+    - pause et baisse de débit sur 429 / Retry-After
+    - questions simultanées regroupées en une requête
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FauxServeurEmbeddings)
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/v1"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FauxServeurEmbeddings.lots = []
+        FauxServeurEmbeddings.delai = 0.0
+        FauxServeurEmbeddings.erreurs_restantes = 0
+        FauxServeurEmbeddings.max_en_cours = 0
+
+    def client(self, **options):
+        options.setdefault("debit", 0)
+        return ClientEmbeddings("cle-test", base_url=self.url, backoff=0, **options)
+
+    def test_lots_bornes_en_jetons(self):
+        textes = [f"événement {i} " * (1 + i % 7) for i in range(60)]
+        client = self.client(jetons_par_lot=100, textes_par_lot=16)
+        self.assertEqual(client.embed_documents(textes), [vecteur_attendu(t) for t in textes])
+        self.assertGreater(len(FauxServeurEmbeddings.lots), 1)
+        for lot in FauxServeurEmbeddings.lots:
+            self.assertLessEqual(len(lot), 16)
+            self.assertLessEqual(sum(map(estimer_jetons, lot)), 100)
+        self.assertEqual([t for lot in former_lots(textes, 100, 16) for t in lot], list(range(60)))
+
+    def test_concurrence_limitee(self):
+        FauxServeurEmbeddings.delai = 0.05
+        client = self.client(textes_par_lot=1, concurrence=3)
+        client.embed_documents([f"texte {i}" for i in range(12)])
+        self.assertEqual(FauxServeurEmbeddings.max_en_cours, 3)
+
+    def test_pause_sur_429(self):
+        FauxServeurEmbeddings.erreurs_restantes = 2
+        client = self.client(debit=100, textes_par_lot=4, concurrence=1)
+        debut = time.monotonic()
+        vecteurs = client.embed_documents([f"texte {i}" for i in range(8)])
+        self.assertGreaterEqual(time.monotonic() - debut, 0.1)
+        self.assertEqual(vecteurs[5], vecteur_attendu("texte 5"))
+        stats = client.stats()
+        self.assertEqual(stats["limites_429"], 2)
+        self.assertLess(stats["debit"], 100)
+        self.assertEqual(stats["requetes"], 4)
+
+    def test_questions_regroupees(self):
+        FauxServeurEmbeddings.delai = 0.02
+        client = self.client(fenetre_ms=50)
+        questions = [f"concert à Toulouse {i}" for i in range(8)]
+        barriere = threading.Barrier(len(questions))
+
+        def demander(question):
+            barriere.wait()
+            return client.embed_query(question)
+
+        with ThreadPoolExecutor(max_workers=len(questions)) as pool:
+            vecteurs = list(pool.map(demander, questions))
+        self.assertEqual(vecteurs, [vecteur_attendu(q) for q in questions])
+        self.assertLessEqual(len(FauxServeurEmbeddings.lots), 2)
+
+    def test_erreur_transmise(self):
+        client = self.client(max_retries=0)
+        FauxServeurEmbeddings.erreurs_restantes = 1
+        with self.assertRaises(Exception):
+            client.embed_query("question")
+
+
+if __name__ == '__main__':
+    unittest.main()
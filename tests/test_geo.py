@@ -0,0 +1,115 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from geo import BaseIP, CacheTTL, Localisateur, construire_base, ip_depuis_entetes
+
+CSV = """\
+1.0.0.0,1.0.0.255,OC,AU,Queensland,Brisbane,-27.4679,153.028
+90.0.0.0,90.0.255.255,EU,FR,Occitanie,Toulouse,43.6045,1.444
+2a01:e0a::,2a01:e0a::ffff,EU,FR,Occitanie,Albi,43.92,2.14
+80.10.0.0,80.10.127.255,EU,FR,Occitanie,Montpellier,43.61,3.87
+90.1.0.0,90.1.0.255,EU,FR,Occitanie,Toulouse,43.6045,1.444
+"""
+
+
+def reponse(status=200, data=None, headers=None):
+    response = MagicMock(status_code=status, headers=headers or {})
+    response.json.return_value = data or {}
+    return response
+
+
+class TestBaseIP(unittest.TestCase):
+    """
+    Vérifie la base locale :
+    - plages IPv4 triées, recherche dichotomique sur les fichiers projetés en mémoire
+    - adresses hors plages, IPv6 et invalides sans résultat
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        chemin = os.path.join(self.tmp.name, "dbip.csv")
+        with open(chemin, "w", encoding="utf-8") as f:
+            f.write(CSV)
+        self.dossier = os.path.join(self.tmp.name, "geo_ip")
+        self.assertEqual(construire_base(chemin, self.dossier), 4)
+        self.base = BaseIP.charger(self.dossier)
+
+    def tearDown(self):
+        del self.base
+        self.tmp.cleanup()
+
+    def test_recherche(self):
+        self.assertEqual(self.base.chercher("90.0.12.34")["city"], "Toulouse")
+        self.assertEqual(self.base.chercher("80.10.127.255")["city"], "Montpellier")
+        self.assertEqual(self.base.chercher("1.0.0.0")["region"], "Queensland")
+        for ip in ("0.255.255.255", "80.10.128.0", "90.0.255.255.1", "2a01:e0a::1", "", None):
+            self.assertIsNone(self.base.chercher(ip), ip)
+        self.assertEqual(len(self.base.lieux), 3)
+        self.assertIsNone(BaseIP.charger(os.path.join(self.tmp.name, "absent")))
+
+    def test_localisateur(self):
+        session = MagicMock()
+        localisateur = Localisateur(self.base, distant=True, session=session)
+        self.assertEqual(localisateur.localiser("90.1.0.7")["city"], "Toulouse")
+        session.get.assert_not_called()
+
+        session.get.return_value = reponse(data={"city": "Nîmes", "region": "Occitanie", "ip": "8.8.8.8"})
+        self.assertEqual(localisateur.localiser("8.8.8.8"), {
+            "city": "Nîmes", "region": "Occitanie", "latitude": None, "longitude": None,
+        })
+        localisateur.localiser("8.8.8.8")
+        session.get.assert_called_once_with("https://ipapi.co/8.8.8.8/json/", timeout=3)
+        self.assertIsNone(Localisateur(self.base, distant=False, session=session).localiser("8.8.4.4"))
+
+
+class TestLocalisateur(unittest.TestCase):
+    """Cache à durée de vie, résolution en arrière-plan et pause du service distant après un 429."""
+
+    def test_cache_ttl(self):
+        cache = CacheTTL(duree=0.05, taille=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)   # évince "b"
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("a"))
+
+    def test_arriere_plan(self):
+        session = MagicMock()
+
+        def lent(url, timeout):
+            time.sleep(0.2)
+            return reponse(data={"city": "Albi", "region": "Occitanie"})
+
+        session.get.side_effect = lent
+        localisateur = Localisateur(distant=True, session=session)
+        debut = time.perf_counter()
+        premiere, seconde = localisateur.soumettre(), localisateur.soumettre()
+        self.assertLess(time.perf_counter() - debut, 0.1)
+        self.assertFalse(premiere.done())
+        self.assertIs(premiere, seconde)
+        self.assertEqual(premiere.result(timeout=2)["city"], "Albi")
+        self.assertTrue(localisateur.soumettre().done())
+        session.get.assert_called_once_with("https://ipapi.co/json/", timeout=3)
+
+    def test_pause_apres_429(self):
+        session = MagicMock()
+        session.get.return_value = reponse(429, headers={"Retry-After": "30"})
+        localisateur = Localisateur(distant=True, session=session)
+        self.assertIsNone(localisateur.localiser("8.8.8.8"))
+        self.assertIsNone(localisateur.localiser("9.9.9.9"))
+        self.assertEqual(session.get.call_count, 1)
+
+    def test_ip_depuis_entetes(self):
+        self.assertEqual(ip_depuis_entetes({"X-Forwarded-For": "90.0.1.2, 10.0.0.1"}), "90.0.1.2")
+        self.assertIsNone(ip_depuis_entetes({"X-Forwarded-For": "127.0.0.1"}))
+        self.assertIsNone(ip_depuis_entetes({"X-Real-Ip": "192.168.1.10"}))
+        self.assertIsNone(ip_depuis_entetes(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+from harvester import OpenAgendaHarvester, TokenBucket
+
+
+def pages_enregistrees(keyword, total, debut=0):
+    """Événements OpenAgenda factices pour un mot-clé, au format de l'API records."""
+    return [
+        {"uid": f"{keyword}-{i:04d}", "title_fr": f"{keyword} {i}", "keywords_fr": [keyword]}
+        for i in range(debut, debut + total)
+    ]
+
+
+class StubOpenAgenda(BaseHTTPRequestHandler):
+    """
+    Serveur local qui rejoue des événements enregistrés (clause `where` en OR sur
+    les mots-clés, tri par uid), en pages ou en export JSONL, et simule des 429.
+    """
+
+    events = {}
+    requetes = []
+    erreurs_restantes = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        with self.lock:
+            type(self).requetes.append(self.path)
+            if type(self).erreurs_restantes > 0:
+                type(self).erreurs_restantes -= 1
+                self.send_response(429)
+                self.send_header("Retry-After", "0")
+                self.end_headers()
+                return
+
+        keywords = re.findall(r'keywords_fr = "([^"]+)"', query["where"][0])
+        records = {}
+        for record in sorted((r for k in keywords for r in self.events.get(k, [])), key=lambda r: r["uid"]):
+            fusion = records.setdefault(record["uid"], dict(record, keywords_fr=[]))
+            fusion["keywords_fr"] += [k for k in record["keywords_fr"] if k not in fusion["keywords_fr"]]
+        records = list(records.values())
+
+        if url.path.endswith("/exports/jsonl"):
+            body = "".join(json.dumps(r) + "\n" for r in records)
+        else:
+            offset, limit = int(query["offset"][0]), int(query["limit"][0])
+            body = json.dumps({"total_count": len(records), "results": records[offset:offset + limit]})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body.encode("utf-8"))
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHarvester(unittest.TestCase):
+    """
+    Vérifie la collecte contre un serveur local :
+    - tous les événements sont récupérés une seule fois, dans un ordre stable
+    - les mots-clés combinés par OR (ou l'export) réduisent requêtes et octets
+    - un groupe trop gros pour la pagination est coupé en deux
+    - les 429 sont réessayés
+    - une collecte reprise depuis le journal ne refait aucune requête
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAgenda)
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/records"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        # 50 concerts de jazz apparaissent aussi sous « concert »
+        StubOpenAgenda.events = {
+            "jazz": pages_enregistrees("jazz", 250),
+            "rock": pages_enregistrees("rock", 30),
+            "concert": pages_enregistrees("concert", 20) + [
+                dict(r, keywords_fr=["concert"]) for r in pages_enregistrees("jazz", 50)
+            ],
+        }
+        StubOpenAgenda.requetes = []
+        StubOpenAgenda.erreurs_restantes = 0
+
+    def creer_harvester(self, **kwargs):
+        return OpenAgendaHarvester(base_url=self.url, workers=4, rate=0, backoff=0, **kwargs)
+
+    def test_harvest_toutes_les_pages(self):
+        colonnes = self.creer_harvester().harvest(["jazz", "rock"])
+        self.assertEqual(colonnes["uid"], [f"jazz-{i:04d}" for i in range(250)] + [f"rock-{i:04d}" for i in range(30)])
+        # 3 pages pour les 280 événements des deux mots-clés, sans requête de sondage séparée
+        self.assertEqual(len(StubOpenAgenda.requetes), 3)
+
+    def test_mots_cles_combines(self):
+        mots_cles = ["jazz", "rock", "concert"]
+        separes = self.creer_harvester(mots_par_requete=1)
+        colonnes_separees = separes.harvest(mots_cles)
+        combines = self.creer_harvester()
+        colonnes = combines.harvest(mots_cles)
+        export = self.creer_harvester(export=True)
+        colonnes_export = export.harvest(mots_cles)
+
+        self.assertEqual(len(colonnes["uid"]), 300)
+        self.assertEqual(sorted(colonnes_separees["uid"]), colonnes["uid"])
+        self.assertEqual(colonnes_export, colonnes)
+        self.assertEqual(separes.statistiques()["doublons"], 50)
+        self.assertEqual(combines.statistiques()["doublons"], 0)
+        # Mots-clés fusionnés par événement, quelle que soit la façon de les obtenir
+        for resultat in (colonnes, colonnes_separees):
+            mots = dict(zip(resultat["uid"], resultat["keywords_fr"]))
+            self.assertEqual(sorted(mots["jazz-0010"]), ["concert", "jazz"])
+            self.assertEqual(mots["jazz-0100"], ["jazz"])
+
+        self.assertEqual((separes.requetes, combines.requetes, export.requetes), (5, 3, 1))
+        self.assertLess(combines.octets, separes.octets)
+        self.assertLess(export.octets, separes.octets)
+
+    def test_groupe_coupe(self):
+        harvester = self.creer_harvester()
+        with patch("harvester.MAX_OFFSET", 200):
+            colonnes = harvester.harvest(["rock", "concert", "jazz"])
+        # jazz seul dépasse encore la limite : tronqué à 200 événements, comme avant
+        self.assertEqual(len(colonnes["uid"]), 30 + 70 + 150)
+        self.assertEqual(len(set(colonnes["uid"])), len(colonnes["uid"]))
+
+    def test_memoire_mesuree(self):
+        harvester = self.creer_harvester(export=True, mesurer_memoire=True)
+        harvester.harvest(["jazz"])
+        stats = harvester.statistiques()
+        self.assertEqual(stats["evenements"], 250)
+        self.assertGreater(stats["pic_memoire"], 0)
+
+    def test_retry_sur_429(self):
+        StubOpenAgenda.erreurs_restantes = 2
+        harvester = self.creer_harvester()
+        colonnes = harvester.harvest(["rock"])
+        self.assertEqual(len(colonnes["uid"]), 30)
+        self.assertEqual(harvester.requetes, 3)
+
+    def test_reprise_depuis_checkpoint(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "pages.jsonl")
+            premiers = self.creer_harvester(checkpoint_path=path).harvest(["jazz", "rock"])
+
+            # Ligne tronquée simulant une interruption pendant l'écriture
+            with open(path, "a", encoding="utf-8") as f:
+                f.write('{"keyword": "jazz", "off')
+
+            StubOpenAgenda.requetes = []
+            repris = self.creer_harvester(checkpoint_path=path).harvest(["jazz", "rock"])
+            self.assertEqual(repris, premiers)
+            self.assertEqual(StubOpenAgenda.requetes, [])
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_rafale_puis_limitation(self):
+        bucket = TokenBucket(rate=1000, capacity=5)
+        for _ in range(5):
+            bucket.acquire()
+        self.assertLess(bucket._tokens, 1)
+        bucket.acquire()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,72 @@
-import pytest
-from index_faiss.build import build_vectorstore_from_docs
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import pandas as pd
 from langchain.schema import Document
 
-def test_build_vectorstore_from_docs():
-    docs = [
-        Document(page_content="La nuit des musées à Paris", metadata={"source": "OpenAgenda"})
-    ]
-    vectordb = build_vectorstore_from_docs(docs)
-    assert vectordb is not None
-
-    results = vectordb.similarity_search("musées Paris")
-    assert isinstance(results, list)
-    assert len(results) > 0
-    assert "musées" in results[0].page_content
+import index_faiss
+from index_store import charger_index
+from index_lexical import charger_index_lexical
+from simulateurs import EmbeddingsSimulees
+
+
+def evenement(uid, texte, fin="2099-01-01T00:00:00+00:00"):
+    return Document(page_content=texte, metadata={"id": uid, "source": "OpenAgenda", "lastdate_end": fin})
+
+
+class TestConstruireIndex(unittest.TestCase):
+    """
+    Vérifie la construction complète de l'index, sans réseau (embeddings simulés) :
+    - chaque morceau reçoit un id stable `<uid>:<n>`
+    - l'index sauvegardé se recharge et retrouve le bon événement
+    - le manifeste et l'index lexical sont écrits à côté de l'index
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.chemin_index = os.path.join(self.tmp.name, "faiss_index")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_attribuer_ids(self):
+        morceaux = [evenement("a", "un"), evenement("b", "deux"), evenement("a", "trois")]
+        ids, ids_par_uid = index_faiss.attribuer_ids(morceaux)
+        self.assertEqual(ids, ["a:0", "b:0", "a:1"])
+        self.assertEqual(ids_par_uid, {"a": ["a:0", "a:1"], "b": ["b:0"]})
+
+    @patch("index_faiss.decouper_documents", side_effect=lambda documents: documents)
+    def test_construire_index(self, _decoupe):
+        docs = [
+            evenement("musees", "La nuit des musées à Paris"),
+            evenement("jazz", "Concert de jazz au Bikini à Toulouse"),
+            evenement("cirque", "Spectacle de cirque sous chapiteau à Albi"),
+        ]
+        embeddings = EmbeddingsSimulees()
+        vectordb, rapport = index_faiss.construire_index(docs, embeddings, self.chemin_index)
+        self.assertEqual(rapport["ajoutes"], 3)
+        self.assertIn("musées", vectordb.similarity_search("musées Paris", k=1)[0].page_content)
+
+        recharge = charger_index(self.chemin_index, embeddings)
+        self.assertEqual(recharge.index.ntotal, 3)
+        self.assertIn("jazz", recharge.similarity_search("un concert de jazz", k=1)[0].page_content)
+        self.assertEqual(set(index_faiss.charger_manifest(self.chemin_index)), {"musees", "jazz", "cirque"})
+        self.assertIsNotNone(charger_index_lexical(self.chemin_index, 3))
+
+    def test_documents_a_indexer(self):
+        df = pd.DataFrame({
+            "uid": ["passe", "futur"],
+            "title_fr": ["Ancien", "Prochain"],
+            "description_fr": ["fini", "à venir"],
+            "firstdate_begin": ["2025-01-01T20:00:00+00:00", "2099-01-01T20:00:00+00:00"],
+            "lastdate_end": ["2025-01-01T23:00:00+00:00", "2099-01-01T23:00:00+00:00"],
+        })
+        docs = index_faiss.documents_a_indexer(df, datetime(2025, 6, 1, tzinfo=timezone.utc))
+        self.assertEqual([doc.metadata["id"] for doc in docs], ["futur"])
+
+
+if __name__ == '__main__':
+    unittest.main()
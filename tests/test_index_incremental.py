@@ -0,0 +1,163 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+
+import index_faiss
+from index_lexical import charger_index_lexical
+from index_store import charger_index
+from index_types import TYPES_INDEX, parametres_index
+from simulateurs import EmbeddingsSimulees
+
+
+class FakeEmbeddings(Embeddings):
+    """Embeddings déterministes qui comptent les textes envoyés."""
+
+    def __init__(self):
+        self.appels = 0
+
+    def _vecteur(self, texte):
+        return [float(len(texte)), float(sum(map(ord, texte)) % 97), 1.0]
+
+    def embed_documents(self, texts):
+        self.appels += len(texts)
+        return [self._vecteur(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vecteur(text)
+
+
+def decoupe_par_ligne(documents):
+    return [
+        Document(page_content=ligne, metadata=dict(doc.metadata))
+        for doc in documents
+        for ligne in doc.page_content.split("\n")
+    ]
+
+
+def evenement(uid, texte, fin="2099-01-01T00:00:00+00:00"):
+    return Document(page_content=texte, metadata={"id": uid, "lastdate_end": fin})
+
+
+@patch("index_faiss.decouper_documents", side_effect=decoupe_par_ligne)
+class TestRafraichirIndex(unittest.TestCase):
+    """
+    Vérifie la mise à jour incrémentale de l'index :
+    - seuls les événements nouveaux ou modifiés sont embeddés
+    - les événements terminés ou disparus sont supprimés de l'index et du docstore
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.chemin = os.path.join(self.tmp.name, "faiss_index")
+        self.now = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_rafraichissement(self, _mock_decoupe):
+        embeddings = FakeEmbeddings()
+        initiaux = [
+            evenement("a", "concert\njazz"),
+            evenement("b", "théâtre"),
+            evenement("c", "cirque"),
+            evenement("d", "expo", fin="2025-06-10T00:00:00+00:00"),
+        ]
+        _, rapport = index_faiss.rafraichir_index(initiaux, embeddings, self.now, self.chemin)
+        self.assertEqual(rapport["ajoutes"], 4)
+        self.assertEqual(embeddings.appels, 5)
+
+        embeddings.appels = 0
+        plus_tard = datetime(2025, 6, 15, tzinfo=timezone.utc)
+        courants = [
+            evenement("a", "concert\njazz"),              # inchangé
+            evenement("b", "théâtre\ncomplet"),            # modifié
+            evenement("d", "expo", fin="2025-06-10T00:00:00+00:00"),  # terminé
+            evenement("e", "danse"),                       # nouveau
+        ]                                                  # "c" n'est plus renvoyé
+        vectorstore, rapport = index_faiss.rafraichir_index(courants, embeddings, plus_tard, self.chemin)
+
+        self.assertEqual(rapport, {
+            "ajoutes": 1, "mis_a_jour": 1, "supprimes": 2, "inchanges": 1,
+            "embeddings_economises": 2,
+        })
+        self.assertEqual(embeddings.appels, 3)
+        self.assertEqual(
+            sorted(vectorstore.index_to_docstore_id.values()),
+            ["a:0", "a:1", "b:0", "b:1", "e:0"],
+        )
+        self.assertEqual(vectorstore.index.ntotal, 5)
+        self.assertEqual(sorted(index_faiss.charger_manifest(self.chemin)), ["a", "b", "e"])
+
+    def test_lecteur_pendant_le_rafraichissement(self, _mock_decoupe):
+        embeddings = FakeEmbeddings()
+        index_faiss.rafraichir_index([evenement("a", "concert"), evenement("b", "théâtre")], embeddings, self.now,
+                                     self.chemin)
+        lecteur = charger_index(self.chemin, embeddings)
+        publies = []
+
+        def coherent():
+            # Index FAISS, index lexical et manifest publiés ensemble
+            vectorstore = charger_index(self.chemin, embeddings)
+            ids = sorted(vectorstore.index_to_docstore_id.values())
+            manifest = index_faiss.charger_manifest(self.chemin)
+            self.assertEqual(ids, sorted(c for entree in manifest.values() for c in entree["chunk_ids"]))
+            self.assertIsNotNone(charger_index_lexical(self.chemin, vectorstore.index.ntotal))
+            return ids
+
+        sauvegarder_manifest = index_faiss.sauvegarder_manifest
+
+        def pendant_la_sauvegarde(dossier, manifest):
+            # La nouvelle version est écrite, l'ancienne reste seule publiée
+            publies.append(coherent())
+            sauvegarder_manifest(dossier, manifest)
+
+        courants = [evenement("a", "concert\ncomplet"), evenement("c", "cirque"), evenement("d", "danse")]
+        with patch("index_faiss.sauvegarder_manifest", side_effect=pendant_la_sauvegarde):
+            index_faiss.rafraichir_index(courants, embeddings, self.now, self.chemin)
+
+        self.assertEqual(publies, [["a:0", "b:0"]])
+        self.assertEqual(coherent(), ["a:0", "a:1", "c:0", "d:0"])
+        # L'ancien lecteur garde sa version complète
+        self.assertEqual(sorted(doc.page_content for doc in lecteur.similarity_search("concert", k=2)),
+                         ["concert", "théâtre"])
+
+
+@patch("index_faiss.decouper_documents", side_effect=lambda documents: list(documents))
+class TestSuppressionsParType(unittest.TestCase):
+    """
+    Mise à jour incrémentale avec suppressions, pour chaque type d'index : les
+    recherches suivantes restent cohérentes avec le docstore, et un index
+    reconstruit garde son type et ses paramètres.
+    """
+
+    def test_suppressions(self, _mock_decoupe):
+        now = datetime(2025, 6, 1, tzinfo=timezone.utc)
+        evenements = [evenement(f"e{i}", f"événement {i} édition{i} salle{i % 7} ville{i % 13}") for i in range(600)]
+        for type_index in TYPES_INDEX:
+            with self.subTest(type_index=type_index), tempfile.TemporaryDirectory() as tmp:
+                chemin = os.path.join(tmp, "faiss_index")
+                embeddings = EmbeddingsSimulees()
+                index_faiss.construire_index(evenements, embeddings, chemin, type_index)
+                avant = parametres_index(charger_index(chemin, embeddings).index)
+
+                # 200 événements ne sont plus renvoyés, un est modifié
+                courants = evenements[:399] + [evenement("e399", "événement 399 modifié")]
+                vectorstore, _ = index_faiss.rafraichir_index(courants, embeddings, now, chemin)
+
+                for recharge in (vectorstore, charger_index(chemin, embeddings)):
+                    self.assertEqual(recharge.index.ntotal, 400)
+                    self.assertEqual(parametres_index(recharge.index), avant)
+                    for i in (0, 123, 398):
+                        docs = recharge.similarity_search(evenements[i].page_content, k=3)
+                        self.assertEqual(docs[0].metadata["id"], f"e{i}")
+                        self.assertTrue(all(int(doc.metadata["id"][1:]) < 400 for doc in docs))
+                    self.assertEqual(recharge.similarity_search("événement 399 modifié", k=1)[0].metadata["id"], "e399")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import math
+import tempfile
+import unittest
+from datetime import datetime, timezone
+
+import confiance
+from index_lexical import IndexLexical, charger_index_lexical, termes, texte_indexe
+from Openagenda import generer_documents, structurer_evenements
+from retrieval import IndexMetadonnees, RetrieverFiltre, fusion_rrf, recherche_vectorielle
+from test_retrieval import MotsEmbeddings, construire_vectorstore
+
+
+class EmbeddingsComptes(MotsEmbeddings):
+    def __init__(self):
+        self.appels = 0
+
+    def embed_query(self, text):
+        self.appels += 1
+        return super().embed_query(text)
+
+
+def bm25_naif(corpus, question, k1=1.2, b=0.75):
+    """BM25 de référence, document par document."""
+    docs = [termes(t) for t in corpus]
+    moyenne = sum(map(len, docs)) / len(docs)
+    scores = []
+    for doc in docs:
+        score = 0.0
+        for mot in set(termes(question)):
+            df = sum(mot in d for d in docs)
+            tf = doc.count(mot)
+            if tf:
+                idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / moyenne))
+        scores.append(score)
+    return scores
+
+
+class TestIndexLexical(unittest.TestCase):
+    """
+    Vérifie l'index BM25 et la recherche hybride :
+    - normalisation (accents, mots vides) identique pour les documents et les questions
+    - scores BM25 conformes à un calcul naïf, restreints aux candidats
+    - sauvegarde sans pickle et détection d'un index lexical obsolète
+    - fusion RRF, et raccourci sans embedding pour les correspondances exactes
+    """
+
+    CORPUS = [
+        "Concert de jazz au Bikini, Toulouse 31400",
+        "Festival de jazz et de blues à Montpellier",
+        "Théâtre : « Le Cid » à Saint-Gaudens",
+        "Cirque contemporain à Albi, jazz manouche en première partie",
+    ]
+
+    def test_normalisation(self):
+        self.assertEqual(termes("Le THÉÂTRE à Saint-Gaudens !"), ["theatre", "saint", "gaudens"])
+        lexical = IndexLexical.construire(self.CORPUS)
+        positions, _, complet = lexical.rechercher("théatre")
+        self.assertEqual(positions.tolist(), [2])
+        self.assertTrue(complet[0])
+
+    def test_scores_bm25(self):
+        lexical = IndexLexical.construire(self.CORPUS)
+        question = "jazz à Toulouse"
+        attendus = bm25_naif(self.CORPUS, question)
+        positions, scores, complet = lexical.rechercher(question)
+        self.assertEqual(positions.tolist(), [0, 1, 3])
+        for position, score in zip(positions, scores):
+            self.assertAlmostEqual(float(score), attendus[position], places=4)
+        self.assertEqual(complet.tolist(), [True, False, False])
+
+        positions, _, _ = lexical.rechercher(question, candidats=[1, 3])
+        self.assertEqual(sorted(positions.tolist()), [1, 3])
+        self.assertEqual(len(lexical.rechercher("opéra")[0]), 0)
+
+    def test_sauvegarde(self):
+        lexical = IndexLexical.construire(self.CORPUS)
+        with tempfile.TemporaryDirectory() as tmp:
+            lexical.sauvegarder(tmp)
+            recharge = charger_index_lexical(tmp, ntotal=len(self.CORPUS))
+            for question in ["jazz", "cirque à Albi", "31400"]:
+                self.assertEqual(recharge.rechercher(question)[0].tolist(), lexical.rechercher(question)[0].tolist())
+            self.assertIsNone(charger_index_lexical(tmp, ntotal=len(self.CORPUS) + 1))
+
+    def test_documents_openagenda(self):
+        debut = datetime.now(timezone.utc)
+        records = [
+            {
+                "uid": f"evt-{i}", "title_fr": titre, "description_fr": "<p>Une soirée pour toute la famille.</p>",
+                "location_name": "Le Chapiteau", "location_address": "1 allée des Arts", "location_city": "Albi",
+                "location_postalcode": "81000", "firstdate_begin": debut.isoformat(),
+                "lastdate_end": "2099-01-01T00:00:00+00:00", "keywords_fr": mots_cles,
+                "location_coordinates": {"lat": 43.9, "lon": 2.1},
+            }
+            for i, (titre, mots_cles) in enumerate([("Soirée au chapiteau", ["cirque", "jonglerie"]),
+                                                    ("Soirée en ville", None)])
+        ]
+        documents = generer_documents(structurer_evenements(records))
+        self.assertEqual(documents[0].metadata["keywords"], ["cirque", "jonglerie"])
+        self.assertIn("Mots-clés: cirque, jonglerie", documents[0].page_content)
+        self.assertEqual(documents[1].metadata["keywords"], [])
+
+        # Mot-clé absent du titre et de la description, trouvé grâce aux métadonnées
+        lexical = IndexLexical.construire(texte_indexe(doc) for doc in documents)
+        self.assertEqual(lexical.rechercher("jonglerie")[0].tolist(), [0])
+        # Libellés du gabarit et dates : absents du vocabulaire
+        for terme in ("titre", "description", "lieu", "dates", "mots", "cles", "2099", str(debut.year)):
+            self.assertNotIn(terme, lexical.vocabulaire)
+
+    def test_fusion_rrf(self):
+        self.assertEqual(fusion_rrf([3, 1, 2], [1, 4]), [1, 3, 4, 2])
+
+    def test_recherche_hybride(self):
+        vectorstore = construire_vectorstore()
+        embeddings = EmbeddingsComptes()
+        vectorstore.embedding_function = embeddings
+        retriever = RetrieverFiltre(
+            vectorstore=vectorstore,
+            index_meta=IndexMetadonnees.depuis_vectorstore(vectorstore),
+            lexical=IndexLexical.depuis_vectorstore(vectorstore),
+        ).avec_filtres(apres=datetime(2025, 6, 1, tzinfo=timezone.utc))
+
+        # Code postal : invisible pour les embeddings, trouvé par BM25 seul
+        resultats = retriever.rechercher("31400")
+        self.assertEqual([doc.metadata["id"] for doc, _ in resultats], ["uid-1"])
+        # Distance vectorielle réelle : la correspondance exacte ne vaut pas confiance maximale
+        attendu = recherche_vectorielle(vectorstore, MotsEmbeddings().embed_query("31400"), [1], k=1)[0][1]
+        self.assertAlmostEqual(resultats[0][1], attendu, places=5)
+        self.assertGreater(resultats[0][1], 0.5)
+        self.assertNotEqual(confiance.decider(resultats), confiance.LOCALE)
+
+        # Pas de morceau contenant tous les mots : fusion avec la recherche vectorielle
+        ids = [doc.metadata["id"] for doc, _ in retriever.rechercher("jazz opéra")]
+        self.assertEqual(embeddings.appels, 2)
+        self.assertEqual(ids[:2], ["uid-1", "uid-2"])
+        self.assertNotIn("uid-0", ids)  # terminé
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from langchain.schema import Document
+
+import index_faiss
+from chatbot_core import charger_index_faiss
+from index_store import DocstoreMmap, charger_index, convertir, est_format_compact, sauvegarder_index
+from retrieval import IndexMetadonnees
+from test_retrieval import MotsEmbeddings, construire_vectorstore
+
+
+class TestIndexCompact(unittest.TestCase):
+    """
+    Vérifie le format compact de l'index :
+    - aucun pickle n'est écrit ni lu
+    - recherches, documents et métadonnées identiques à l'index d'origine
+    - ajouts et suppressions (mise à jour incrémentale) puis nouvelle sauvegarde
+    - un lecteur de l'ancienne version n'est pas affecté par une réécriture
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.chemin = os.path.join(self.tmp.name, "faiss_index")
+        self.origine = construire_vectorstore()
+        sauvegarder_index(self.origine, self.chemin)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_aller_retour_sans_pickle(self):
+        self.assertTrue(est_format_compact(self.chemin))
+        self.assertFalse(any(f.endswith(".pkl") for f in os.listdir(self.chemin)))
+
+        vectorstore = charger_index(self.chemin, MotsEmbeddings())
+        self.assertIsInstance(vectorstore.docstore, DocstoreMmap)
+        for question in ["jazz", "théâtre", "cirque"]:
+            attendus = self.origine.similarity_search_with_score(question, k=3)
+            obtenus = vectorstore.similarity_search_with_score(question, k=3)
+            self.assertEqual([d.page_content for d, _ in obtenus], [d.page_content for d, _ in attendus])
+            self.assertEqual([d.metadata for d, _ in obtenus], [d.metadata for d, _ in attendus])
+
+    def test_metadonnees_sans_lire_les_documents(self):
+        vectorstore = charger_index(self.chemin, MotsEmbeddings())
+        attendu = IndexMetadonnees.depuis_vectorstore(self.origine)
+        obtenu = IndexMetadonnees.depuis_vectorstore(vectorstore)
+        self.assertEqual(obtenu.fin.tolist(), attendu.fin.tolist())
+        self.assertEqual(obtenu.villes.tolist(), attendu.villes.tolist())
+        self.assertEqual(obtenu.codes_postaux.tolist(), attendu.codes_postaux.tolist())
+
+    def test_mise_a_jour_puis_sauvegarde(self):
+        vectorstore = charger_index(self.chemin, MotsEmbeddings(), mmap_vecteurs=False)
+        ids = list(vectorstore.index_to_docstore_id.values())
+        vectorstore.delete([ids[0]])
+        vectorstore.add_documents([Document(page_content="expo à Albi", metadata={"id": "uid-9"})], ids=["neuf"])
+        self.assertIsNone(vectorstore.docstore.colonnes)
+        sauvegarder_index(vectorstore, self.chemin)
+
+        recharge = charger_index(self.chemin, MotsEmbeddings())
+        self.assertEqual(recharge.index.ntotal, len(ids))
+        self.assertEqual(recharge.similarity_search("expo", k=1)[0].page_content, "expo à Albi")
+        self.assertNotIn(ids[0], recharge.index_to_docstore_id.values())
+
+    def test_lecteur_pendant_une_reecriture(self):
+        lecteur = charger_index(self.chemin, MotsEmbeddings())
+        autre = construire_vectorstore()
+        autre.delete(list(autre.index_to_docstore_id.values())[:2])
+        sauvegarder_index(autre, self.chemin)
+
+        # L'ancien lecteur voit toujours sa version, un nouveau voit la nouvelle
+        self.assertEqual(lecteur.similarity_search("cirque", k=1)[0].page_content, "cirque sans date")
+        self.assertEqual(charger_index(self.chemin, MotsEmbeddings()).index.ntotal, 3)
+
+    def test_version_inconnue(self):
+        chemin_format = Path(self.chemin) / "format.json"
+        chemin_format.write_text(json.dumps({"format": "faiss-jsonl", "version": 99}))
+        with self.assertRaises(ValueError):
+            charger_index(self.chemin, MotsEmbeddings())
+
+    def test_faiss_sans_projection(self):
+        # Une version de faiss qui copierait les vecteurs en mémoire est refusée
+        with patch("index_store.IO_FLAG_MMAP_IFC", None):
+            with self.assertRaises(RuntimeError):
+                charger_index(self.chemin, MotsEmbeddings())
+            self.assertEqual(charger_index(self.chemin, MotsEmbeddings(), mmap_vecteurs=False).index.ntotal, 5)
+
+    def test_index_pickle_refuse(self):
+        ancien = os.path.join(self.tmp.name, "ancien")
+        self.origine.save_local(ancien)
+        index_faiss.sauvegarder_manifest(ancien, {"uid-1": {"hash": "", "chunk_ids": [], "lastdate_end": ""}})
+        with patch("langchain_community.vectorstores.FAISS.load_local") as load_local:
+            for charger in (lambda: charger_index_faiss(ancien, MotsEmbeddings()),
+                            lambda: index_faiss.rafraichir_index([], MotsEmbeddings(), None, ancien)):
+                with self.assertRaisesRegex(RuntimeError, "python index_store.py"):
+                    charger()
+            load_local.assert_not_called()
+
+    def test_conversion_d_un_index_pickle(self):
+        ancien = os.path.join(self.tmp.name, "ancien")
+        self.origine.save_local(ancien)
+        self.assertEqual(convertir(ancien), self.origine.index.ntotal)
+        self.assertFalse(os.path.exists(os.path.join(ancien, "index.pkl")))
+        vectorstore = charger_index(ancien, MotsEmbeddings())
+        self.assertEqual(vectorstore.similarity_search("jazz", k=1)[0].page_content,
+                         self.origine.similarity_search("jazz", k=1)[0].page_content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+from benchmark_index import comparer, requetes_bruitees, vecteurs_synthetiques
+from index_store import charger_index, sauvegarder_index
+from index_types import TYPES_INDEX, creer_index, creer_vectorstore, parametres_index, supporte_suppression
+from retrieval import recherche_vectorielle
+
+
+def vectorstore(x, type_index, metrique):
+    store = creer_vectorstore(None, creer_index(x, type_index, metrique), InMemoryDocstore(), {})
+    store.add_embeddings(
+        [(f"doc {i}", v) for i, v in enumerate(x.tolist())],
+        metadatas=[{"id": f"uid-{i}"} for i in range(len(x))],
+    )
+    return store
+
+
+class TestTypesIndex(unittest.TestCase):
+    """
+    Vérifie les types d'index configurables :
+    - chaque type se construit, se sauvegarde au format compact et se recharge en mmap
+    - la recherche préfiltrée reste limitée aux candidats, quel que soit le type
+    - la métrique `ip` renvoie les mêmes distances L2 équivalentes que `l2`
+    - le banc d'essai mesure le rappel par rapport à la recherche exacte
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.x = vecteurs_synthetiques(2000, 32, themes=20)
+        cls.requete = requetes_bruitees(cls.x, 1)[0]
+
+    def test_types_et_format_compact(self):
+        candidats = np.arange(0, 2000, 3, dtype=np.int64)
+        with tempfile.TemporaryDirectory() as tmp:
+            for type_index in TYPES_INDEX:
+                for metrique in ("l2", "ip"):
+                    with self.subTest(type=type_index, metrique=metrique):
+                        chemin = os.path.join(tmp, f"{type_index}-{metrique}")
+                        sauvegarder_index(vectorstore(self.x, type_index, metrique), chemin)
+                        recharge = charger_index(chemin, None)
+                        resultats = recherche_vectorielle(recharge, self.requete, candidats, k=5)
+                        self.assertEqual(len(resultats), 5)
+                        for doc, distance in resultats:
+                            self.assertEqual(int(doc.metadata["id"].split("-")[1]) % 3, 0)
+                            self.assertGreaterEqual(distance, -1e-3)
+
+    def test_produit_scalaire_en_distance_l2(self):
+        l2 = recherche_vectorielle(vectorstore(self.x, "flat", "l2"), self.requete, k=5)
+        ip = recherche_vectorielle(vectorstore(self.x, "flat", "ip"), self.requete, k=5)
+        self.assertEqual([d.page_content for d, _ in ip], [d.page_content for d, _ in l2])
+        np.testing.assert_allclose([s for _, s in ip], [s for _, s in l2], atol=1e-4)
+
+    def test_suppression(self):
+        self.assertTrue(supporte_suppression(creer_index(self.x, "flat")))
+        self.assertTrue(supporte_suppression(creer_index(self.x, "sq8")))
+        # IVF retire sans renuméroter, HNSW ne retire pas
+        self.assertFalse(supporte_suppression(creer_index(self.x, "ivf")))
+        self.assertFalse(supporte_suppression(creer_index(self.x, "hnsw")))
+
+    def test_parametres_index(self):
+        index = creer_index(self.x, "hnsw", "ip", m=16, ef_construction=100, ef_search=32)
+        self.assertEqual(parametres_index(index), ("hnsw", "ip", {"m": 16, "ef_construction": 100, "ef_search": 32}))
+        self.assertEqual(parametres_index(creer_index(self.x, "ivf", nlist=8, nprobe=2)),
+                         ("ivf", "l2", {"nlist": 8, "nprobe": 2}))
+
+    def test_entrainement_insuffisant(self):
+        with self.assertRaises(ValueError):
+            creer_index(self.x[:100], "ivfpq", nlist=4, m=8, nbits=8)
+
+    def test_banc_d_essai(self):
+        requetes = requetes_bruitees(self.x, 20)
+        resultats = {r["type"]: r for r in comparer(self.x, requetes, ["flat", "hnsw", "sq8"], k=5)}
+        self.assertEqual(resultats["flat"]["rappel@5"], 1.0)
+        self.assertGreater(resultats["hnsw"]["rappel@5"], 0.8)
+        self.assertLess(resultats["sq8"]["taille_mo"], resultats["flat"]["taille_mo"])
+        for r in resultats.values():
+            self.assertLessEqual(r["p50_ms"], r["p99_ms"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from langchain_community.chat_models.fake import FakeListChatModel
+
+from chatbot_core import MoteurChatbot
+from index_store import sauvegarder_index
+from journal import JournalConversations
+from test_retrieval import MotsEmbeddings, construire_vectorstore
+
+
+def lire_journal(journal):
+    evenements = []
+    for chemin in journal.fichiers:
+        with open(chemin, encoding="utf-8") as f:
+            evenements.extend(json.loads(ligne) for ligne in f)
+    return evenements
+
+
+class TestJournalConversations(unittest.TestCase):
+    """
+    Vérifie l'écriture en arrière-plan du journal :
+    - lots écrits dès `taille_lot` événements ou après `intervalle`
+    - nouveau fichier au-delà de `taille_max`, tout est écrit à la fermeture
+    - file pleine : événements comptés comme perdus, sans bloquer
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def journal(self, **options):
+        return JournalConversations(os.path.join(self.tmp.name, "conversations"), **options)
+
+    def test_lot_et_intervalle(self):
+        journal = self.journal(taille_lot=3, intervalle=3600)
+        for i in range(3):
+            journal.enregistrer({"session_id": "s1", "question": f"q{i}"})
+        journal.enregistrer({"session_id": "s1", "question": "q3"})
+        time.sleep(0.2)
+        self.assertEqual(journal.ecrits, 3)
+
+        journal = self.journal(taille_lot=100, intervalle=0.05)
+        journal.enregistrer({"question": "seule"})
+        time.sleep(0.3)
+        self.assertEqual(journal.ecrits, 1)
+        self.assertIn("horodatage", lire_journal(journal)[0])
+
+    def test_rotation_et_fermeture(self):
+        journal = self.journal(taille_lot=10, intervalle=3600, taille_max=500)
+        for i in range(40):
+            journal.enregistrer({"session_id": f"s{i}", "reponse": "x" * 50})
+        journal.fermer()
+        journal.enregistrer({"session_id": "apres"})
+        self.assertEqual(journal.ecrits, 40)
+        self.assertGreater(len(journal.fichiers), 1)
+        self.assertEqual([e["session_id"] for e in lire_journal(journal)], [f"s{i}" for i in range(40)])
+        self.assertTrue(all(str(os.getpid()) in os.path.basename(f) for f in journal.fichiers))
+
+    def test_file_pleine(self):
+        journal = self.journal(taille_file=1)
+        with patch.object(journal, "_demarrer"):
+            journal.enregistrer({"question": "a"})
+            journal.enregistrer({"question": "b"})
+        self.assertEqual(journal.perdus, 1)
+
+
+class TestJournalMoteur(unittest.TestCase):
+    """Chaque réponse est consignée avec la session, la ville, le cache, le recours au web et les durées."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.chemin_index = os.path.join(cls.tmp.name, "faiss_index")
+        sauvegarder_index(construire_vectorstore(), cls.chemin_index)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    @patch("chatbot_core.search_web", return_value="- web")
+    def test_reponses_consignees(self, _):
+        journal = JournalConversations(os.path.join(self.tmp.name, "conversations"))
+        moteur = MoteurChatbot(
+            api_key="fake", chemin_index=self.chemin_index, journal=journal, embeddings=MotsEmbeddings(),
+            llm=FakeListChatModel(responses=["Le cirque passe à Albi."] * 10),
+        )
+        moteur.get_bot_response("cirque ?", {"city": "Albi"}, "s1")
+        "".join(moteur.stream_bot_response("cirque ?", {"city": "Albi"}, "s2"))
+        moteur.enregistrer_retour("s1", True)
+        journal.fermer()
+
+        premiere, deuxieme, retour = lire_journal(journal)
+        self.assertEqual((premiere["session_id"], premiere["ville"], premiere["mode"]), ("s1", "Albi", "sync"))
+        self.assertEqual(premiere["reponse"], "Le cirque passe à Albi.")
+        self.assertFalse(premiere["cache"])
+        self.assertFalse(premiere["web"])
+        self.assertLessEqual({"embedding", "recherche", "generation", "total"}, set(premiere["durees"]))
+        self.assertGreater(premiere["prompt_jetons"], 0)
+        self.assertEqual((deuxieme["mode"], deuxieme["cache"]), ("stream", True))
+        self.assertNotIn("generation", deuxieme["durees"])
+        self.assertEqual((retour["type"], retour["utile"]), ("retour", True))
+
+
+if __name__ == '__main__':
+    unittest.main()
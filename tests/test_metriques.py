@@ -0,0 +1,132 @@
+import json
+import os
+import tempfile
+import unittest
+import urllib.request
+from unittest.mock import patch
+
+from langchain_community.chat_models.fake import FakeListChatModel
+
+import metriques
+from chatbot_core import MoteurChatbot
+from index_store import sauvegarder_index
+from metriques import Distribution, ExportJSON, Metriques, Profileur, ServeurMetriques
+from test_retrieval import MotsEmbeddings, construire_vectorstore
+
+
+class TestMetriques(unittest.TestCase):
+    """
+    Vérifie l'agrégation et les exports des métriques :
+    - quantiles sur la fenêtre glissante, nombre et somme depuis le démarrage
+    - format texte Prometheus et point d'accès HTTP
+    - export JSON périodique, profilage échantillonné
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_quantiles(self):
+        distribution = Distribution(fenetre=100)
+        for valeur in range(1, 201):
+            distribution.observer(valeur)
+        resume = distribution.resume()
+        self.assertEqual((resume["n"], resume["somme"], resume["max"]), (200, 20100, 200))
+        # Fenêtre : 101..200
+        self.assertEqual((resume["p50"], resume["p95"], resume["p99"]), (150, 195, 199))
+        self.assertEqual(Distribution().quantiles()[0.99], 0.0)
+
+    def test_format_prometheus(self):
+        m = Metriques()
+        with m.etape("recherche"):
+            pass
+        with self.assertRaises(ValueError), m.etape("generation"):
+            raise ValueError("LLM indisponible")
+        m.incrementer(metriques.CACHE, resultat="hit")
+        m.incrementer(metriques.CACHE, 2, resultat="miss")
+        texte = m.texte_prometheus()
+        self.assertIn("# TYPE chatbot_cache_total counter", texte)
+        self.assertIn('chatbot_cache_total{resultat="miss"} 2', texte)
+        self.assertIn("# TYPE chatbot_etape_secondes summary", texte)
+        self.assertIn('chatbot_etape_secondes{etape="recherche",quantile="0.99"}', texte)
+        self.assertIn('chatbot_etape_secondes_count{etape="generation"} 1', texte)
+        self.assertEqual(m.distribution(metriques.DUREES, etape="recherche")["n"], 1)
+
+    def test_serveur_et_export_json(self):
+        m = Metriques()
+        m.observer(metriques.PROMPT_JETONS, 812)
+        serveur = ServeurMetriques(m)
+        try:
+            url = f"http://127.0.0.1:{serveur.port}"
+            with urllib.request.urlopen(url + "/metrics") as reponse:
+                self.assertIn("chatbot_prompt_jetons_sum 812", reponse.read().decode("utf-8"))
+            with urllib.request.urlopen(url + "/metrics.json") as reponse:
+                self.assertEqual(json.load(reponse)["distributions"]["chatbot_prompt_jetons"]["p50"], 812)
+        finally:
+            serveur.arreter()
+
+        chemin = os.path.join(self.tmp.name, "logs", "metriques.json")
+        export = ExportJSON(m, chemin, intervalle=3600)
+        m.incrementer(metriques.ERREURS)
+        export.arreter()
+        with open(chemin, encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["compteurs"], {"chatbot_erreurs_total": 1})
+
+    def test_profilage(self):
+        dossier = os.path.join(self.tmp.name, "profils")
+        profileur = Profileur(taux=1, dossier=dossier)
+        with profileur.echantillon("reponse"):
+            sum(range(1000))
+        self.assertEqual(len(profileur.profils), 1)
+        self.assertTrue(profileur.profils[0].endswith("-reponse.prof"))
+        with Profileur(taux=0, dossier=dossier).echantillon("reponse"):
+            pass
+        self.assertEqual(len(os.listdir(dossier)), 1)
+
+
+class TestInstrumentationMoteur(unittest.TestCase):
+    """Chaque étape d'une réponse est mesurée, y compris le cache et la reformulation."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.chemin_index = os.path.join(cls.tmp.name, "faiss_index")
+        sauvegarder_index(construire_vectorstore(), cls.chemin_index)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    @patch("chatbot_core.search_web", return_value="- web")
+    def test_etapes_mesurees(self, _):
+        m = Metriques()
+        moteur = MoteurChatbot(
+            api_key="fake", chemin_index=self.chemin_index, metriques=m, embeddings=MotsEmbeddings(),
+            llm=FakeListChatModel(responses=["Le cirque passe à Albi."] * 10),
+        )
+        moteur.get_bot_response("cirque ?", None, "s1")
+        moteur.get_bot_response("cirque ?", None, "s2")
+        # Avec historique : ni cache ni embedding de la question brute, reformulation par le LLM
+        moteur.get_bot_response("À quelle heure commence-t-il ?", None, "s1")
+        self.assertEqual("".join(moteur.stream_bot_response("et demain ?", None, "s1")), "Le cirque passe à Albi.")
+
+        etapes = {
+            serie[len('chatbot_etape_secondes{etape="'):-2]
+            for serie in m.instantane()["distributions"] if serie.startswith(metriques.DUREES + "{")
+        }
+        self.assertLessEqual(
+            {"preparation", "embedding", "cache", "reformulation", "recherche", "generation", "premier_token",
+             "total"},
+            etapes,
+        )
+        self.assertEqual(m.distribution(metriques.DUREES, etape="total")["n"], 4)
+        self.assertEqual(m.compteur(metriques.CACHE, resultat="hit"), 1)
+        self.assertEqual(m.compteur(metriques.CACHE, resultat="miss"), 1)
+        self.assertEqual(m.compteur(metriques.REPONSES, mode="stream"), 1)
+        self.assertGreater(m.distribution(metriques.PROMPT_JETONS)["p50"], 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,55 @@
-import pytest
-from openagenda.scraper import fetch_and_parse_events
-
-def test_fetch_and_parse_events():
-    events = fetch_and_parse_events()
-    assert isinstance(events, list)
-    if events:
-        event = events[0]
-        assert "title" in event
-        assert "description" in event
-        assert isinstance(event["title"], str)
+import unittest
+
+from harvester import OpenAgendaHarvester
+from Openagenda import EVENT_TYPES, generer_documents, structurer_evenements
+from simulateurs import ServeurOpenAgenda, evenements_openagenda
+
+
+class TestOpenAgenda(unittest.TestCase):
+    """
+    Vérifie la récupération et la mise en forme des événements contre une API
+    OpenAgenda rejouée en local (voir simulateurs.py) :
+    - pages et export JSONL donnent les mêmes événements, sans doublon
+    - titres et descriptions sont des textes nettoyés (HTML retiré)
+    - chaque événement devient un Document avec ses métadonnées
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.evenements = evenements_openagenda(230)
+        cls.serveur = ServeurOpenAgenda(cls.evenements)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.serveur.arreter()
+
+    def recuperer(self, export):
+        harvester = OpenAgendaHarvester(base_url=self.serveur.url, rate=1000.0, export=export)
+        return [record for page in harvester.iterer_evenements(EVENT_TYPES) for record in page]
+
+    def test_fetch_and_parse_events(self):
+        pages, export = self.recuperer(export=False), self.recuperer(export=True)
+        self.assertEqual(len(pages), 230)
+        self.assertEqual([r["uid"] for r in pages], [r["uid"] for r in export])
+
+        df = structurer_evenements(pages)
+        self.assertEqual(len(df), 230)
+        for titre, description in zip(df["title_fr"], df["description_fr"]):
+            self.assertIsInstance(titre, str)
+            self.assertTrue(description)
+            self.assertNotIn("<p>", description)
+        self.assertAlmostEqual(df["latitude"].iloc[0], self.evenements[0]["location_coordinates"]["lat"])
+
+        docs = generer_documents(df)
+        self.assertEqual(docs[0].metadata["id"], "sim-000000")
+        self.assertTrue(docs[0].page_content.startswith("Titre: "))
+
+    def test_filtre_mots_cles(self):
+        harvester = OpenAgendaHarvester(base_url=self.serveur.url, rate=1000.0)
+        jazz = [record for page in harvester.iterer_evenements(["jazz"]) for record in page]
+        self.assertTrue(jazz)
+        self.assertTrue(all("jazz" in record["keywords_fr"] for record in jazz))
+
+
+if __name__ == '__main__':
+    unittest.main()
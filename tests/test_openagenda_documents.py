@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import patch
+
+import pandas as pd
+
+import Openagenda
+from benchmark_openagenda import (
+    evenements_synthetiques, generer_documents_ligne, mesurer, nettoyer_texte_ligne,
+)
+from Openagenda import generer_documents, nettoyer_colonne, nettoyer_texte
+
+
+class TestPretraitementOpenagenda(unittest.TestCase):
+    """
+    Vérifie que le prétraitement vectorisé donne exactement le résultat de la
+    version ligne par ligne :
+    - nettoyage des textes avec et sans HTML, valeurs manquantes ou non textuelles
+    - documents identiques (texte et métadonnées), colonnes absentes comprises
+    - pas de colonne `content` inutilisée, pas de client d'embeddings à l'import
+    """
+
+    TEXTES = [
+        "<p>Concert <strong>JAZZ</strong> au Bikini</p>",
+        "Théâtre : « Le Cid » — 20h30 !",
+        "a &lt; b &eacute;t&eacute; &amp; co",
+        "<p>x</p",
+        "<!-- commentaire -->Visite<script>x = 1</script>",
+        "x < y et z > 2",
+        "   espaces\t\net   retours  ",
+        "", None, float("nan"), 42,
+    ]
+
+    def test_nettoyage(self):
+        attendus = [nettoyer_texte_ligne(t) for t in self.TEXTES]
+        self.assertEqual([nettoyer_texte(t) for t in self.TEXTES], attendus)
+        serie = pd.Series(self.TEXTES, index=range(10, 10 + len(self.TEXTES)), dtype=object)
+        nettoyes = nettoyer_colonne(serie)
+        self.assertEqual(nettoyes.tolist(), attendus)
+        self.assertEqual(list(nettoyes.index), list(serie.index))
+
+    def test_nettoyage_pool(self):
+        textes = self.TEXTES * 3
+        with patch.object(Openagenda, "SEUIL_POOL_HTML", 1):
+            self.assertEqual(nettoyer_colonne(textes, workers=2).tolist(), [nettoyer_texte_ligne(t) for t in textes])
+
+    def test_documents_identiques(self):
+        df = evenements_synthetiques(60)
+        df.loc[3, "location_name"] = None
+        df.loc[4, "lastdate_end"] = pd.NaT
+        df.loc[5, "latitude"] = float("nan")
+        for variante in [df, df.drop(columns=["keywords", "date_fin"]), df.iloc[:0]]:
+            avant = generer_documents_ligne(variante)
+            apres = generer_documents(variante)
+            self.assertEqual(len(apres), len(avant))
+            for a, b in zip(apres, avant):
+                self.assertEqual(a.page_content, b.page_content)
+                self.assertEqual(repr(a.metadata), repr(b.metadata))
+
+        documents = generer_documents(df.drop(columns=["keywords"]).iloc[:2])
+        self.assertIsNot(documents[0].metadata["keywords"], documents[1].metadata["keywords"])
+
+    def test_evenements_structures(self):
+        resultats = evenements_synthetiques(5).rename(columns={"keywords": "keywords_fr"})
+        resultats["firstdate_begin"] = pd.Timestamp.now(tz="UTC").isoformat()
+        resultats["description_fr"] = "<p>Soirée <b>JAZZ</b></p>"
+        with patch.object(Openagenda, "OpenAgendaHarvester") as harvester:
+            harvester.return_value.harvest.return_value = resultats.to_dict("list")
+            harvester.return_value.statistiques.return_value = {
+                "evenements": 5, "doublons": 0, "requetes": 1, "octets": 2048, "pic_memoire": 4096,
+            }
+            df = Openagenda.obtenir_evenements_structures()
+        self.assertNotIn("content", df.columns)
+        self.assertEqual(df["description_fr"].tolist(), ["soirée jazz"] * 5)
+        self.assertEqual(Openagenda.obtenir_embeddings.cache_info().currsize, 0)
+
+    def test_banc_d_essai(self):
+        resultats = mesurer(evenements_synthetiques(50), repetitions=1)
+        self.assertEqual(set(resultats), {"nettoyage", "documents"})
+        for r in resultats.values():
+            self.assertGreater(r["apres_lignes_s"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timezone
+
+from langchain_core.embeddings import Embeddings
+
+from index_store import charger_index
+from index_lexical import charger_index_lexical
+from pipeline import ConstructionEnFlux, Flux
+
+VILLES = ["Toulouse", "Montpellier", "Albi", "Sète"]
+
+
+class FakeEmbeddings(Embeddings):
+    """Embeddings déterministes ; `panne` fait échouer les textes qui la contiennent."""
+
+    def __init__(self, panne=None):
+        self.panne = panne
+        self.textes = 0
+        self._lock = threading.Lock()
+
+    def _vecteur(self, texte):
+        return [float(len(texte) % 13), float(sum(map(ord, texte)) % 97), 1.0, float(texte.count("e"))]
+
+    def embed_documents(self, texts):
+        if self.panne and any(self.panne in t for t in texts):
+            raise RuntimeError("API d'embeddings indisponible")
+        with self._lock:
+            self.textes += len(texts)
+        return [self._vecteur(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vecteur(text)
+
+
+def pages_evenements(nb_pages=6, par_page=5):
+    debut = datetime.now(timezone.utc).isoformat()
+    for p in range(nb_pages):
+        yield [
+            {
+                "uid": f"evt-{p}-{i}",
+                "title_fr": f"<b>Concert</b> numéro {p}-{i}",
+                "description_fr": f"Soirée {p}-{i} à {VILLES[i % 4]}. Entrée libre. Buvette sur place !",
+                "location_name": "Salle des fêtes",
+                "location_city": VILLES[i % 4],
+                "location_postalcode": "31000",
+                "firstdate_begin": debut,
+                "lastdate_end": "2099-01-01T00:00:00+00:00",
+                "keywords_fr": ["concert"],
+            }
+            for i in range(par_page)
+        ]
+
+
+class TestFlux(unittest.TestCase):
+
+    def test_ordre_et_files_bornees(self):
+        def lent(elements):
+            for x in elements:
+                time.sleep(0.002)
+                yield x * 2
+
+        flux = Flux(range(200), lent, lambda elements: (x + 1 for x in elements), taille_file=3)
+        self.assertEqual(list(flux), [2 * x + 1 for x in range(200)])
+        self.assertTrue(all(pic <= 3 for pic in flux.pics_files))
+
+    def test_erreur_remontee(self):
+        def defaillante(elements):
+            for x in elements:
+                if x == 50:
+                    raise ValueError("page illisible")
+                yield x
+
+        recus = []
+        with self.assertRaises(ValueError):
+            for x in Flux(range(10 ** 6), defaillante, taille_file=2):
+                recus.append(x)
+        self.assertEqual(recus, list(range(50)))
+
+
+class TestConstructionEnFlux(unittest.TestCase):
+    """
+    Vérifie la construction en flux :
+    - tous les événements sont indexés, l'index publié se charge (format compact + BM25)
+    - des sauvegardes partielles ont lieu pendant la construction
+    - après une panne, la reprise ne refait que les événements manquants
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.chemin = os.path.join(self.tmp.name, "faiss_index")
+        self.now = datetime.now(timezone.utc)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def construire(self, embeddings, pages, **options):
+        construction = ConstructionEnFlux(
+            embeddings, self.chemin, phrases_par_lot=6, sauvegarde_tous=2, taille_file=2, **options
+        )
+        return construction, construction.construire(pages, self.now)
+
+    def test_construction_complete(self):
+        construction, (vectorstore, rapport) = self.construire(FakeEmbeddings(), pages_evenements())
+        self.assertEqual(rapport["ajoutes"], 30)
+        self.assertGreater(rapport["sauvegardes_partielles"], 0)
+        self.assertFalse(os.path.exists(construction.chemin_travail))
+        self.assertTrue(all(pic <= 2 for pic in construction.pics_files))
+
+        recharge = charger_index(self.chemin, FakeEmbeddings())
+        self.assertEqual(recharge.index.ntotal, vectorstore.index.ntotal)
+        uids = {recharge.docstore.search(i).metadata["id"] for i in recharge.index_to_docstore_id.values()}
+        self.assertEqual(len(uids), 30)
+        self.assertIsNotNone(charger_index_lexical(self.chemin, recharge.index.ntotal))
+        with open(os.path.join(self.chemin, "manifest.json"), encoding="utf-8") as f:
+            self.assertEqual(len(json.load(f)["events"]), 30)
+
+    def test_reprise_apres_panne(self):
+        with self.assertRaises(RuntimeError):
+            self.construire(FakeEmbeddings(panne="numéro 4 2"), pages_evenements())
+        self.assertTrue(os.path.exists(self.chemin + ".partiel"))
+
+        embeddings = FakeEmbeddings()
+        construction, (vectorstore, rapport) = self.construire(embeddings, pages_evenements())
+        self.assertGreater(rapport["repris"], 0)
+        self.assertEqual(rapport["repris"] + rapport["ajoutes"], 30)
+
+        reference = FakeEmbeddings()
+        ConstructionEnFlux(reference, os.path.join(self.tmp.name, "reference"), phrases_par_lot=6).construire(
+            pages_evenements(), self.now
+        )
+        self.assertLess(embeddings.textes, reference.textes)
+        ids = list(vectorstore.index_to_docstore_id.values())
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(len(ids), charger_index(os.path.join(self.tmp.name, "reference"), None).index.ntotal)
+
+    def test_publication_atomique(self):
+        # Index publié à l'ancienne (dossier réel), puis deux reconstructions
+        _, (ancien, _) = self.construire(FakeEmbeddings(), pages_evenements(nb_pages=2))
+        os.rename(os.path.realpath(self.chemin), self.chemin + ".reel")
+        os.unlink(self.chemin)
+        os.rename(self.chemin + ".reel", self.chemin)
+        self.construire(FakeEmbeddings(), pages_evenements(nb_pages=4))
+        self.assertTrue(os.path.islink(self.chemin))
+        construction, (vectorstore, _) = self.construire(FakeEmbeddings(), pages_evenements())
+
+        # Index FAISS, index lexical et manifest de la même version
+        self.assertEqual(vectorstore.index.ntotal, charger_index(self.chemin, None).index.ntotal)
+        self.assertIsNotNone(charger_index_lexical(self.chemin, vectorstore.index.ntotal))
+        with open(os.path.join(self.chemin, "manifest.json"), encoding="utf-8") as f:
+            self.assertEqual(len(json.load(f)["events"]), 30)
+        # Seules la version publiée et la précédente restent ; un lecteur de l'ancienne la lit encore
+        versions = os.path.join(self.tmp.name, f".{os.path.basename(self.chemin)}.versions")
+        self.assertEqual(sorted(os.listdir(versions)), ["2", "3"])
+        self.assertFalse(os.path.exists(construction.chemin_travail))
+        self.assertEqual(len(ancien.similarity_search("concert à Albi", k=3)), 3)
+
+    def test_index_entraine(self):
+        _, (vectorstore, rapport) = self.construire(FakeEmbeddings(), pages_evenements(), type_index="ivf",
+                                                    vecteurs_entrainement=40)
+        self.assertEqual(rapport["ajoutes"], 30)
+        self.assertTrue(vectorstore.index.is_trained)
+        self.assertEqual(len(vectorstore.similarity_search("concert à Albi", k=3)), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from langchain_community.chat_models.fake import FakeListChatModel
+
+import reformulation
+from chatbot_core import MoteurChatbot
+from index_store import sauvegarder_index
+from reformulation import AUTONOME, LLM, MODELE, analyser
+from test_retrieval import MotsEmbeddings, construire_vectorstore
+
+SUJET = "Quels concerts à Toulouse ce week-end ?"
+
+
+class TestAnalyse(unittest.TestCase):
+    """
+    Vérifie la décision locale de reformulation :
+    - questions autonomes laissées telles quelles (tournures impersonnelles comprises)
+    - relances elliptiques complétées par le lieu, la date ou le sujet précédents
+    - pronoms et questions sur la réponse précédente confiés au LLM
+    """
+
+    def test_autonomes(self):
+        for question in [
+            "Quelles expositions à Montpellier ?",
+            "Y a-t-il des spectacles à Albi en juillet ?",
+            "Est-ce qu'il y a des festivals cet été ?",
+            "Quels concerts demain ?",
+            # Interrogatif avec son propre lieu ou sa propre date
+            "Que faire à Montpellier cette semaine ?",
+            "Qu'est-ce qui est prévu demain ?",
+        ]:
+            self.assertEqual(analyser(question, SUJET), (AUTONOME, question), question)
+        self.assertEqual(analyser("Et à Sète ?", ""), (AUTONOME, "Et à Sète ?"))
+
+    def test_relances(self):
+        attendus = {
+            "Et à Sète ?": "Quels concerts à Sète ce week-end ?",
+            "et demain ?": "Quels concerts à Toulouse demain ?",
+            "Et des expositions ?": "des expositions à Toulouse ce week-end ?",
+            "pour les enfants ?": "Quels concerts pour les enfants à Toulouse ce week-end ?",
+            "Et que faire demain ?": "Quels concerts à Toulouse demain ?",
+            "Et pour ce soir ?": "Quels concerts à Toulouse ce soir ?",
+            "pour ce soir ?": "Quels concerts à Toulouse ce soir ?",
+            "et aussi à Saint-Gaudens le 14 juillet ?": "Quels concerts à Saint-Gaudens le 14 juillet ?",
+        }
+        for question, autonome in attendus.items():
+            self.assertEqual(analyser(question, SUJET), (MODELE, autonome), question)
+
+    def test_llm(self):
+        for question in [
+            "À quelle heure commence-t-il ?",
+            "Et le prix ?",
+            "Et ce concert, c'est où ?",
+            "Il y en a d'autres ?",
+            "Et sinon ?",
+        ]:
+            self.assertEqual(analyser(question, SUJET), (LLM, None), question)
+
+
+class TestReformulationMoteur(unittest.TestCase):
+    """Une relance elliptique part en recherche sans appel au LLM de reformulation."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.chemin_index = os.path.join(cls.tmp.name, "faiss_index")
+        sauvegarder_index(construire_vectorstore(), cls.chemin_index)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def moteur(self):
+        return MoteurChatbot(
+            api_key="fake", chemin_index=self.chemin_index, embeddings=MotsEmbeddings(),
+            llm=FakeListChatModel(responses=["Le cirque passe à Albi."] * 10),
+        )
+
+    @patch("chatbot_core.search_web", return_value="- web")
+    def test_relance_sans_llm(self, _):
+        moteur = self.moteur()
+        with patch.object(MoteurChatbot, "reformuler_question", return_value="cirque à Albi ?") as llm, \
+                patch.object(MoteurChatbot, "preparer_contexte", wraps=moteur.preparer_contexte) as contexte:
+            moteur.get_bot_response("Quel cirque à Albi cette semaine ?", None, "s1")
+            moteur.get_bot_response("Et à Montpellier ?", None, "s1")
+            llm.assert_not_called()
+            self.assertEqual(contexte.call_args.args[1], "Quel cirque à Montpellier cette semaine ?")
+            self.assertEqual(contexte.call_args.args[2]["villes"], ["montpellier"])
+
+            moteur.get_bot_response("À quelle heure commence-t-il ?", None, "s1")
+            llm.assert_called_once()
+            self.assertEqual(contexte.call_args.args[1], "cirque à Albi ?")
+        self.assertEqual(moteur.sessions.session("s1").sujet, "cirque à Albi ?")
+        self.assertEqual(moteur.metriques.compteur("chatbot_reformulation_total", mode=MODELE), 1)
+
+    @patch("chatbot_core.search_web", return_value="- web")
+    def test_reformulation_retenue(self, _):
+        moteur = self.moteur()
+        session = moteur.sessions.session("s1")
+        session.sujet = "Quel cirque à Albi ?"
+        moteur.retenir_question(session, "Et ensuite ?", "Human: cirque ?", LLM, "Cirque à Albi en août ?")
+        mode, requete, _, _ = moteur.question_autonome(session, "Et ensuite ?", None, "Human: cirque ?", "", {})
+        self.assertEqual((mode, requete), (LLM, "Cirque à Albi en août ?"))
+        self.assertEqual(reformulation.analyser("Et ensuite ?", session.sujet), (LLM, None))
+
+        "".join(moteur.stream_bot_response("Quel cirque à Albi ?", None, "s2"))
+        with patch.object(type(moteur.qa_chain.question_generator), "ainvoke") as llm:
+            self.assertEqual("".join(moteur.stream_bot_response("Et demain ?", None, "s2")), "Le cirque passe à Albi.")
+        llm.assert_not_called()
+        self.assertEqual(moteur.sessions.session("s2").sujet, "Quel cirque à Albi demain ?")
+
+
+if __name__ == '__main__':
+    unittest.main()
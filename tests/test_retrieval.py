@@ -0,0 +1,105 @@
+import unittest
+from datetime import datetime, timezone
+
+from langchain.chains import ConversationalRetrievalChain
+from langchain.schema import Document
+from langchain_community.llms.fake import FakeListLLM
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+from retrieval import IndexMetadonnees, RetrieverFiltre, filtres_requete
+
+
+class MotsEmbeddings(Embeddings):
+    """Embeddings déterministes : un axe par mot du vocabulaire."""
+
+    VOCABULAIRE = ["jazz", "théâtre", "cirque", "expo"]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text):
+        return [float(text.lower().count(mot)) + 0.01 for mot in self.VOCABULAIRE]
+
+
+EVENEMENTS = [
+    ("jazz à Toulouse", "Toulouse", "31000", "2025-05-01", "2025-05-02"),     # terminé
+    ("jazz au Bikini", "Toulouse", "31400", "2025-07-01", "2025-07-02"),
+    ("jazz à Montpellier", "Montpellier", "34000", "2025-07-10", "2025-07-11"),
+    ("théâtre à Saint-Gaudens", "Saint-Gaudens", "31800", "2025-08-01", "2025-08-03"),
+    ("cirque sans date", "Albi", "81000", None, None),
+]
+
+
+def construire_vectorstore():
+    docs = [
+        Document(page_content=texte, metadata={
+            "id": f"uid-{i}", "location_city": ville, "location_postalcode": cp,
+            "firstdate_begin": debut, "lastdate_end": fin,
+        })
+        for i, (texte, ville, cp, debut, fin) in enumerate(EVENEMENTS)
+    ]
+    return FAISS.from_documents(docs, MotsEmbeddings())
+
+
+class TestRetrievalFiltre(unittest.TestCase):
+    """
+    Vérifie le préfiltrage par métadonnées :
+    - les événements terminés ne sont jamais renvoyés
+    - la ville citée dans la question restreint les candidats
+    - une date inconnue n'exclut pas l'événement
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.vectorstore = construire_vectorstore()
+        cls.index_meta = IndexMetadonnees.depuis_vectorstore(cls.vectorstore)
+        cls.retriever = RetrieverFiltre(vectorstore=cls.vectorstore, index_meta=cls.index_meta)
+        cls.maintenant = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+    def ids(self, question, **filtres):
+        retriever = self.retriever.avec_filtres(**filtres)
+        return [doc.metadata["id"] for doc in retriever.invoke(question)]
+
+    def test_evenements_termines_exclus(self):
+        ids = self.ids("jazz", apres=self.maintenant)
+        self.assertNotIn("uid-0", ids)
+        self.assertEqual(ids[:2], ["uid-1", "uid-2"])
+        self.assertIn("uid-4", ids)
+
+    def test_fenetre_de_dates(self):
+        ids = self.ids("jazz", apres=self.maintenant, avant=datetime(2025, 7, 5, tzinfo=timezone.utc))
+        self.assertEqual(sorted(ids), ["uid-1", "uid-4"])
+
+    def test_ville_citee_dans_la_question(self):
+        question = "Des concerts de jazz à Montpellier ?"
+        filtres = self.index_meta.filtres_question(question, self.maintenant)
+        self.assertEqual(filtres["villes"], ["montpellier"])
+        self.assertEqual(self.ids(question, **filtres), ["uid-2"])
+
+        filtres = self.index_meta.filtres_question("Du théâtre à saint gaudens", self.maintenant)
+        self.assertEqual(filtres["villes"], ["saint gaudens"])
+
+    def test_code_postal(self):
+        filtres = self.index_meta.filtres_question("jazz dans le 31400", self.maintenant)
+        self.assertEqual(self.ids("jazz", **filtres), ["uid-1"])
+
+    def test_aucun_candidat(self):
+        self.assertEqual(self.ids("jazz", villes=["Albi"], apres=datetime(2030, 1, 1, tzinfo=timezone.utc)),
+                         ["uid-4"])
+        self.assertEqual(self.ids("jazz", villes=["Albi"], codes_postaux=["31000"]), [])
+
+    def test_filtres_par_requete_dans_la_chaine(self):
+        chain = ConversationalRetrievalChain.from_llm(
+            llm=FakeListLLM(responses=["ok"] * 2), retriever=self.retriever, return_source_documents=True
+        )
+        with filtres_requete(villes=["Montpellier"]):
+            response = chain.invoke({"question": "jazz", "chat_history": []})
+        self.assertEqual([d.metadata["id"] for d in response["source_documents"]], ["uid-2"])
+
+        response = chain.invoke({"question": "jazz", "chat_history": []})
+        self.assertEqual(len(response["source_documents"]), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from sessions import SessionStore
+
+
+def echanger(store, session_id, question, reponse):
+    store.session(session_id).memoire.save_context({"question": question}, {"answer": reponse})
+
+
+def historique(store, session_id):
+    messages = store.session(session_id).memoire.load_memory_variables({})["chat_history"]
+    return [m.content for m in messages]
+
+
+class TestSessionStore(unittest.TestCase):
+    """
+    Vérifie la mémoire par session :
+    - deux sessions ne voient pas l'historique l'une de l'autre
+    - la fenêtre garde les k derniers échanges
+    - éviction par TTL et par nombre maximal de sessions
+    """
+
+    def test_isolation_des_sessions(self):
+        store = SessionStore()
+        echanger(store, "alice", "Je m'appelle Alice", "Bonjour Alice")
+        echanger(store, "bob", "Je suis à Albi", "Noté")
+        self.assertEqual(historique(store, "alice"), ["Je m'appelle Alice", "Bonjour Alice"])
+        self.assertEqual(historique(store, "bob"), ["Je suis à Albi", "Noté"])
+
+    def test_fenetre(self):
+        store = SessionStore(k=2)
+        for i in range(4):
+            echanger(store, "s", f"q{i}", f"r{i}")
+        self.assertEqual(historique(store, "s"), ["q2", "r2", "q3", "r3"])
+
+    def test_ttl(self):
+        store = SessionStore(ttl=60)
+        with patch("sessions.time.monotonic", return_value=1000):
+            echanger(store, "s", "q", "r")
+        with patch("sessions.time.monotonic", return_value=1030):
+            self.assertEqual(historique(store, "s"), ["q", "r"])
+        with patch("sessions.time.monotonic", return_value=1100):
+            store.session("autre")
+            self.assertNotIn("s", store)
+            self.assertEqual(historique(store, "s"), [])
+
+    def test_nombre_maximal_de_sessions(self):
+        store = SessionStore(max_sessions=2)
+        store.session("a")
+        store.session("b")
+        store.session("a")
+        store.session("c")  # évince "b", la moins récemment utilisée
+        self.assertEqual(len(store), 2)
+        self.assertIn("a", store)
+        self.assertNotIn("b", store)
+
+    def test_sessions_concurrentes(self):
+        store = SessionStore(k=50)
+
+        def converser(session_id):
+            for i in range(20):
+                session = store.session(session_id)
+                with session.verrou:
+                    session.memoire.save_context({"question": f"{session_id}-{i}"}, {"answer": "ok"})
+
+        threads = [threading.Thread(target=converser, args=(f"s{n}",)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        for n in range(8):
+            questions = historique(store, f"s{n}")[::2]
+            self.assertEqual(questions, [f"s{n}-{i}" for i in range(20)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import asyncio
+import io
+import json
+import time
+import unittest
+from argparse import Namespace
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+import numpy as np
+
+import chatbot_core
+from benchmark_charge import charger_corpus, comparer, mesurer
+from simulateurs import DDGSSimule, EmbeddingsSimulees, LLMSimule
+
+PROMPT = "Contexte :\n- Jazz au Bikini | Toulouse\nQuestion de l'utilisateur :\nDu jazz ?"
+
+
+class TestSimulateurs(unittest.TestCase):
+    """
+    Vérifie les services simulés :
+    - le LLM respecte la latence et le débit de jetons, en appel direct comme en streaming
+    - les embeddings sont déterministes et proches pour un vocabulaire commun
+    - la recherche web simulée passe par `search_web` sans réseau
+    """
+
+    def test_llm(self):
+        llm = LLMSimule(latence=0.05, jetons_par_seconde=200, jetons_reponse=20)
+        debut = time.perf_counter()
+        reponse = llm.invoke(PROMPT).content
+        self.assertGreaterEqual(time.perf_counter() - debut, 0.05 + 20 / 200)
+        self.assertTrue(reponse.startswith("Voici ce que je vous propose"))
+        self.assertIn("Bikini", reponse)
+        self.assertEqual(len(reponse.split()), 20)
+        self.assertEqual(llm.invoke("Follow Up Input: Et demain ?\nStandalone question:").content, "Et demain ?")
+
+        async def jetons():
+            return [chunk.content async for chunk in llm.astream(PROMPT)]
+
+        self.assertEqual("".join(asyncio.run(jetons())).strip(), reponse)
+
+    def test_embeddings(self):
+        embeddings = EmbeddingsSimulees()
+        a, b, c = np.asarray(embeddings.embed_documents(
+            ["Concert de jazz à Toulouse", "jazz à Toulouse : concert de", "Atelier de poterie pour enfants"]
+        ))
+        self.assertAlmostEqual(float(np.linalg.norm(a)), 1.0, places=5)
+        self.assertAlmostEqual(float(a @ b), 1.0, places=5)
+        self.assertAlmostEqual(float(a @ c), embeddings.anisotropie, delta=0.2)
+        self.assertEqual(embeddings.embed_query("Concert de jazz à Toulouse"), a.tolist())
+        self.assertEqual((embeddings.appels, embeddings.textes), (2, 4))
+
+    def test_recherche_web(self):
+        ddgs = DDGSSimule.regle(0.0)
+        chatbot_core.search_web.cache_clear()
+        with patch.object(chatbot_core, "DDGS", ddgs):
+            resultat = chatbot_core.search_web("jazz à Albi")
+            chatbot_core.search_web("jazz à Albi")
+        chatbot_core.search_web.cache_clear()
+        self.assertEqual(resultat.count("https://agenda.example.org/jazz-à-albi/"), 3)
+        self.assertEqual(ddgs.requetes, 1)
+
+
+class TestBancDeCharge(unittest.TestCase):
+    """Construction de l'index et sessions simultanées de bout en bout, sans réseau ; rapport JSON comparable."""
+
+    def test_rapport(self):
+        args = Namespace(
+            sessions=4, corpus=None, mode="sync", pause=0.0, evenements=60, enregistrement=None, pages=True,
+            type="flat", latence_llm=0.0, jetons_par_seconde=0.0, jetons_reponse=20, latence_embeddings=0.0,
+            latence_web=0.0, latence_openagenda=0.0, json=None, comparer=None,
+        )
+        with redirect_stdout(io.StringIO()):
+            rapport = mesurer(args)
+        rapport = json.loads(json.dumps(rapport))
+
+        construction, charge = rapport["construction"], rapport["charge"]
+        self.assertEqual(construction["evenements"], 60)
+        self.assertGreaterEqual(construction["morceaux"], 60)
+        self.assertIn("embedding", construction["etapes"])
+        self.assertEqual((charge["questions"], charge["erreurs"]), (8, 0))
+        self.assertEqual(charge["etapes"]["total"]["n"], 8)
+        self.assertLessEqual(charge["etapes"]["total"]["p50"], charge["etapes"]["total"]["p99"])
+        self.assertEqual(sum(charge["decisions"].values()), 8)
+        self.assertEqual(charge["caches"]["reponses"]["hits"] + charge["caches"]["reponses"]["misses"], 4)
+        self.assertGreater(rapport["rss_pic_mo"], 0)
+
+        sortie = io.StringIO()
+        with redirect_stdout(sortie):
+            comparer(rapport, rapport)
+        self.assertIn("charge total p95 ms", sortie.getvalue())
+
+    def test_corpus_depuis_le_journal(self):
+        import tempfile
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False, encoding="utf-8") as f:
+            for evenement in [
+                {"type": "reponse", "session_id": "a", "ville": "Albi", "question": "Du cirque ?"},
+                {"type": "retour", "session_id": "a", "utile": True},
+                {"type": "reponse", "session_id": "b", "ville": None, "question": "Du jazz ?"},
+                {"type": "reponse", "session_id": "a", "ville": "Albi", "question": "Et demain ?"},
+            ]:
+                f.write(json.dumps(evenement) + "\n")
+        self.assertEqual(charger_corpus([f.name]), [("Albi", ["Du cirque ?", "Et demain ?"]), (None, ["Du jazz ?"])])
+
+
+if __name__ == '__main__':
+    unittest.main()
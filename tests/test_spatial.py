@@ -0,0 +1,92 @@
+import unittest
+from datetime import datetime, timezone
+
+import numpy as np
+from langchain.schema import Document
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+from retrieval import IndexMetadonnees, RetrieverFiltre, filtres_requete
+from spatial import IndexSpatial, haversine_km, rayon_demande
+
+TOULOUSE = {"city": "Toulouse", "latitude": 43.6045, "longitude": 1.444}
+
+# (texte, lat, lon)
+EVENEMENTS = [
+    ("concert jazz capitole", 43.6045, 1.4440),     # Toulouse centre
+    ("concert jazz blagnac", 43.6370, 1.3900),      # ~5 km
+    ("concert jazz albi", 43.9289, 2.1464),         # ~65 km
+    ("concert jazz montpellier", 43.6108, 3.8767),  # ~195 km
+    ("concert jazz sans coordonnées", None, None),
+]
+
+
+class JazzEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text):
+        # Tous les concerts se ressemblent ; Montpellier est le plus proche de « jazz »
+        v = np.array([1.0, 0.2 if "montpellier" in text else 0.3, 0.0])
+        return (v / np.linalg.norm(v)).tolist()
+
+
+class TestIndexSpatial(unittest.TestCase):
+    """Vérifie la recherche par rayon sur la grille et la détection des questions « près de moi »."""
+
+    def setUp(self):
+        self.index = IndexSpatial([e[1] for e in EVENEMENTS], [e[2] for e in EVENEMENTS])
+
+    def test_dans_rayon(self):
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.index.dans_rayon(43.6045, 1.444, 10).tolist(), [0, 1])
+        self.assertEqual(self.index.dans_rayon(43.6045, 1.444, 100).tolist(), [0, 1, 2])
+        self.assertEqual(self.index.dans_rayon(45.0, 5.0, 50).tolist(), [])
+
+    def test_equivalent_au_parcours_complet(self):
+        rng = np.random.default_rng(0)
+        lat, lon = rng.uniform(42.5, 44.5, 2000), rng.uniform(0, 4, 2000)
+        index = IndexSpatial(lat, lon)
+        for rayon in (3, 15, 40):
+            attendu = np.flatnonzero(haversine_km(43.6, 1.44, lat, lon) <= rayon)
+            self.assertEqual(index.dans_rayon(43.6, 1.44, rayon).tolist(), attendu.tolist())
+
+    def test_rayon_demande(self):
+        self.assertEqual(rayon_demande("Des concerts près de moi ?"), 20.0)
+        self.assertEqual(rayon_demande("du théâtre à moins de 5 km"), 5.0)
+        self.assertIsNone(rayon_demande("des concerts à Toulouse"))
+
+
+class TestRetrieverPresDeMoi(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        docs = [
+            Document(page_content=texte, metadata={"id": f"uid-{i}", "latitude": lat, "longitude": lon})
+            for i, (texte, lat, lon) in enumerate(EVENEMENTS)
+        ]
+        vectorstore = FAISS.from_documents(docs, JazzEmbeddings())
+        cls.index_meta = IndexMetadonnees.depuis_vectorstore(vectorstore)
+        cls.retriever = RetrieverFiltre(vectorstore=vectorstore, index_meta=cls.index_meta)
+
+    def test_pres_de_moi(self):
+        question = "Des concerts de jazz près de moi ?"
+        filtres = self.index_meta.filtres_question(question, datetime(2025, 6, 1, tzinfo=timezone.utc), TOULOUSE)
+        self.assertEqual(filtres["centre"], (43.6045, 1.444))
+
+        with filtres_requete(**filtres):
+            ids = [doc.metadata["id"] for doc in self.retriever.invoke(question)]
+        self.assertEqual(ids, ["uid-0", "uid-1"])
+
+    def test_rayon_large_classe_par_distance(self):
+        with filtres_requete(centre=(43.6045, 1.444), rayon_km=300):
+            ids = [doc.metadata["id"] for doc in self.retriever.invoke("jazz")]
+        self.assertEqual(ids, ["uid-0", "uid-1", "uid-2", "uid-3"])
+
+    def test_sans_position(self):
+        filtres = self.index_meta.filtres_question("jazz près de moi", datetime(2025, 6, 1, tzinfo=timezone.utc))
+        self.assertNotIn("centre", filtres)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from datetime import date, datetime, timezone
+
+from retrieval import IndexMetadonnees
+from temporel import enrichir_question, fenetres_du_jour, periode
+from test_retrieval import construire_vectorstore
+
+# Mercredi
+AUJOURDHUI = date(2025, 7, 2)
+
+
+def jours(question, aujourdhui=AUJOURDHUI):
+    cible = periode(question, aujourdhui)
+    if cible is None:
+        return None
+    return cible.debut.date().isoformat(), cible.fin.date().isoformat() if cible.fin else None
+
+
+class TestPeriode(unittest.TestCase):
+    """
+    Vérifie l'analyse des expressions temporelles :
+    - expressions relatives au jour (soir, week-end, semaine, mois, saisons)
+    - dates et intervalles explicites, année déduite
+    - pas de période sans expression temporelle
+    """
+
+    def test_relatives(self):
+        attendus = {
+            "Que faire ce soir ?": ("2025-07-02", "2025-07-02"),
+            "et demain ?": ("2025-07-03", "2025-07-03"),
+            "Quels concerts ce week-end à Toulouse ?": ("2025-07-05", "2025-07-06"),
+            "le weekend prochain": ("2025-07-05", "2025-07-06"),
+            "Des expos la semaine prochaine ?": ("2025-07-07", "2025-07-13"),
+            "ce mois-ci": ("2025-07-02", "2025-07-31"),
+            "Quels festivals en août ?": ("2025-08-01", "2025-08-31"),
+            "en mars": ("2026-03-01", "2026-03-31"),
+            "cet été": ("2025-07-02", "2025-09-22"),
+            "samedi": ("2025-07-05", "2025-07-05"),
+            "mercredi prochain": ("2025-07-09", "2025-07-09"),
+            "les 10 prochains jours": ("2025-07-02", "2025-07-12"),
+        }
+        for question, attendu in attendus.items():
+            self.assertEqual(jours(question), attendu, question)
+        soir = periode("ce soir", AUJOURDHUI)
+        self.assertEqual((soir.debut.hour, soir.fin.hour), (18, 23))
+        nuit = periode("cette nuit", AUJOURDHUI)
+        self.assertEqual((nuit.debut.hour, nuit.fin.date(), nuit.fin.hour), (20, date(2025, 7, 3), 6))
+
+    def test_explicites(self):
+        attendus = {
+            "entre le 15 juillet et le 20 juillet": ("2025-07-15", "2025-07-20"),
+            "entre le 15 et le 20 juillet": ("2025-07-15", "2025-07-20"),
+            "du 28 décembre au 3 janvier": ("2025-12-28", "2026-01-03"),
+            "du 30 au 2 novembre": ("2025-10-30", "2025-11-02"),
+            "du 30 au 2 janvier": ("2025-12-30", "2026-01-02"),
+            "du 20 décembre 2025 au 3 janvier 2026": ("2025-12-20", "2026-01-03"),
+            "du 15/07 au 20/07/2025": ("2025-07-15", "2025-07-20"),
+            "le 14 juillet": ("2025-07-14", "2025-07-14"),
+            "le 1er juillet": ("2026-07-01", "2026-07-01"),
+            "Le samedi 12 juillet 2025": ("2025-07-12", "2025-07-12"),
+            "jusqu'au 10 juillet": ("2025-07-02", "2025-07-10"),
+            "à partir du 1er septembre": ("2025-09-01", None),
+            "en décembre 2026": ("2026-12-01", "2026-12-31"),
+        }
+        for question, attendu in attendus.items():
+            self.assertEqual(jours(question), attendu, question)
+
+    def test_sans_periode(self):
+        for question in ("Quels concerts à Toulouse ?", "Qu'est-ce qui a été programmé ?", "jazz dans le 31400"):
+            self.assertIsNone(periode(question, AUJOURDHUI), question)
+
+    def test_fenetres_du_jour(self):
+        self.assertIs(fenetres_du_jour(AUJOURDHUI), fenetres_du_jour(AUJOURDHUI))
+        self.assertEqual(jours("ce week-end", date(2025, 7, 6)), ("2025-07-06", "2025-07-06"))
+        self.assertEqual(jours("le week-end prochain", date(2025, 7, 6)), ("2025-07-12", "2025-07-13"))
+
+    def test_enrichir_question(self):
+        self.assertEqual(
+            enrichir_question("Concerts ce week-end ?", AUJOURDHUI),
+            "Concerts ce week-end ? (période ciblée : du 2025-07-05 au 2025-07-06)",
+        )
+        self.assertEqual(enrichir_question("Concerts à Albi ?", AUJOURDHUI), "Concerts à Albi ?")
+
+    def test_filtres_de_recherche(self):
+        index_meta = IndexMetadonnees.depuis_vectorstore(construire_vectorstore())
+        maintenant = datetime(2025, 6, 1, 10, tzinfo=timezone.utc)
+        filtres = index_meta.filtres_question("du jazz entre le 1er et le 3 juillet ?", maintenant)
+        self.assertEqual((filtres["apres"].date(), filtres["avant"].date()), (date(2025, 7, 1), date(2025, 7, 3)))
+        # uid-1 (1-2 juillet) et l'événement sans date
+        self.assertEqual(index_meta.selectionner(**filtres).tolist(), [1, 4])
+        self.assertEqual(index_meta.filtres_question("du jazz ?", maintenant), {"apres": maintenant})
+
+
+if __name__ == '__main__':
+    unittest.main()